@@ -21,6 +21,7 @@
 import datetime
 
 from django.db import models
+from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
@@ -101,4 +102,55 @@ class UserProfile(BaseProfile):
         else:
             return '??'
 
-User.profile = property(lambda u: UserProfile.objects.get_or_create(user=u)[0])
+
+def get_user_profile(user):
+
+    """
+    Returns the profile of the user. The profile is kept in the user instance,
+    in the same attribute used by User.get_profile(), so it's read at most
+    once per request. Profiles are created along with the users, they are
+    only created here for users older than that.
+    """
+    try:
+        return user._profile_cache
+    except AttributeError:
+        pass
+    try:
+        profile = UserProfile.objects.get(user=user.pk)
+    except UserProfile.DoesNotExist:
+        profile = UserProfile.objects.get_or_create(user=user)[0]
+    profile.user = user
+    user._profile_cache = profile
+    return profile
+
+User.profile = property(get_user_profile)
+
+
+def prefetch_profiles(users):
+
+    """
+    Load the profiles of a list of users with a single query, so reading
+    user.profile or user.get_profile() on them doesn't hit the database.
+
+    :rtype: list of users
+    """
+    users = list(users)
+    missing = dict((user.pk, user) for user in users
+                   if not hasattr(user, '_profile_cache'))
+    if missing:
+        for profile in UserProfile.objects.filter(user__in=missing.keys()):
+            user = missing[profile.user_id]
+            profile.user = user
+            user._profile_cache = profile
+    return users
+
+
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+
+    """
+    Create the profile of every new user.
+    """
+    if created and not raw:
+        instance._profile_cache = UserProfile.objects.create(user=instance)
+
+post_save.connect(create_user_profile, sender=User)
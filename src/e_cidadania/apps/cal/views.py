@@ -18,12 +18,13 @@
 # You should have received a copy of the GNU General Public License
 # along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
 
-from django.shortcuts import render_to_response, get_object_or_404
+from django.shortcuts import render_to_response
 from django.utils.safestring import mark_safe
 from django.template import RequestContext
 from django.utils import translation
 
-from e_cidadania.apps.spaces.models import Event, Space
+from e_cidadania.apps.spaces.models import Event
+from e_cidadania.apps.spaces.resolver import get_space_or_404
 from e_cidadania.apps.cal.models import EventCalendar
 from e_cidadania import settings
 
@@ -40,7 +41,7 @@ def calendar(request, space_name, year, month):
         return render_to_response('cal/error.html',
                                   context_instance=RequestContext(request))
 
-    place = get_object_or_404(Space, url=space_name)
+    place = get_space_or_404(space_name)
     meetings = Event.objects.order_by('event_date') \
                               .filter(space = place,
                                       meeting_date__year = year,
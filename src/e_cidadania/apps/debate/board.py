@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The debate board engine. It builds the rows x columns matrix of notes that
+the debate template renders, so the template doesn't have to look for the
+notes of every cell by itself, and applies batches of note moves.
+"""
+
+from django.db import transaction
+
+from e_cidadania.apps.debate.models import Note, Row, Column, NoteChange
+
+
+class BoardCell(object):
+
+    """
+    A single cell of the debate board, the intersection between a row and a
+    column. It holds the notes placed in it.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, row, column):
+        self.row = row
+        self.column = column
+        self.notes = []
+
+    def headers(self):
+        """
+        Returns the value of the 'headers' attribute of the cell, which is
+        used by the debate board javascript to know the note position.
+        """
+        return "%s-%s" % (self.column.id, self.row.id)
+
+
+class DebateBoard(object):
+
+    """
+    Precomputed debate board. The notes of the debate are bucketed into a
+    (row_id, column_id) grid in a single pass, so rendering the board costs
+    R*C + N operations instead of R*C*N.
+
+    Every note gets a boolean 'mine' attribute with the result of comparing
+    its author with the current user, so the template doesn't have to load
+    the author of every note.
+
+    :attributes: - debate: the debate object
+                 - columns: list of columns of the debate
+                 - matrix: list of (row, [BoardCell, ...]) tuples
+
+    .. versionadded:: 0.1.5
+    """
+    note_fields = ('id', 'title', 'row', 'column', 'author')
+
+    def __init__(self, debate, user=None):
+        self.debate = debate
+        self.user = user
+        self.columns = list(Column.objects.filter(debate=debate).order_by('id'))
+        self.rows = list(Row.objects.filter(debate=debate).order_by('id'))
+        self.matrix = self._build_matrix()
+
+    def get_notes(self):
+        """
+        Returns the notes of the debate, only with the fields needed to
+        draw the board.
+        """
+        return Note.objects.filter(debate=self.debate).only(*self.note_fields)
+
+    def _build_matrix(self):
+        user_id = getattr(self.user, 'id', None)
+        grid = {}
+        for row in self.rows:
+            for column in self.columns:
+                grid[(row.id, column.id)] = BoardCell(row, column)
+
+        for note in self.get_notes().order_by('id').iterator():
+            cell = grid.get((note.row_id, note.column_id))
+            # Notes without a valid position are not shown in the board
+            if cell is None:
+                continue
+            note.mine = user_id is not None and note.author_id == user_id
+            cell.notes.append(note)
+
+        return [(row, [grid[(row.id, column.id)] for column in self.columns])
+                for row in self.rows]
+
+    def __iter__(self):
+        return iter(self.matrix)
+
+    def __len__(self):
+        return len(self.matrix)
+
+
+# Results of every move in move_notes()
+MOVE_OK = 'ok'
+MOVE_UNKNOWN_NOTE = 'unknown note'
+MOVE_INVALID_ROW = 'invalid row'
+MOVE_INVALID_COLUMN = 'invalid column'
+MOVE_DUPLICATED = 'duplicated'
+
+
+@transaction.commit_on_success
+def move_notes(debate, moves, user=None):
+    """
+    Move several notes of the debate at once. The moves are validated against
+    the debate rows and columns in memory and applied with one UPDATE per
+    destination cell, all of them in a single transaction. Every moved note is
+    also appended to the debate change log.
+
+    :param moves: list of (note_id, row_id, column_id) tuples
+    :rtype: dictionary with the result of the move of every note id
+    """
+    row_ids = set(Row.objects.filter(debate=debate).values_list('id', flat=True))
+    column_ids = set(Column.objects.filter(debate=debate)
+                     .values_list('id', flat=True))
+    notes = Note.objects.filter(debate=debate,
+                                pk__in=[move[0] for move in moves])
+    notes = dict((note.id, note) for note in
+                 notes.only('id', 'title', 'row', 'column', 'debate'))
+
+    results = {}
+    cells = {}
+    for note_id, row_id, column_id in moves:
+        note = notes.get(note_id)
+        if note_id in results:
+            results[note_id] = MOVE_DUPLICATED
+        elif note is None:
+            results[note_id] = MOVE_UNKNOWN_NOTE
+        elif row_id not in row_ids:
+            results[note_id] = MOVE_INVALID_ROW
+        elif column_id not in column_ids:
+            results[note_id] = MOVE_INVALID_COLUMN
+        else:
+            results[note_id] = MOVE_OK
+            if (note.row_id, note.column_id) != (row_id, column_id):
+                note.row_id, note.column_id = row_id, column_id
+                cells.setdefault((row_id, column_id), []).append(note)
+
+    # A duplicated note could have been queued before we knew it
+    moved = []
+    for (row_id, column_id), cell_notes in cells.items():
+        cell_notes = [n for n in cell_notes if results[n.id] == MOVE_OK]
+        if cell_notes:
+            Note.objects.filter(pk__in=[n.id for n in cell_notes]) \
+                .update(row=row_id, column=column_id)
+            moved.extend(cell_notes)
+
+    NoteChange.objects.append(debate.id, moved, NoteChange.MOVED, user)
+    return results
@@ -45,15 +45,21 @@ class DebateForm(ModelForm):
 class RowForm(ModelForm):
 
     """
+    Returns a form for a row criteria. The debate is set when the debate is
+    saved.
     """
     class Meta:
         model = Row
+        exclude = ('debate',)
 
 class ColumnForm(ModelForm):
     """
+    Returns a form for a column criteria. The debate is set when the debate is
+    saved.
     """
     class Meta:
         model = Column
+        exclude = ('debate',)
 
 class NoteForm(ModelForm):
 
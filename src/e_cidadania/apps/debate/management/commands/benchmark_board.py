@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure how the debate board render time scales with the number of notes.
+All the data created by the benchmark is rolled back at the end.
+
+Usage: python manage.py benchmark_board --size=10 --notes=250,500,1000,2000
+"""
+
+import time
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Template, Context
+
+from e_cidadania.apps.debate.models import Debate, Note, Row, Column
+from e_cidadania.apps.debate.board import DebateBoard
+
+# Board template before the DebateBoard engine: every cell loops over all the
+# notes of the debate.
+LEGACY_TEMPLATE = Template("""
+{% for row in rows %}{% for td in columns %}{% for note in notes %}
+{% if note.column.id == td.id and note.row.id == row.id %}{{ note.title }}{% endif %}
+{% endfor %}{% endfor %}{% endfor %}
+""")
+
+BOARD_TEMPLATE = Template("""
+{% for row, cells in board %}{% for cell in cells %}{% for note in cell.notes %}
+{{ note.title }}
+{% endfor %}{% endfor %}{% endfor %}
+""")
+
+
+class Command(BaseCommand):
+
+    """
+    Render a debate board with an increasing number of notes using the
+    legacy template loop and the DebateBoard engine.
+    """
+    help = "Benchmark the debate board rendering against the note count."
+    option_list = BaseCommand.option_list + (
+        make_option('--size', dest='size', type='int', default=10,
+                    help='Number of rows and columns of the board.'),
+        make_option('--notes', dest='notes', default='250,500,1000,2000',
+                    help='Comma separated list of note counts to test.'),
+        make_option('--skip-legacy', dest='skip_legacy', action='store_true',
+                    default=False, help="Don't time the legacy template."),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        size = options['size']
+        counts = [int(n) for n in options['notes'].split(',')]
+        try:
+            today = datetime.date.today()
+            debate = Debate.objects.create(title='benchmark-board-%s' % time.time(),
+                start_date=today, end_date=today + datetime.timedelta(days=1))
+            rows = [Row.objects.create(debate=debate, criteria='row %s' % i)
+                    for i in range(size)]
+            columns = [Column.objects.create(debate=debate, criteria='col %s' % i)
+                       for i in range(size)]
+
+            self.stdout.write("notes\tboard (s)\tlegacy (s)\n")
+            created = 0
+            for count in counts:
+                while created < count:
+                    Note.objects.create(debate=debate, title='note %s' % created,
+                                        row=rows[created % size],
+                                        column=columns[(created // size) % size])
+                    created += 1
+
+                start = time.time()
+                BOARD_TEMPLATE.render(Context({'board': DebateBoard(debate)}))
+                board_time = time.time() - start
+
+                legacy_time = '-'
+                if not options['skip_legacy']:
+                    start = time.time()
+                    LEGACY_TEMPLATE.render(Context({
+                        'rows': Row.objects.filter(debate=debate),
+                        'columns': Column.objects.filter(debate=debate),
+                        'notes': Note.objects.filter(debate=debate)}))
+                    legacy_time = '%.4f' % (time.time() - start)
+
+                self.stdout.write("%s\t%.4f\t\t%s\n" % (count, board_time,
+                                                        legacy_time))
+        finally:
+            transaction.rollback()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the throughput of moving notes one by one through update_position
+against moving them in batches through update_positions. The debate created
+for the benchmark is deleted at the end.
+
+Usage: python manage.py benchmark_moves --notes=200 --batch=50
+"""
+
+import json
+import time
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.test.client import RequestFactory
+
+from e_cidadania.apps.debate.models import Debate, Note, Row, Column
+from e_cidadania.apps.debate.views import update_position, update_positions
+
+
+class Command(BaseCommand):
+
+    """
+    Move every note of a test debate to another cell using the per-note view
+    and the batched view and print the moves per second of both.
+    """
+    help = "Benchmark the per-note and the batched note move views."
+    option_list = BaseCommand.option_list + (
+        make_option('--notes', dest='notes', type='int', default=200,
+                    help='Number of notes to move.'),
+        make_option('--batch', dest='batch', type='int', default=50,
+                    help='Number of moves sent in every batched petition.'),
+    )
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        today = datetime.date.today()
+        user = User.objects.create(username='benchmark-moves-%d' % time.time())
+        debate = Debate.objects.create(title='benchmark-moves-%s' % time.time(),
+            start_date=today, end_date=today + datetime.timedelta(days=1))
+        try:
+            rows = [Row.objects.create(debate=debate, criteria='row %s' % i)
+                    for i in range(2)]
+            columns = [Column.objects.create(debate=debate, criteria='col %s' % i)
+                       for i in range(2)]
+            notes = [Note.objects.create(debate=debate, title='note %s' % i,
+                                         row=rows[0], column=columns[0])
+                     for i in range(options['notes'])]
+
+            start = time.time()
+            for note in notes:
+                request = factory.post('/', {'noteid': note.id,
+                                             'row': rows[1].id,
+                                             'column': columns[1].id})
+                request.user = user
+                update_position(request, debate.space)
+            single = time.time() - start
+
+            start = time.time()
+            batch = options['batch']
+            for i in range(0, len(notes), batch):
+                moves = [[note.id, rows[0].id, columns[0].id]
+                         for note in notes[i:i + batch]]
+                request = factory.post('/', {'debateid': debate.id,
+                                             'moves': json.dumps(moves)})
+                request.user = user
+                update_positions(request, debate.space)
+            batched = time.time() - start
+
+            self.stdout.write("per-note: %.1f moves/s\n" % (len(notes) / single))
+            self.stdout.write("batched (%s): %.1f moves/s\n" %
+                              (batch, len(notes) / batched))
+        finally:
+            debate.delete()
+            user.delete()
@@ -24,9 +24,11 @@ This file contains all the data models for the debate module.
 import datetime
 
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 
+from e_cidadania.bulk import bulk_insert
 from e_cidadania.apps.tagging.fields import TagField
 from e_cidadania.apps.tagging.models import Tag
 from e_cidadania.apps.spaces.models import Space
@@ -50,7 +52,8 @@ class Debate(models.Model):
     author = models.ForeignKey(User, blank=True, null=True)
     start_date = models.DateField(_('Start date'), blank=True, null=True)
     end_date = models.DateField(_('End date'), blank=True, null=True)
-
+    revision = models.PositiveIntegerField(_('Revision'), default=0,
+                                           editable=False)
     
     def __unicode__(self):
         return self.title
@@ -117,3 +120,104 @@ class Note(models.Model):
 
     def __unicode__(self):
         return self.message
+
+
+class NoteChangeManager(models.Manager):
+
+    """
+    Manager for the debate change log. Recording a change bumps the debate
+    revision and stores the change with the new revision number. The views
+    save the note and record its change in one transaction, so a change is
+    never committed without its log entry.
+    """
+    def record(self, note, action, user=None):
+        """
+        Append a change of the note to the log of its debate. The caller is
+        responsible of the transaction handling. Returns the NoteChange
+        object or None if the note doesn't belong to any debate.
+        """
+        if note.debate_id is None:
+            return None
+        return self.append(note.debate_id, [note], action, user)[0]
+
+    def append(self, debate_id, notes, action, user=None):
+        """
+        Append the same change of several notes of one debate to the log,
+        bumping the debate revision only once. The caller is responsible of
+        the transaction handling. Returns the list of unsaved NoteChange
+        objects that were inserted.
+        """
+        if not notes:
+            return []
+        if user is not None and not user.is_authenticated():
+            user = None
+        Debate.objects.filter(pk=debate_id).update(
+            revision=F('revision') + len(notes))
+        revision = Debate.objects.filter(pk=debate_id) \
+            .values_list('revision', flat=True)[0]
+
+        changes = []
+        for i, note in enumerate(notes):
+            changes.append(NoteChange(debate_id=debate_id,
+                revision=revision - len(notes) + i + 1, action=action,
+                note_id=note.id, column_id=note.column_id, row_id=note.row_id,
+                title=note.title, author=user))
+        bulk_insert(changes)
+        return changes
+
+    def since(self, debate, revision):
+        """
+        Returns the changes of the debate newer than the given revision.
+        """
+        return self.filter(debate=debate, revision__gt=revision) \
+            .order_by('revision')
+
+
+class NoteChange(models.Model):
+
+    """
+    Append-only log of the changes made to the notes of a debate. Every change
+    has the debate revision it produced, so the clients can ask only for the
+    changes they haven't seen yet.
+
+    .. versionadded:: 0.1.5
+    """
+    CREATED = 'c'
+    MOVED = 'm'
+    EDITED = 'e'
+    DELETED = 'd'
+    ACTIONS = (
+        (CREATED, _('Created')),
+        (MOVED, _('Moved')),
+        (EDITED, _('Edited')),
+        (DELETED, _('Deleted')),
+    )
+
+    debate = models.ForeignKey(Debate)
+    revision = models.PositiveIntegerField(_('Revision'))
+    action = models.CharField(_('Action'), max_length=1, choices=ACTIONS)
+    # The note can be deleted, so we keep plain ids instead of foreign keys.
+    note_id = models.PositiveIntegerField(_('Note'))
+    column_id = models.PositiveIntegerField(_('Column'), blank=True, null=True)
+    row_id = models.PositiveIntegerField(_('Row'), blank=True, null=True)
+    title = models.CharField(_('Title'), max_length=60, blank=True, null=True)
+    author = models.ForeignKey(User, null=True, blank=True,
+                               related_name="note_changes")
+    date = models.DateTimeField(_('Date'), auto_now_add=True)
+
+    objects = NoteChangeManager()
+
+    class Meta:
+        ordering = ['revision']
+        unique_together = ('debate', 'revision')
+
+    def __unicode__(self):
+        return u'%s r%s %s' % (self.debate_id, self.revision, self.action)
+
+    def as_list(self):
+        """
+        Compact representation of the change for the change feed:
+        [revision, action, note, column, row, title]
+        """
+        return [self.revision, self.action, self.note_id, self.column_id,
+                self.row_id, self.title]
@@ -0,0 +1,12 @@
+"""
+Convenience module for access of custom debate application settings,
+which enforces default settings when the main settings module does not
+contain the appropriate settings.
+"""
+from django.conf import settings
+
+# Maximum number of changes returned by a single change feed request.
+DEBATE_CHANGES_LIMIT = getattr(settings, 'DEBATE_CHANGES_LIMIT', 500)
+
+# Maximum number of note moves accepted by a single batched move request.
+DEBATE_MOVES_LIMIT = getattr(settings, 'DEBATE_MOVES_LIMIT', 500)
@@ -0,0 +1,2 @@
+-- Composite index for the keyset pagination of the space debate list.
+CREATE INDEX debate_debate_space_date ON debate_debate (space_id, date, id);
@@ -7,6 +7,9 @@
     Author: Oscar Carballal Prego <info@oscarcp.com>
 */
 
+// Milliseconds between requests for the changes of the debate.
+var POLL_INTERVAL = 5000;
+
 // We put here the string for translation. This is meant to be translated by
 // django jsi18n
 var newTitle = gettext('Write here your title');
@@ -254,6 +257,71 @@ function makeSortable() {
     }).disableSelection();
 }
 
+/* CHANGE FEED */
+
+function applyChange(change) {
+    /*
+        applyChange(change) - Applies a change from the debate change feed to
+        the board. The change is a list [revision, action, note, column, row,
+        title]. Changes can arrive more than once, so applying them must leave
+        the board in the same state.
+    */
+    var noteID = change[2];
+    var note = $('div.note#' + noteID);
+    var cell = $("td[headers='" + change[3] + "-" + change[4] + "']");
+
+    switch (change[1]) {
+        case 'c':
+            if (note.length == 0 && cell.length > 0) {
+                cell.append("<div id='" + noteID + "' class='note'>" +
+                    "<div class='handler'></div><p class='note-text'></p>" +
+                    "<span id='view-note' class='label hidden'><a href='#' onclick='viewNote(this)' data-toggle='modal' data-target='#view-current-note'>" + viewString + "</a></span></div>");
+                $('div.note#' + noteID + ' > p').text(change[5]);
+            }
+            break;
+        case 'm':
+            if (note.length > 0 && cell.length > 0 && note.parent().attr('headers') != cell.attr('headers')) {
+                note.appendTo(cell);
+            }
+            break;
+        case 'e':
+            note.children('p').text(change[5]);
+            break;
+        case 'd':
+            note.remove();
+            break;
+    }
+}
+
+function pollChanges() {
+    /*
+        pollChanges() - Asks the server for the changes made to the debate since
+        the last revision we know about and applies them, then asks again after
+        POLL_INTERVAL. Asking when nothing changed is cheap for the server.
+    */
+    var request = $.ajax({
+        url: "changes/",
+        cache: false,
+        data: {
+            since: $('#debate-revision').text()
+        }
+    });
+
+    request.done(function(feed) {
+        $.each(feed.changes, function(i, change) {
+            applyChange(change);
+        });
+        $('#debate-revision').text(feed.revision);
+        // There may be more changes if the server limit was reached
+        setTimeout(pollChanges, feed.changes.length ? 0 : POLL_INTERVAL);
+    });
+
+    request.fail(function() {
+        // Don't hammer the server if something went wrong.
+        setTimeout(pollChanges, 10000);
+    });
+}
+
 /* DEBATE CREATION */
 
 var tdlength = 0;
@@ -342,5 +410,9 @@ $(document).ready(function() {
     makeSortable();
     // Show controls for some notes
     showControls();
+    // Listen for changes made by other users
+    if ($('#debate-revision').length > 0) {
+        pollChanges();
+    }
 });
 
@@ -30,11 +30,16 @@ urlpatterns = patterns('e_cidadania.apps.debate.views',
 
     url(r'^$', ListDebates.as_view(), name='list-debates'),
 
+    url(r'^(?P<debate_id>\d+)/changes/$', 'debate_changes',
+        name='debate-changes'),
+
     url(r'^(?P<debate_id>\d+)/', ViewDebate.as_view(), name='view-debate'),
     
     url(r'^add/', 'add_new_debate', name='add-debate'),
 
     url(r'^update_position/', 'update_position', name='update-note-position'),
+
+    url(r'^update_positions/', 'update_positions', name='update-note-positions'),
     
     url(r'^update_note/', 'update_note', name='update-note'),
     
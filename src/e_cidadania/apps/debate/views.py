@@ -45,13 +45,19 @@ from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.template import RequestContext
 from django.forms.formsets import formset_factory, BaseFormSet
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 
 # Application models
-from e_cidadania.apps.debate.models import Debate, Note, Row, Column
+from e_cidadania.pagination import KeysetPaginationMixin
+from e_cidadania.apps.debate.models import Debate, Note, Row, Column, \
+    NoteChange
 from e_cidadania.apps.debate.forms import DebateForm, UpdateNoteForm, \
     NoteForm, RowForm, ColumnForm, UpdateNotePosition
-from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.debate.board import DebateBoard, move_notes
+from e_cidadania.apps.debate.settings import DEBATE_CHANGES_LIMIT, \
+    DEBATE_MOVES_LIMIT
+from e_cidadania.apps.spaces.resolver import SpaceMixin, get_space_or_404
+from e_cidadania.bulk import bulk_insert
 
 
 def add_new_debate(request, space_name):
@@ -60,7 +66,7 @@ def add_new_debate(request, space_name):
     Create a new debate. This function returns two forms to create
     a complete debate, debate form and phases formset.
     """
-    place = get_object_or_404(Space, url=space_name)
+    place = get_space_or_404(space_name)
     
     # Define FormSets
     
@@ -79,44 +85,51 @@ def add_new_debate(request, space_name):
     row_formset = RowFormSet(request.POST or None, prefix="rowform")
     column_formset = ColumnFormSet(request.POST or None, prefix="colform")
 
-    # Get the last PK and add 1 to get the current PK
-    try:
-        last_debate_id = Debate.objects.latest('id')
-        current_debate_id = last_debate_id.pk + 1
-    except ObjectDoesNotExist:
-        current_debate_id = 1
-
     if request.user.has_perm('debate_add') or request.user.is_staff:
         if request.method == 'POST':
             if debate_form.is_valid() and row_formset.is_valid() and column_formset.is_valid():
-                debate_form_uncommited = debate_form.save(commit=False)
-                debate_form_uncommited.space = place
-                debate_form_uncommited.author = request.user
-
-                saved_debate = debate_form_uncommited.save()
-                debate_instance = get_object_or_404(Debate, pk=current_debate_id)
- 
-                for form in row_formset.forms:
-                    row = form.save(commit=False)
-                    row.debate = debate_instance
-                
-                for form in column_formset.forms:
-                    column = form.save(commit=False)
-                    column.debate = debate_instance
-                                
-                return redirect('/spaces/' + space_name + '/debate/' + str(debate_form_uncommited.id))
+                debate = save_debate(debate_form, row_formset, column_formset,
+                                     place, request.user)
+                return redirect('/spaces/' + space_name + '/debate/' + str(debate.id))
                 
         return render_to_response('debate/debate_add_simple.html',
                                   {'form': debate_form,
                                    'rowform': row_formset,
                                    'colform': column_formset,
-                                   'get_place': place,
-                                   'debateid': current_debate_id},
+                                   'get_place': place},
                                   context_instance=RequestContext(request))
             
     return render_to_response('not_allowed.html',
                               context_instance=RequestContext(request))
     
+@transaction.commit_on_success
+def save_debate(debate_form, row_formset, column_formset, space, author):
+
+    """
+    Save a new debate with all its rows and columns as a single transaction.
+    The debate is inserted first to get its id, and then all the rows and
+    all the columns are inserted with one statement each, so the number of
+    queries doesn't depend on the size of the debate.
+
+    :rtype: the saved Debate object
+
+    .. versionadded:: 0.1.5
+    """
+    debate = debate_form.save(commit=False)
+    debate.space = space
+    debate.author = author
+    debate.save()
+
+    for formset in (row_formset, column_formset):
+        criteria = []
+        for form in formset.forms:
+            obj = form.save(commit=False)
+            obj.debate = debate
+            criteria.append(obj)
+        bulk_insert(criteria)
+
+    return debate
+
 def get_debates(request):
 
     """
@@ -125,6 +138,7 @@ def get_debates(request):
     data = [debate.title for debate in Debate.objects.all().order_by('title')]
     return render_to_response(json.dumps(data), content_type='application/json')
 
+@transaction.commit_on_success
 def create_note(request, space_name):
 
     """
@@ -150,6 +164,8 @@ def create_note(request, space_name):
                                                             pk=request.POST['column'])
             note_form_uncommited.row = get_object_or_404(Row, pk=request.POST['row'])
             note_form_uncommited.save()
+            NoteChange.objects.record(note_form_uncommited, NoteChange.CREATED,
+                                      request.user)
 
             response_data = {}
             response_data['id'] = note_form_uncommited.id
@@ -166,6 +182,7 @@ def create_note(request, space_name):
     return HttpResponse(json.dumps(msg), mimetype="application/json")
 
 
+@transaction.commit_on_success
 def update_note(request, space_name):
 
     """
@@ -192,6 +209,8 @@ def update_note(request, space_name):
             note_form_uncommited.last_mod_author = request.user
         
             note_form_uncommited.save()
+            NoteChange.objects.record(note_form_uncommited, NoteChange.EDITED,
+                                      request.user)
             msg = "The note has been updated."
         else:
             msg = "The form is not valid, check field(s): " + note_form.errors
@@ -200,6 +219,7 @@ def update_note(request, space_name):
         
     return HttpResponse(msg)
 
+@transaction.commit_on_success
 def update_position(request, space_name):
 
     """
@@ -217,6 +237,8 @@ def update_position(request, space_name):
             position_form_uncommited.row = get_object_or_404(Row, pk=request.POST['row'])
 
             position_form_uncommited.save()
+            NoteChange.objects.record(position_form_uncommited,
+                                      NoteChange.MOVED, request.user)
             msg = "The note has been updated."
         else:
             msg = "There has been an error validating the form."
@@ -226,6 +248,37 @@ def update_position(request, space_name):
     return HttpResponse(msg)
 
 
+def update_positions(request, space_name):
+
+    """
+    Saves the new position of several notes of a debate at once. It receives
+    the debate id in 'debateid' and a JSON list of [note, row, column] moves in
+    'moves'. All the moves are applied in a single transaction by
+    :func:`move_notes` and the result of every move is returned by note id.
+
+    .. versionadded:: 0.1.5
+    """
+    if request.method != "POST":
+        return HttpResponse(json.dumps("The petition was not POST."),
+                            mimetype="application/json")
+
+    debate = get_object_or_404(Debate, pk=request.POST.get('debateid'))
+    try:
+        moves = [(int(note), int(row), int(column)) for note, row, column
+                 in json.loads(request.POST.get('moves', '[]'))]
+    except (ValueError, TypeError):
+        return HttpResponse(json.dumps("The moves list is not valid."),
+                            mimetype="application/json", status=400)
+    if len(moves) > DEBATE_MOVES_LIMIT:
+        return HttpResponse(json.dumps("Too many moves in a single petition."),
+                            mimetype="application/json", status=400)
+
+    results = move_notes(debate, moves, request.user)
+    return HttpResponse(json.dumps({'results': results}),
+                        mimetype="application/json")
+
+
+@transaction.commit_on_success
 def delete_note(request, space_name):
 
     """
@@ -234,6 +287,7 @@ def delete_note(request, space_name):
     note = get_object_or_404(Note, pk=request.POST['noteid'])
 
     if note.author == request.user:
+        NoteChange.objects.record(note, NoteChange.DELETED, request.user)
         note.delete()
         return HttpResponse("The note has been deleted.")
 
@@ -241,7 +295,44 @@ def delete_note(request, space_name):
         return HttpResponse("You're not the author of the note. Can't delete.")
 
 
-class ViewDebate(DetailView):
+def debate_changes(request, space_name, debate_id):
+
+    """
+    Returns the changes made to the debate notes after the revision given in
+    the 'since' GET parameter, so the debate board can update itself without
+    reloading. The board polls it every few seconds; when nothing changed the
+    answer only costs reading the debate revision.
+
+    The answer is a JSON object with the current revision and a list of
+    changes in the form [revision, action, note, column, row, title].
+
+    .. versionadded:: 0.1.5
+    """
+    revisions = Debate.objects.filter(pk=debate_id) \
+        .values_list('revision', flat=True)
+    if not revisions:
+        raise Http404
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        since = 0
+
+    revision = revisions[0]
+    changes = []
+    if revision > since:
+        changes = [change.as_list() for change in
+                   NoteChange.objects.since(debate_id, since)[:DEBATE_CHANGES_LIMIT]]
+        # Continue from the last change returned, there may be more changes
+        # if the limit was reached.
+        if changes:
+            revision = changes[-1][0]
+
+    response_data = {'revision': revision, 'changes': changes}
+    return HttpResponse(json.dumps(response_data, separators=(',', ':')),
+                        mimetype="application/json")
+
+
+class ViewDebate(SpaceMixin, DetailView):
     """
     View a debate.
     """
@@ -260,23 +351,22 @@ class ViewDebate(DetailView):
 
     def get_context_data(self, **kwargs):
         """
-
+        Get the debate board already built. The notes are placed in their
+        cells by :class:`DebateBoard`, so the template only has to walk the
+        matrix.
         """
         context = super(ViewDebate, self).get_context_data(**kwargs)
-        columns = Column.objects.all().filter(debate=self.kwargs['debate_id'])
-        rows = Row.objects.all().filter(debate=self.kwargs['debate_id'])
-        current_space = get_object_or_404(Space, url=self.kwargs['space_name'])
-        current_debate = get_object_or_404(Debate, pk=self.kwargs['debate_id'])
-        notes = Note.objects.all().filter(debate=current_debate.pk)
+        current_space = self.get_space()
+        board = DebateBoard(self.object, user=self.request.user)
         try:
             last_note = Note.objects.latest('id')
         except:
             last_note = 0
 
         context['get_place'] = current_space
-        context['notes'] = notes
-        context['columns'] = columns
-        context['rows'] = rows
+        context['board'] = board
+        context['revision'] = self.object.revision
+        context['columns'] = board.columns
         if last_note == 0:
             context['lastnote'] = 0
         else:
@@ -285,14 +375,16 @@ class ViewDebate(DetailView):
         return context
 
 
-class ListDebates(ListView):
+class ListDebates(SpaceMixin, KeysetPaginationMixin, ListView):
     """
     Return a list of debates for the current space.
     """
     paginate_by = 10
+    keyset = 'date'
+    count_timeout = 300
 
     def get_queryset(self):
-        current_space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        current_space = self.get_space()
         debates = Debate.objects.all().filter(space=current_space)
 
         # Here must go a validation so a user registered to the space
@@ -303,5 +395,5 @@ class ListDebates(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(ListDebates, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
@@ -62,3 +62,4 @@ class Post(models.Model):
         else:
             return ('view-site-post', (), {
                 'post_id': str(self.id)})
+
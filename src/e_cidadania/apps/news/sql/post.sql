@@ -0,0 +1,4 @@
+-- Composite indexes for the keyset pagination of the space and front page
+-- news lists.
+CREATE INDEX news_post_space_pub_date ON news_post (space_id, pub_date, id);
+CREATE INDEX news_post_pub_index_pub_date ON news_post (pub_index, pub_date, id);
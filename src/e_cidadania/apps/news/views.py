@@ -34,12 +34,12 @@ from django.views.generic.create_update import create_object
 from django.views.generic.create_update import update_object
 
 from django.contrib.auth.models import User
-from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.spaces.resolver import SpaceMixin
 from e_cidadania.apps.news.models import Post
 from e_cidadania.apps.news.forms import NewsForm
 
 
-class AddPost(FormView):
+class AddPost(SpaceMixin, FormView):
 
     """
     Create a new post. Only registered users belonging to a concrete group
@@ -50,11 +50,11 @@ class AddPost(FormView):
     template_name = 'news/post_add.html'
     
     def get_success_url(self):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         return '/spaces/' + self.space.url
         
     def form_valid(self, form):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         form_uncommited = form.save(commit=False)
         form_uncommited.author = self.request.user
         form_uncommited.space = self.space
@@ -63,7 +63,7 @@ class AddPost(FormView):
 
     def get_context_data(self, **kwargs):
         context = super(AddPost, self).get_context_data(**kwargs)
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         context['get_place'] = self.space
         return context
         
@@ -72,7 +72,7 @@ class AddPost(FormView):
         return super(AddPost, self).dispatch(*args, **kwargs)
 
 
-class ViewPost(DetailView):
+class ViewPost(SpaceMixin, DetailView):
 
     """
     View a specific post.
@@ -89,11 +89,11 @@ class ViewPost(DetailView):
         Get extra context data for the ViewPost view.
         """
         context = super(ViewPost, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
 
 
-class EditPost(UpdateView):
+class EditPost(SpaceMixin, UpdateView):
 
     """
     Edit an existent post.
@@ -102,7 +102,7 @@ class EditPost(UpdateView):
     template_name = 'news/post_edit.html'
 
     def get_success_url(self):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         return '/spaces/' + self.space.url
 
     def get_object(self):
@@ -111,7 +111,7 @@ class EditPost(UpdateView):
         
     def get_context_data(self, **kwargs):
         context = super(EditPost, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
     @method_decorator(permission_required('news.edit_post'))
@@ -119,7 +119,7 @@ class EditPost(UpdateView):
         return super(EditPost, self).dispatch(*args, **kwargs)
 
 
-class DeletePost(DeleteView):
+class DeletePost(SpaceMixin, DeleteView):
 
     """
     Delete an existent post. Post deletion is only reserved to spaces
@@ -140,6 +140,6 @@ class DeletePost(DeleteView):
         Get extra context data for the ViewPost view.
         """
         context = super(DeletePost, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
 
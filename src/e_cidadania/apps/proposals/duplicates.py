@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Near-duplicate proposal index. The text of every proposal (title and
+description) is cut in overlapping character shingles and summarized in a
+MinHash signature, whose values are equal between two proposals with a
+probability equal to the similarity (Jaccard index) of their shingles.
+
+The signature is split in PROPOSAL_MINHASH_BANDS bands and the hash of
+every band is stored in ProposalFingerprint (locality sensitive hashing).
+Similar proposals share at least one band with high probability, so the
+candidates are found with a few index lookups instead of comparing the text
+with every proposal, and only the candidates are compared.
+"""
+
+import re
+import zlib
+import random
+import unicodedata
+
+from django.db.models import Q, Count
+from django.utils.encoding import force_unicode, smart_str
+from django.utils.html import strip_tags
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.proposals.models import Proposal, ProposalFingerprint
+from e_cidadania.apps.proposals.settings import PROPOSAL_MINHASH_BANDS, \
+    PROPOSAL_MINHASH_ROWS, PROPOSAL_DUPLICATE_THRESHOLD, \
+    PROPOSAL_DUPLICATE_SUGGESTIONS
+
+SHINGLE_SIZE = 5
+# Shingle hashes and permutations fit in 31 bits, so the products stay
+# machine integers.
+MERSENNE_PRIME = (1 << 31) - 1
+MAX_HASH = MERSENNE_PRIME
+
+# The permutations must be the same for every process, so they come from a
+# seeded generator.
+_random = random.Random(20120501)
+PERMUTATIONS = [(_random.randint(1, MERSENNE_PRIME - 1),
+                 _random.randint(0, MERSENNE_PRIME - 1))
+                for i in range(PROPOSAL_MINHASH_BANDS * PROPOSAL_MINHASH_ROWS)]
+
+WORDS = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """
+    Returns the words of the text in lowercase, without markup or accents.
+    """
+    text = unicodedata.normalize('NFKD', force_unicode(strip_tags(text)))
+    text = u''.join(c for c in text if not unicodedata.combining(c))
+    return WORDS.findall(text.lower())
+
+
+def shingles(title, description):
+    """
+    Returns the set of hashed character shingles of the proposal text.
+    """
+    text = u' '.join(normalize(title) + normalize(description))
+    if len(text) <= SHINGLE_SIZE:
+        return set([zlib.crc32(smart_str(text)) & MAX_HASH])
+    return set(zlib.crc32(smart_str(text[i:i + SHINGLE_SIZE])) & MAX_HASH
+               for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def signature(hashes):
+    """
+    Returns the MinHash signature of a set of shingle hashes.
+    """
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes)
+            for a, b in PERMUTATIONS]
+
+
+def bands(sig):
+    """
+    Returns the (band, bucket) pairs of a signature.
+    """
+    rows = PROPOSAL_MINHASH_ROWS
+    return [(band, zlib.crc32(','.join(str(v) for v in
+                                       sig[band * rows:(band + 1) * rows])))
+            for band in range(PROPOSAL_MINHASH_BANDS)]
+
+
+def similarity(a, b):
+    """
+    Jaccard index of two sets of shingles.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+def fingerprints(proposal):
+    """
+    Returns the unsaved fingerprints of a proposal.
+    """
+    sig = signature(shingles(proposal.title, proposal.description))
+    return [ProposalFingerprint(proposal_id=proposal.pk, band=band,
+                                bucket=bucket)
+            for band, bucket in bands(sig)]
+
+
+def index(proposal):
+    """
+    Replace the fingerprints of a proposal.
+    """
+    ProposalFingerprint.objects.filter(proposal=proposal.pk).delete()
+    bulk_insert(fingerprints(proposal))
+
+
+def find_similar(space, title, description, exclude=None,
+                 threshold=PROPOSAL_DUPLICATE_THRESHOLD,
+                 limit=PROPOSAL_DUPLICATE_SUGGESTIONS):
+    """
+    Returns the proposals of the space most similar to the given text, as a
+    list of (similarity, proposal) tuples from the most similar. Only the
+    proposals sharing a band with the text are read and compared. Proposals
+    of other spaces are never suggested, as they can be private.
+
+    :param exclude: id of a proposal to leave out, like the one being edited
+    """
+    hashes = shingles(title, description)
+    query = Q()
+    for band, bucket in bands(signature(hashes)):
+        query |= Q(band=band, bucket=bucket)
+    candidates = ProposalFingerprint.objects.filter(query, proposal__space=space)
+    if exclude is not None:
+        candidates = candidates.exclude(proposal=exclude)
+    # The proposals sharing more bands are more likely to be similar
+    candidates = candidates.values('proposal').annotate(
+        shared=Count('id')).order_by('-shared')[:limit * 4]
+
+    similar = []
+    for proposal in Proposal.objects.filter(
+        pk__in=[c['proposal'] for c in candidates]).select_related('space'):
+        score = similarity(hashes, shingles(proposal.title,
+                                            proposal.description))
+        if score >= threshold:
+            similar.append((score, proposal))
+    similar.sort(key=lambda s: s[0], reverse=True)
+    return similar[:limit]
+
+
+def rebuild(proposals=None, chunk=1000):
+    """
+    Recalculate the fingerprints of the proposals of the given queryset, or
+    of all the proposals.
+
+    :rtype: number of indexed proposals
+    """
+    if proposals is None:
+        proposals = Proposal.objects.all()
+        ProposalFingerprint.objects.all().delete()
+    else:
+        ProposalFingerprint.objects.filter(proposal__in=proposals).delete()
+    indexed = 0
+    batch = []
+    for proposal in proposals.only('id', 'title', 'description').iterator():
+        batch.extend(fingerprints(proposal))
+        indexed += 1
+        if len(batch) >= chunk:
+            bulk_insert(batch)
+            batch = []
+    bulk_insert(batch)
+    return indexed
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spatial index of the geolocated proposals. Every proposal stores the geohash
+of its position, a string where every character splits the cell of the
+previous one in 32 smaller cells, so the proposals inside an area are a few
+ranges of an ordinary string index and work on any database.
+
+The proposals are also counted by geohash cell at every clustering level
+(ProposalCluster), which gives the map the number of proposals and the
+centroid of every cluster without reading the proposals.
+"""
+
+import math
+
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F, Q
+
+from e_cidadania.bulk import insert_rows
+from e_cidadania.apps.proposals.models import Proposal, ProposalCluster
+from e_cidadania.apps.proposals.settings import PROPOSAL_GEOHASH_LENGTH, \
+    PROPOSAL_CLUSTER_LEVELS, PROPOSAL_MAP_MAX_CLUSTERS
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Upper bound of the geohash characters, used to close the prefix ranges
+PREFIX_END = '~'
+
+
+def encode(latitude, longitude, length=PROPOSAL_GEOHASH_LENGTH):
+    """
+    Returns the geohash of the given position with 'length' characters.
+    """
+    south, north = -90.0, 90.0
+    west, east = -180.0, 180.0
+    latitude, longitude = float(latitude), float(longitude)
+    geohash = []
+    even = True
+    while len(geohash) < length:
+        char = 0
+        for bit in range(5):
+            if even:
+                middle = (west + east) / 2
+                if longitude >= middle:
+                    char = char * 2 + 1
+                    west = middle
+                else:
+                    char = char * 2
+                    east = middle
+            else:
+                middle = (south + north) / 2
+                if latitude >= middle:
+                    char = char * 2 + 1
+                    south = middle
+                else:
+                    char = char * 2
+                    north = middle
+            even = not even
+        geohash.append(BASE32[char])
+    return ''.join(geohash)
+
+
+def cell_size(length):
+    """
+    Returns the (height, width) in degrees of the cells of a geohash with
+    'length' characters.
+    """
+    bits = 5 * length
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+
+def covering_cells(south, west, north, east, length):
+    """
+    Returns the geohash cells of 'length' characters that cover the given
+    bounding box. A box with west > east crosses the antimeridian.
+    """
+    if west > east:
+        return covering_cells(south, west, north, 180.0, length) + \
+            covering_cells(south, -180.0, north, east, length)
+    height, width = cell_size(length)
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    cells = []
+    row = math.floor((south + 90.0) / height)
+    while row * height - 90.0 <= north and row * height < 180.0:
+        column = math.floor((west + 180.0) / width)
+        while column * width - 180.0 <= east and column * width < 360.0:
+            cell = encode((row + 0.5) * height - 90.0,
+                          (column + 0.5) * width - 180.0, length)
+            if cell not in cells:
+                cells.append(cell)
+            column += 1
+        row += 1
+    return cells
+
+
+def estimate_cells(south, west, north, east, length):
+    """
+    Returns an upper bound of the number of geohash cells of 'length'
+    characters that cover the bounding box, without building them.
+    """
+    height, width = cell_size(length)
+    box_width = (east - west) % 360 or (360 if east != west else 0)
+    return (math.ceil((north - south) / height) + 1) * \
+           (math.ceil(box_width / width) + 1)
+
+
+def cover(south, west, north, east, max_cells=16):
+    """
+    Returns the longest geohash cells that cover the bounding box with at
+    most max_cells cells.
+    """
+    cells = ['']
+    for length in range(1, PROPOSAL_GEOHASH_LENGTH + 1):
+        # Cheap estimate before building the cells
+        if estimate_cells(south, west, north, east, length) > max_cells * 4:
+            break
+        candidate = covering_cells(south, west, north, east, length)
+        if len(candidate) > max_cells:
+            break
+        cells = candidate
+    return cells
+
+
+def prefix_filter(field, cells):
+    """
+    Returns a Q object that matches the values of 'field' starting with any
+    of the cells. It uses ranges instead of LIKE so the index is used.
+    """
+    query = Q()
+    for cell in cells:
+        if not cell:
+            return Q(**{'%s__isnull' % field: False})
+        query |= Q(**{'%s__gte' % field: cell,
+                      '%s__lt' % field: cell + PREFIX_END})
+    return query
+
+
+def in_bbox(queryset, south, west, north, east):
+    """
+    Filter a proposal queryset to the proposals inside the bounding box.
+    """
+    queryset = queryset.filter(prefix_filter('geohash',
+                                             cover(south, west, north, east)))
+    queryset = queryset.filter(latitude__gte=str(south), latitude__lte=str(north))
+    if west <= east:
+        return queryset.filter(longitude__gte=str(west), longitude__lte=str(east))
+    return queryset.filter(Q(longitude__gte=str(west)) |
+                           Q(longitude__lte=str(east)))
+
+
+def zoom_level(zoom):
+    """
+    Returns the clustering level (geohash length) for a web map zoom. The
+    cells are about a quarter of a 256 pixel map tile wide.
+    """
+    length = int(round(2 * (zoom + 2) / 5.0))
+    return max(1, min(length, PROPOSAL_CLUSTER_LEVELS))
+
+
+def max_level(south, west, north, east, max_cells=PROPOSAL_MAP_MAX_CLUSTERS):
+    """
+    Returns the longest clustering level whose cells covering the bounding box
+    are at most max_cells, so a large area can't be asked at a fine level.
+    """
+    level = 1
+    for length in range(2, PROPOSAL_CLUSTER_LEVELS + 1):
+        if estimate_cells(south, west, north, east, length) > max_cells:
+            break
+        level = length
+    return level
+
+
+def clusters(space, level, south, west, north, east,
+             limit=PROPOSAL_MAP_MAX_CLUSTERS):
+    """
+    Returns the biggest 'limit' proposal clusters of the space with their
+    centroid inside the bounding box. The level is lowered to
+    :func:`max_level` if the area is too large for it.
+    """
+    level = min(level, max_level(south, west, north, east, limit))
+    cells = cover(south, west, north, east)
+    # Covering cells longer than the level are cut down to it
+    cells = sorted(set(cell[:level] for cell in cells))
+    # The sums divided by the count are the centroid; count is positive
+    inside = Q(latitude_sum__gte=F('count') * south,
+               latitude_sum__lte=F('count') * north)
+    if west <= east:
+        inside &= Q(longitude_sum__gte=F('count') * west,
+                    longitude_sum__lte=F('count') * east)
+    else:
+        inside &= Q(longitude_sum__gte=F('count') * west) | \
+                  Q(longitude_sum__lte=F('count') * east)
+    return ProposalCluster.objects.filter(prefix_filter('cell', cells), inside,
+                                          space=space, level=level,
+                                          count__gt=0).order_by('-count')[:limit]
+
+
+def _update_clusters(space_id, geohash, latitude, longitude, delta):
+    cells = [geohash[:level] for level in range(1, PROPOSAL_CLUSTER_LEVELS + 1)]
+    query = Q()
+    for cell in cells:
+        query |= Q(level=len(cell), cell=cell)
+    clusters = ProposalCluster.objects.filter(query, space=space_id)
+    updated = clusters.update(
+        count=F('count') + delta,
+        latitude_sum=F('latitude_sum') + delta * latitude,
+        longitude_sum=F('longitude_sum') + delta * longitude)
+    if delta < 0:
+        clusters.filter(count__lte=0).delete()
+    elif updated < len(cells):
+        existing = set(clusters.values_list('cell', flat=True))
+        for cell in cells:
+            if cell in existing:
+                continue
+            sid = transaction.savepoint()
+            try:
+                ProposalCluster.objects.create(space_id=space_id,
+                    level=len(cell), cell=cell, count=delta,
+                    latitude_sum=delta * latitude,
+                    longitude_sum=delta * longitude)
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                # Created by another request since we looked for it
+                transaction.savepoint_rollback(sid)
+                ProposalCluster.objects.filter(space=space_id, level=len(cell),
+                                               cell=cell).update(
+                    count=F('count') + delta,
+                    latitude_sum=F('latitude_sum') + delta * latitude,
+                    longitude_sum=F('longitude_sum') + delta * longitude)
+
+
+def move(old, new):
+    """
+    Move a proposal in the cluster counters. 'old' and 'new' are the
+    (space_id, geohash, latitude, longitude) of the proposal before and after
+    the change, or None when the proposal wasn't or isn't on the map.
+    """
+    if old == new:
+        return
+    if old is not None:
+        _update_clusters(old[0], old[1], old[2], old[3], -1)
+    if new is not None:
+        _update_clusters(new[0], new[1], new[2], new[3], 1)
+
+
+@transaction.commit_on_success
+def rebuild(spaces=None):
+    """
+    Recalculate the geohash of the proposals and the cluster counters from
+    scratch. The clusters are added up in memory and inserted at once.
+
+    :rtype: number of geolocated proposals
+    """
+    proposals = Proposal.objects.all()
+    clusters = ProposalCluster.objects.all()
+    if spaces is not None:
+        proposals = proposals.filter(space__in=spaces)
+        clusters = clusters.filter(space__in=spaces)
+    proposals.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True)) \
+        .update(geohash=None)
+    located = proposals.filter(latitude__isnull=False, longitude__isnull=False)
+    rows = [(encode(lat, lon), pk) for pk, lat, lon in
+            located.values_list('pk', 'latitude', 'longitude').iterator()]
+    qn = connection.ops.quote_name
+    opts = Proposal._meta
+    cursor = connection.cursor()
+    cursor.executemany("UPDATE %s SET %s = %%s WHERE %s = %%s" % (
+        qn(opts.db_table), qn(opts.get_field('geohash').column),
+        qn(opts.pk.column)), rows)
+
+    clusters.delete()
+    counts = located.filter(space__isnull=False).values_list(
+        'space', 'geohash', 'latitude', 'longitude')
+    totals = {}
+    for space_id, geohash, latitude, longitude in counts.iterator():
+        for level in range(1, PROPOSAL_CLUSTER_LEVELS + 1):
+            total = totals.setdefault((space_id, level, geohash[:level]),
+                                      [0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += float(latitude)
+            total[2] += float(longitude)
+    cluster_opts = ProposalCluster._meta
+    insert_rows(cluster_opts.db_table,
+                [cluster_opts.get_field(name).column for name in
+                 ('space', 'level', 'cell', 'count', 'latitude_sum',
+                  'longitude_sum')],
+                [key + tuple(total) for key, total in totals.iteritems()])
+    return len(rows)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the near-duplicate proposal search against the number of proposals,
+comparing the LSH index with comparing the text of every proposal. All the
+benchmark data is deleted at the end.
+
+Usage: python manage.py benchmark_duplicates --proposals=100000
+"""
+
+import time
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.proposals import duplicates
+from e_cidadania.apps.proposals.models import Proposal, ProposalFingerprint
+from e_cidadania.apps.spaces.models import Space
+
+
+class Command(BaseCommand):
+
+    """
+    Create proposals with random text, then look for slightly reworded
+    copies of some of them.
+    """
+    help = "Benchmark the near-duplicate proposal search."
+    option_list = BaseCommand.option_list + (
+        make_option('--proposals', dest='proposals', type='int', default=100000,
+                    help='Number of proposals to create.'),
+        make_option('--lookups', dest='lookups', type='int', default=20,
+                    help='Number of searches.'),
+        make_option('--skip-legacy', dest='skip_legacy', action='store_true',
+                    default=False, help="Don't time the full text comparison."),
+    )
+
+    def handle(self, *args, **options):
+        stamp = int(time.time())
+        words = ['w%s' % random.randint(0, 10 ** 6) for i in range(5000)]
+        space = Space.objects.create(name='benchmark-%s' % stamp,
+                                     url='benchmark_%s' % stamp)
+        try:
+            start = time.time()
+            texts = self.fill(space, stamp, words, options['proposals'])
+            self.stdout.write("Created and indexed %s proposals in %.1f s\n"
+                              % (options['proposals'], time.time() - start))
+
+            found, elapsed = 0, 0
+            for i in range(options['lookups']):
+                title, description = self.reword(random.choice(texts), words)
+                begin = time.time()
+                found += bool(duplicates.find_similar(space, title,
+                                                        description))
+                elapsed += time.time() - begin
+            self.stdout.write("index: %.2f ms per search, %s of %s found\n" % (
+                elapsed * 1000 / options['lookups'], found, options['lookups']))
+
+            if not options['skip_legacy']:
+                title, description = self.reword(random.choice(texts), words)
+                begin = time.time()
+                hashes = duplicates.shingles(title, description)
+                for t, d in Proposal.objects.filter(space=space) \
+                    .values_list('title', 'description').iterator():
+                    duplicates.similarity(hashes, duplicates.shingles(t, d))
+                self.stdout.write("full scan: %.2f ms per search\n" %
+                                  ((time.time() - begin) * 1000))
+        finally:
+            self.cleanup(space)
+
+    def reword(self, text, words):
+        """
+        Change about a tenth of the words of the description.
+        """
+        title, description = text
+        description = description.split()
+        for i in random.sample(range(len(description)), len(description) // 10):
+            description[i] = random.choice(words)
+        return title + ' bis', ' '.join(description)
+
+    @transaction.commit_on_success
+    def fill(self, space, stamp, words, count):
+        texts = [('bench-%s-%s %s' % (stamp, i, ' '.join(random.sample(words, 5))),
+                  ' '.join(random.sample(words, 40))) for i in range(count)]
+        bulk_insert([Proposal(title=title, description=description,
+                              space=space) for title, description in texts])
+        duplicates.rebuild(Proposal.objects.filter(space=space))
+        return texts
+
+    @transaction.commit_on_success
+    def cleanup(self, space):
+        """
+        Delete the benchmark proposals, fingerprints and space.
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM %s WHERE %s IN (SELECT %s FROM %s WHERE "
+                       "%s = %%s)" % (qn(ProposalFingerprint._meta.db_table),
+                                      qn('proposal_id'), qn('id'),
+                                      qn(Proposal._meta.db_table),
+                                      qn('space_id')), [space.pk])
+        cursor.execute("DELETE FROM %s WHERE %s = %%s" % (
+            qn(Proposal._meta.db_table), qn('space_id')), [space.pk])
+        space.delete()
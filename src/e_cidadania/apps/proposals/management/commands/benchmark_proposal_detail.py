@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the cost of reading the support votes of a proposal as the proposals
+and votes tables grow, comparing the old full-table aggregate with the stored
+counter. All the benchmark data is deleted at the end.
+
+Usage: python manage.py benchmark_proposal_detail --proposals=50000 --votes=2000000
+"""
+
+import time
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from e_cidadania.bulk import bulk_insert, insert_rows
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.spaces.models import Space
+
+
+class Command(BaseCommand):
+
+    """
+    Fill a benchmark space with proposals and votes in several steps and time
+    the support vote lookup of random proposals after every step.
+    """
+    help = "Benchmark the proposal support vote lookup against the table size."
+    option_list = BaseCommand.option_list + (
+        make_option('--proposals', dest='proposals', type='int', default=50000,
+                    help='Total number of proposals to create.'),
+        make_option('--votes', dest='votes', type='int', default=2000000,
+                    help='Total number of support votes to create.'),
+        make_option('--steps', dest='steps', type='int', default=5,
+                    help='Number of measures while the tables grow.'),
+        make_option('--lookups', dest='lookups', type='int', default=20,
+                    help='Number of proposals looked up in every measure.'),
+        make_option('--skip-legacy', dest='skip_legacy', action='store_true',
+                    default=False, help="Don't time the full-table aggregate."),
+    )
+
+    def handle(self, *args, **options):
+        stamp = int(time.time())
+        steps = options['steps']
+        voters = max(1, options['votes'] // max(1, options['proposals']))
+        space = Space.objects.create(name='benchmark-%s' % stamp,
+                                     url='benchmark_%s' % stamp)
+        bulk_insert([User(username='bench-%s-%s' % (stamp, i))
+                     for i in range(voters)])
+        users = list(User.objects.filter(username__startswith='bench-%s-' % stamp)
+                     .values_list('pk', flat=True))
+        votes_table = Proposal.support_votes.through._meta.db_table
+        created = 0
+        try:
+            self.stdout.write("proposals\tvotes\tstored (ms)\tlegacy (ms)\n")
+            for step in range(1, steps + 1):
+                target = options['proposals'] * step // steps
+                self.fill(space, stamp, created, target, users, votes_table)
+                created = target
+
+                ids = list(Proposal.objects.filter(space=space)
+                           .values_list('pk', flat=True))
+                sample = random.sample(ids, min(options['lookups'], len(ids)))
+                stored = self.measure(lambda pk:
+                    Proposal.objects.get(pk=pk).support_count, sample)
+                legacy = '-'
+                if not options['skip_legacy']:
+                    # The old view indexed the annotated table by position
+                    positions = dict((pk, i) for i, pk in enumerate(
+                        Proposal.objects.values_list('pk', flat=True)))
+                    legacy = '%.2f' % self.measure(lambda pk:
+                        Proposal.objects.annotate(Count('support_votes'))
+                        [positions[pk]].support_votes__count, sample)
+                self.stdout.write("%s\t\t%s\t%.2f\t\t%s\n" % (created,
+                                  created * len(users), stored, legacy))
+        finally:
+            self.cleanup(space, stamp, votes_table)
+
+    def measure(self, lookup, sample):
+        """
+        Average milliseconds of the lookup for every proposal in the sample.
+        """
+        start = time.time()
+        for pk in sample:
+            lookup(pk)
+        return (time.time() - start) * 1000 / len(sample)
+
+    @transaction.commit_on_success
+    def fill(self, space, stamp, start, end, users, votes_table):
+        """
+        Create the proposals from start to end and give them one vote from
+        every benchmark user.
+        """
+        last = Proposal.objects.aggregate(last=Max('pk'))['last'] or 0
+        bulk_insert([Proposal(title='bench-%s-%s' % (stamp, i),
+                              description='Benchmark proposal', space=space)
+                     for i in range(start, end)])
+        new = Proposal.objects.filter(space=space, pk__gt=last)
+        ids = list(new.values_list('pk', flat=True))
+        for i in range(0, len(ids), 1000):
+            insert_rows(votes_table, ('proposal_id', 'user_id'),
+                        [(pk, user) for pk in ids[i:i + 1000] for user in users])
+        new.update(support_count=len(users))
+
+    @transaction.commit_on_success
+    def cleanup(self, space, stamp, votes_table):
+        """
+        Delete the benchmark proposals, votes, users and space.
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM %s WHERE %s IN (SELECT %s FROM %s WHERE %s = %%s)"
+                       % (qn(votes_table), qn('proposal_id'), qn('id'),
+                          qn(Proposal._meta.db_table), qn('space_id')), [space.pk])
+        cursor.execute("DELETE FROM %s WHERE %s = %%s" % (
+            qn(Proposal._meta.db_table), qn('space_id')), [space.pk])
+        User.objects.filter(username__startswith='bench-%s-' % stamp).delete()
+        space.delete()
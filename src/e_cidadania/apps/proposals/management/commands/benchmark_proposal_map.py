@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measure the proposal map requests on a space with many geolocated proposals,
+comparing the cluster endpoint with loading every proposal of the space. All
+the benchmark data is deleted at the end.
+
+Usage: python manage.py benchmark_proposal_map --proposals=100000
+"""
+
+import time
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+from django.db import connection, transaction
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.proposals import geo
+from e_cidadania.apps.proposals.models import Proposal, ProposalCluster
+from e_cidadania.apps.proposals.views import proposal_map
+from e_cidadania.apps.spaces.models import Space
+
+# Area of the benchmark proposals, a city about 20 km wide
+CENTER = (40.42, -3.70)
+RADIUS = 0.1
+
+# (zoom, half size of the viewport in degrees)
+VIEWS = ((10, 0.2), (12, 0.05), (14, 0.0125), (16, 0.003))
+
+
+class Command(BaseCommand):
+
+    """
+    Create a benchmark space with geolocated proposals and time the map
+    requests at several zoom levels.
+    """
+    help = "Benchmark the proposal map against the number of proposals."
+    option_list = BaseCommand.option_list + (
+        make_option('--proposals', dest='proposals', type='int', default=100000,
+                    help='Number of geolocated proposals to create.'),
+        make_option('--requests', dest='requests', type='int', default=20,
+                    help='Number of map requests at every zoom level.'),
+    )
+
+    def handle(self, *args, **options):
+        stamp = int(time.time())
+        space = Space.objects.create(name='benchmark-%s' % stamp,
+                                     url='benchmark_%s' % stamp)
+        try:
+            start = time.time()
+            self.fill(space, stamp, options['proposals'])
+            self.stdout.write("Created and indexed %s proposals in %.1f s\n\n"
+                              % (options['proposals'], time.time() - start))
+
+            factory = RequestFactory()
+            url = reverse('proposal-map', kwargs={'space_name': space.url})
+            self.stdout.write("zoom\tmap (ms)\tsize (KB)\n")
+            for zoom, size in VIEWS:
+                elapsed, length = 0, 0
+                for i in range(options['requests']):
+                    lat = CENTER[0] + random.uniform(-RADIUS, RADIUS)
+                    lon = CENTER[1] + random.uniform(-RADIUS, RADIUS)
+                    request = factory.get(url, {'zoom': zoom,
+                        'bbox': '%s,%s,%s,%s' % (lon - size, lat - size,
+                                                 lon + size, lat + size)})
+                    begin = time.time()
+                    length += len(proposal_map(request, space.url).content)
+                    elapsed += time.time() - begin
+                self.stdout.write("%s\t%.2f\t\t%.1f\n" % (zoom,
+                    elapsed * 1000 / options['requests'],
+                    length / 1024.0 / options['requests']))
+
+            begin = time.time()
+            length = len(repr(list(Proposal.objects.filter(space=space)
+                .values_list('pk', 'latitude', 'longitude', 'title'))))
+            self.stdout.write("all\t%.2f\t\t%.1f\t(every proposal)\n" % (
+                (time.time() - begin) * 1000, length / 1024.0))
+        finally:
+            self.cleanup(space)
+
+    @transaction.commit_on_success
+    def fill(self, space, stamp, count):
+        bulk_insert([Proposal(title='bench-%s-%s' % (stamp, i),
+                              description='Benchmark proposal', space=space,
+                              latitude='%.6f' % (CENTER[0] + random.gauss(0, RADIUS / 2)),
+                              longitude='%.6f' % (CENTER[1] + random.gauss(0, RADIUS / 2)))
+                     for i in range(count)])
+        geo.rebuild([space])
+
+    @transaction.commit_on_success
+    def cleanup(self, space):
+        """
+        Delete the benchmark proposals, clusters and space.
+        """
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM %s WHERE %s = %%s" % (
+            qn(Proposal._meta.db_table), qn('space_id')), [space.pk])
+        ProposalCluster.objects.filter(space=space).delete()
+        space.delete()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Write the buffered support votes to the database. Useful from cron when the
+vote buffer is shared through the journal file, so the votes don't wait for
+the next vote to be written.
+
+Usage: python manage.py flush_votes
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from e_cidadania.apps.proposals.votes import get_vote_buffer
+
+
+class Command(NoArgsCommand):
+
+    """
+    Flush the vote buffer configured in PROPOSAL_VOTE_BUFFER.
+    """
+    help = "Write the buffered support votes to the database."
+
+    def handle_noargs(self, **options):
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is None:
+            self.stdout.write("PROPOSAL_VOTE_BUFFER is not set, nothing to do.\n")
+            return
+        self.stdout.write("Wrote %s votes.\n" % vote_buffer.flush())
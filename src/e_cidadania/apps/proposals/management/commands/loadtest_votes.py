@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load test for the vote_proposal view. Several threads send votes at the same
+time, writing them directly or through a vote buffer, and the sustained votes
+per second are reported. All the test data is deleted at the end.
+
+Usage: python manage.py loadtest_votes --votes=5000 --threads=8 --mode=memory
+"""
+
+import time
+import threading
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.client import RequestFactory
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.proposals import views
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.proposals.votes import VoteBuffer, JournalVoteBuffer
+
+
+class Command(BaseCommand):
+
+    """
+    Send votes from several threads through vote_proposal and measure the
+    votes per second with the selected ingestion mode.
+    """
+    help = "Load test the support vote ingestion."
+    option_list = BaseCommand.option_list + (
+        make_option('--votes', dest='votes', type='int', default=5000,
+                    help='Total number of votes to send.'),
+        make_option('--threads', dest='threads', type='int', default=8,
+                    help='Number of concurrent voters.'),
+        make_option('--proposals', dest='proposals', type='int', default=50,
+                    help='Number of proposals to vote.'),
+        make_option('--mode', dest='mode', default='direct',
+                    help="Vote ingestion: 'direct', 'memory' or 'journal'."),
+        make_option('--journal', dest='journal', default='/tmp/loadtest_votes.journal',
+                    help="Journal file for the 'journal' mode."),
+    )
+
+    def handle(self, *args, **options):
+        stamp = int(time.time())
+        threads = options['threads']
+        voters = max(1, options['votes'] // options['proposals'])
+        bulk_insert([User(username='loadtest-%s-%s' % (stamp, i))
+                     for i in range(voters)])
+        bulk_insert([Proposal(title='loadtest-%s-%s' % (stamp, i),
+                              description='Load test proposal')
+                     for i in range(options['proposals'])])
+        users = list(User.objects.filter(username__startswith='loadtest-%s-' % stamp))
+        proposals = list(Proposal.objects.filter(title__startswith='loadtest-%s-' % stamp)
+                         .values_list('pk', flat=True))
+        votes = [(user, prop) for user in users for prop in proposals]
+
+        if options['mode'] == 'memory':
+            vote_buffer = VoteBuffer()
+        elif options['mode'] == 'journal':
+            vote_buffer = JournalVoteBuffer(path=options['journal'])
+        else:
+            vote_buffer = None
+        views.get_vote_buffer = lambda: vote_buffer
+
+        factory = RequestFactory()
+        errors = []
+
+        def voter(votes):
+            try:
+                for user, prop in votes:
+                    request = factory.post('/', {'propid': prop})
+                    request.user = user
+                    views.vote_proposal(request, 'loadtest')
+            except Exception, e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=voter, args=(votes[i::threads],))
+                   for i in range(threads)]
+        try:
+            start = time.time()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            if vote_buffer is not None:
+                vote_buffer.flush()
+            elapsed = time.time() - start
+
+            written = Proposal.support_votes.through.objects.filter(
+                proposal__in=proposals).count()
+            self.stdout.write("mode: %s, threads: %s\n" % (options['mode'], threads))
+            self.stdout.write("%s votes written in %.2f s: %.1f votes/s\n" %
+                              (written, elapsed, len(votes) / elapsed))
+            if errors:
+                self.stdout.write("%s voters failed: %s\n" % (len(errors), errors[0]))
+        finally:
+            Proposal.support_votes.through.objects.filter(
+                proposal__in=proposals).delete()
+            Proposal.objects.filter(pk__in=proposals).delete()
+            User.objects.filter(username__startswith='loadtest-%s-' % stamp).delete()
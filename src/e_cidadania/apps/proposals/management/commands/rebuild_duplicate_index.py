@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recalculate the near-duplicate index of the proposals. The index is updated
+when proposals are saved one by one, this is only needed after loading
+proposals directly in the database or changing PROPOSAL_MINHASH_BANDS or
+PROPOSAL_MINHASH_ROWS.
+
+Usage: python manage.py rebuild_duplicate_index [space_url ...]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.proposals.duplicates import rebuild
+
+
+class Command(BaseCommand):
+
+    """
+    Index all the proposals or the proposals of the given spaces.
+    """
+    args = '[space_url ...]'
+    help = "Recalculate the near-duplicate index of the proposals."
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        proposals = None
+        if args:
+            proposals = Proposal.objects.filter(space__url__in=args)
+        self.stdout.write("Indexed %s proposals.\n" % rebuild(proposals))
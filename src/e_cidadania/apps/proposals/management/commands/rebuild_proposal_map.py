@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recalculate the geohash of the proposals and the proposal map clusters. The
+clusters are updated when proposals are saved or deleted one by one, this is
+only needed after loading or changing proposals directly in the database.
+
+Usage: python manage.py rebuild_proposal_map [space_url ...]
+"""
+
+from django.core.management.base import BaseCommand
+
+from e_cidadania.apps.proposals.geo import rebuild
+from e_cidadania.apps.spaces.models import Space
+
+
+class Command(BaseCommand):
+
+    """
+    Rebuild the map of all the proposals or the proposals of the given spaces.
+    """
+    args = '[space_url ...]'
+    help = "Recalculate the geohash and the map clusters of the proposals."
+
+    def handle(self, *args, **options):
+        spaces = None
+        if args:
+            spaces = list(Space.objects.filter(url__in=args))
+        self.stdout.write("Indexed %s geolocated proposals.\n" % rebuild(spaces))
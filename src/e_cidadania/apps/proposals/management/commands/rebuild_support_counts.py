@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Recalculate the stored support vote counter of every proposal.
+
+Usage: python manage.py rebuild_support_counts
+"""
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from e_cidadania.apps.proposals.models import Proposal
+
+
+class Command(NoArgsCommand):
+
+    """
+    Rebuild Proposal.support_count from the support_votes table. The counter
+    is maintained by signals, but it can get out of sync if the votes table
+    is modified directly.
+    """
+    help = "Recalculate the support vote counter of all the proposals."
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        updated = Proposal.objects.rebuild_support_counts()
+        self.stdout.write("Updated %s proposals.\n" % updated)
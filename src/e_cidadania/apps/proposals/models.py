@@ -24,7 +24,10 @@ Proposal data models are the ones to store the data inside the DB.
 
 import datetime
 
-from django.db import models
+from django.db import models, connection, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_init, post_save, \
+    post_delete
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
@@ -59,6 +62,44 @@ class Category(BaseClass):
     """
     pass
 
+class ProposalManager(models.Manager):
+
+    """
+    Manager for the proposals. It maintains the denormalized support vote
+    counter of the proposals.
+    """
+    def rebuild_support_counts(self, proposals=None):
+        """
+        Recalculate the stored support vote counter from the support_votes
+        table with a single UPDATE statement. If a list of proposal ids is
+        given only those proposals are recalculated.
+
+        :rtype: number of updated proposals
+        """
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        through = opts.get_field('support_votes').rel.through._meta
+        sql = "UPDATE %(table)s SET %(count)s = (SELECT COUNT(*) FROM " \
+              "%(votes)s WHERE %(votes)s.%(fk)s = %(table)s.%(pk)s)" % {
+                  'table': qn(opts.db_table),
+                  'count': qn(opts.get_field('support_count').column),
+                  'votes': qn(through.db_table),
+                  'fk': qn(through.get_field('proposal').column),
+                  'pk': qn(opts.pk.column)}
+        params = []
+        if proposals is not None:
+            proposals = list(proposals)
+            if not proposals:
+                return 0
+            sql += " WHERE %s IN (%s)" % (qn(opts.pk.column),
+                                          ', '.join(['%s'] * len(proposals)))
+            params = proposals
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        transaction.commit_unless_managed()
+        return cursor.rowcount
+
+
 class Proposal(models.Model):
 
     """
@@ -89,6 +130,9 @@ class Proposal(models.Model):
                                    max_digits=8, decimal_places=6)
     longitude = models.DecimalField(_('Longitude'), blank=True, null=True,
                                     max_digits=8, decimal_places=6)
+    # Spatial index key maintained by e_cidadania.apps.proposals.geo
+    geohash = models.CharField(_('Geohash'), max_length=12, blank=True,
+                               null=True, editable=False)
     closed = models.NullBooleanField(default=False, blank=True)
     closed_by = models.ForeignKey(User, blank=True, null=True,
                                   related_name='proposal_closed_by')
@@ -97,15 +141,34 @@ class Proposal(models.Model):
     anon_allowed = models.NullBooleanField(default=False, blank=True)
     support_votes = models.ManyToManyField(User, verbose_name=_('Votes from'),
                                             null=True, blank=True)
+    support_count = models.PositiveIntegerField(_('Support votes'), default=0,
+                                                editable=False)
+    # Ranking keys maintained by e_cidadania.apps.proposals.ranking
+    hot_score = models.FloatField(_('Hot score'), default=0, editable=False)
+    trending_score = models.FloatField(_('Trending score'), default=0,
+                                       editable=False)
     refurbished = models.NullBooleanField(default=False, blank=True)
     budget = models.IntegerField(blank=True, null=True)
 
     pub_date = models.DateTimeField(auto_now_add=True)
     mod_date = models.DateTimeField(auto_now_add=True)
 
+    objects = ProposalManager()
+
     def __unicode__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            from e_cidadania.apps.proposals.ranking import hot_score
+            self.hot_score = hot_score(self.support_count,
+                                       self.pub_date or datetime.datetime.now())
+        self.geohash = None
+        if self.latitude is not None and self.longitude is not None:
+            from e_cidadania.apps.proposals.geo import encode
+            self.geohash = encode(self.latitude, self.longitude)
+        super(Proposal, self).save(*args, **kwargs)
+
     def set_tags(self, tags):
         Tag.objects.update_tags(self, tags)
 
@@ -125,3 +188,142 @@ class Proposal(models.Model):
         return ('view-proposal', (), {
             'space_name': self.space.url,
             'prop_id': str(self.id)})
+
+    def map_position(self):
+        """
+        Returns the (space_id, geohash, latitude, longitude) of the proposal
+        as it is counted in the map clusters, or None if it isn't on the map.
+        """
+        if self.geohash and self.space_id:
+            return (self.space_id, self.geohash, float(self.latitude),
+                    float(self.longitude))
+        return None
+
+
+class ProposalCluster(models.Model):
+
+    """
+    Number of proposals of a space inside a geohash cell. There is a cluster
+    for every cell with proposals at every level (cell length) from 1 to
+    PROPOSAL_CLUSTER_LEVELS, so the proposal map doesn't have to count the
+    proposals on every request.
+
+    The coordinates are stored as sums so adding or removing a proposal is a
+    single UPDATE. The centroid of the cluster is their average.
+
+    .. versionadded:: 0.1.5
+    """
+    space = models.ForeignKey(Space)
+    level = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=12)
+    count = models.IntegerField(default=0)
+    latitude_sum = models.FloatField(default=0)
+    longitude_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('space', 'level', 'cell')
+
+    def __unicode__(self):
+        return u'%s (%s)' % (self.cell, self.count)
+
+    def centroid(self):
+        return self.latitude_sum / self.count, self.longitude_sum / self.count
+
+
+def update_support_count(sender, instance, action, reverse, pk_set, **kwargs):
+
+    """
+    Keep Proposal.support_count in sync with the support_votes relation.
+    Added votes increment the counter atomically. Removed or cleared votes
+    recalculate the counter of the affected proposals, since the removed ids
+    may not have been voted. The ranking scores are updated after that.
+    """
+    from e_cidadania.apps.proposals import ranking
+
+    if action == 'post_add' and pk_set:
+        if reverse:
+            Proposal.objects.filter(pk__in=pk_set).update(
+                support_count=F('support_count') + 1)
+            ranking.register_votes(dict((pk, 1) for pk in pk_set))
+        else:
+            Proposal.objects.filter(pk=instance.pk).update(
+                support_count=F('support_count') + len(pk_set))
+            ranking.register_votes({instance.pk: len(pk_set)})
+    elif action == 'pre_clear' and reverse:
+        # Remember which proposals the user voted before losing the votes
+        instance._cleared_proposals = list(
+            instance.proposal_set.values_list('pk', flat=True))
+    elif action in ('post_remove', 'post_clear'):
+        if not reverse:
+            proposals = [instance.pk]
+        elif action == 'post_remove':
+            proposals = pk_set or []
+        else:
+            proposals = list(getattr(instance, '_cleared_proposals', []))
+        for i in range(0, len(proposals), 500):
+            Proposal.objects.rebuild_support_counts(proposals[i:i + 500])
+            ranking.rerank(Proposal.objects.filter(pk__in=proposals[i:i + 500]))
+
+m2m_changed.connect(update_support_count,
+                    sender=Proposal.support_votes.through)
+
+
+class ProposalFingerprint(models.Model):
+
+    """
+    Hash of one band of the MinHash signature of a proposal text, used by
+    e_cidadania.apps.proposals.duplicates to find similar proposals.
+
+    .. versionadded:: 0.1.5
+    """
+    proposal = models.ForeignKey(Proposal)
+    band = models.PositiveSmallIntegerField()
+    bucket = models.IntegerField()
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.band, self.bucket)
+
+
+def remember_map_position(sender, instance, **kwargs):
+    instance._map_position = instance.map_position()
+
+
+def update_map_clusters(sender, instance, **kwargs):
+
+    """
+    Keep the ProposalCluster counters in sync when a proposal is created,
+    moved or deleted. Queryset update() and delete() calls are not seen,
+    run the rebuild_proposal_map command after them.
+    """
+    from e_cidadania.apps.proposals import geo
+
+    old = getattr(instance, '_map_position', None)
+    new = None
+    if kwargs.get('signal') is post_save:
+        new = instance.map_position()
+    geo.move(old, new)
+    instance._map_position = new
+
+
+def remember_indexed_text(sender, instance, **kwargs):
+    instance._indexed_text = (instance.title, instance.description)
+
+
+def update_fingerprints(sender, instance, created, **kwargs):
+
+    """
+    Index the text of new proposals and of the proposals whose title or
+    description changed in the near-duplicate index.
+    """
+    from e_cidadania.apps.proposals import duplicates
+
+    text = (instance.title, instance.description)
+    if created or text != getattr(instance, '_indexed_text', None):
+        duplicates.index(instance)
+        instance._indexed_text = text
+
+post_init.connect(remember_map_position, sender=Proposal)
+post_save.connect(update_map_clusters, sender=Proposal)
+post_init.connect(remember_indexed_text, sender=Proposal)
+post_save.connect(update_fingerprints, sender=Proposal)
+post_delete.connect(update_map_clusters, sender=Proposal)
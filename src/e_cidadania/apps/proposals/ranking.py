@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Proposal ranking. Every proposal stores three ranking keys that are updated
+as the votes arrive, so the ranked lists are plain index scans:
+
+* support: the number of support votes (Proposal.support_count).
+* hot: the support votes with a time decay, newer proposals go first when
+  they have the same support.
+* trending: the votes received recently. Every vote loses half its weight
+  every PROPOSAL_TRENDING_HALF_LIFE seconds.
+
+Both hot and trending are stored as keys measured against a fixed epoch
+instead of "now", so the order between proposals doesn't change with time
+and there is no need to recompute all the scores to make them decay.
+"""
+
+import math
+import datetime
+
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.proposals.settings import PROPOSAL_HOT_DECAY, \
+    PROPOSAL_TRENDING_HALF_LIFE
+
+EPOCH = datetime.datetime(2012, 1, 1)
+TRENDING_RATE = math.log(2) / PROPOSAL_TRENDING_HALF_LIFE
+
+# Sort name: Proposal field
+SORTS = {
+    'hot': 'hot_score',
+    'trending': 'trending_score',
+    'support': 'support_count',
+}
+
+
+def seconds_since_epoch(date):
+    delta = date - EPOCH
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def hot_score(support, pub_date):
+    """
+    Hot ranking key of a proposal with the given support votes published at
+    pub_date. Ten times more votes are worth PROPOSAL_HOT_DECAY seconds.
+    """
+    order = math.log10(max(support, 1))
+    return round(order + seconds_since_epoch(pub_date) / PROPOSAL_HOT_DECAY, 7)
+
+
+def add_trending_votes(score, votes, when=None):
+    """
+    Returns the trending key after adding the given votes at 'when'. The key
+    is log(sum(exp(rate * t))) for the time t of every vote, so adding a vote
+    is a logaddexp and the current vote rate is exp(key - rate * now).
+    """
+    when = when or datetime.datetime.now()
+    new = TRENDING_RATE * seconds_since_epoch(when) + math.log(votes)
+    if not score:
+        return new
+    high, low = max(score, new), min(score, new)
+    return high + math.log1p(math.exp(low - high))
+
+
+def trending_rate(score, when=None):
+    """
+    Current weight of the recent votes of a proposal with the given trending
+    key: one vote received now is worth 1.
+    """
+    if not score:
+        return 0.0
+    when = when or datetime.datetime.now()
+    return math.exp(score - TRENDING_RATE * seconds_since_epoch(when))
+
+
+def register_votes(votes, when=None):
+    """
+    Update the ranking keys of the proposals that received new votes. The
+    support_count must be already updated.
+
+    :param votes: dictionary {proposal id: number of new votes}
+    """
+    votes = dict((pk, n) for pk, n in votes.items() if n > 0)
+    ids = votes.keys()
+    for i in range(0, len(ids), 500):
+        for pk, support, pub_date, trending in Proposal.objects \
+            .filter(pk__in=ids[i:i + 500]) \
+            .values_list('pk', 'support_count', 'pub_date', 'trending_score'):
+            Proposal.objects.filter(pk=pk).update(
+                hot_score=hot_score(support, pub_date),
+                trending_score=add_trending_votes(trending, votes[pk], when))
+
+
+def rerank(proposals):
+    """
+    Recalculate the hot key of the given proposals from their support and
+    publication date. The trending key can't be rebuilt since the vote dates
+    are not stored, so it's left untouched.
+
+    :rtype: number of updated proposals
+    """
+    updated = 0
+    for pk, support, pub_date, score in proposals.values_list('pk',
+        'support_count', 'pub_date', 'hot_score').iterator():
+        new = hot_score(support, pub_date)
+        if new != score:
+            Proposal.objects.filter(pk=pk).update(hot_score=new)
+            updated += 1
+    return updated
@@ -0,0 +1,62 @@
+"""
+Convenience module for access of custom proposals application settings,
+which enforces default settings when the main settings module does not
+contain the appropriate settings.
+"""
+import os
+
+from django.conf import settings
+
+# How support votes are written. None writes every vote to the database in
+# the request, 'memory' buffers the votes in the process and 'journal' also
+# appends them to a journal file shared by all the processes of the host.
+PROPOSAL_VOTE_BUFFER = getattr(settings, 'PROPOSAL_VOTE_BUFFER', None)
+
+# Buffered votes are written when there are this many of them...
+PROPOSAL_VOTE_BATCH_SIZE = getattr(settings, 'PROPOSAL_VOTE_BATCH_SIZE', 500)
+
+# ...or when this many seconds passed since the last write.
+PROPOSAL_VOTE_FLUSH_INTERVAL = getattr(settings, 'PROPOSAL_VOTE_FLUSH_INTERVAL', 2)
+
+# Journal file for the 'journal' vote buffer.
+PROPOSAL_VOTE_JOURNAL = getattr(settings, 'PROPOSAL_VOTE_JOURNAL',
+    os.path.join(os.path.dirname(settings.DATABASES['default']['NAME']) or '.',
+                 'votes.journal'))
+
+# Seconds of age that weigh as much as multiplying the support votes by ten
+# in the "hot" ranking.
+PROPOSAL_HOT_DECAY = getattr(settings, 'PROPOSAL_HOT_DECAY', 45000)
+
+# Half-life in seconds of a vote in the "trending" ranking.
+PROPOSAL_TRENDING_HALF_LIFE = getattr(settings, 'PROPOSAL_TRENDING_HALF_LIFE',
+                                      6 * 3600)
+
+# Number of proposals in every page of the ranked lists.
+PROPOSAL_RANKING_PAGE_SIZE = getattr(settings, 'PROPOSAL_RANKING_PAGE_SIZE', 50)
+
+# Length of the geohash stored for every geolocated proposal. 9 characters
+# locate the proposal within a few meters.
+PROPOSAL_GEOHASH_LENGTH = getattr(settings, 'PROPOSAL_GEOHASH_LENGTH', 9)
+
+# Number of clustering levels of the proposal map. The clusters of the last
+# level are about 40 meters wide.
+PROPOSAL_CLUSTER_LEVELS = getattr(settings, 'PROPOSAL_CLUSTER_LEVELS', 8)
+
+# The proposal map returns the proposals instead of the clusters when there
+# are at most this many of them in view.
+PROPOSAL_MAP_MAX_POINTS = getattr(settings, 'PROPOSAL_MAP_MAX_POINTS', 200)
+
+# Maximum number of clusters in an answer of the proposal map. The clustering
+# level is lowered until the map area fits in about this many cells.
+PROPOSAL_MAP_MAX_CLUSTERS = getattr(settings, 'PROPOSAL_MAP_MAX_CLUSTERS', 500)
+
+# MinHash signature of the near-duplicate proposal index: number of bands
+# and values per band. With 16 bands of 4 values two proposals are
+# candidates from about 50% of similarity.
+PROPOSAL_MINHASH_BANDS = getattr(settings, 'PROPOSAL_MINHASH_BANDS', 16)
+PROPOSAL_MINHASH_ROWS = getattr(settings, 'PROPOSAL_MINHASH_ROWS', 4)
+
+# Minimum similarity (0 to 1) of the text of two proposals to suggest them
+# as duplicates, and maximum number of suggestions.
+PROPOSAL_DUPLICATE_THRESHOLD = getattr(settings, 'PROPOSAL_DUPLICATE_THRESHOLD', 0.5)
+PROPOSAL_DUPLICATE_SUGGESTIONS = getattr(settings, 'PROPOSAL_DUPLICATE_SUGGESTIONS', 5)
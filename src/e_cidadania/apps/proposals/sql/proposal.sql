@@ -0,0 +1,13 @@
+-- Composite indexes for the ranked proposal lists. Every ranked list is
+-- filtered by space and sorted by (score, id), so these indexes make the
+-- first page and every following keyset page a short index scan.
+CREATE INDEX proposals_proposal_space_hot ON proposals_proposal (space_id, hot_score, id);
+CREATE INDEX proposals_proposal_space_trending ON proposals_proposal (space_id, trending_score, id);
+CREATE INDEX proposals_proposal_space_support ON proposals_proposal (space_id, support_count, id);
+
+-- Spatial index of the proposal map. The proposals inside an area are a few
+-- geohash prefix ranges of this index.
+CREATE INDEX proposals_proposal_space_geohash ON proposals_proposal (space_id, geohash);
+
+-- Keyset pagination of the proposal list by publication date.
+CREATE INDEX proposals_proposal_space_pub_date ON proposals_proposal (space_id, pub_date, id);
@@ -0,0 +1,3 @@
+-- Lookup index of the near-duplicate proposal search. Every query looks for
+-- the fingerprints with one of the (band, bucket) pairs of a text.
+CREATE INDEX proposals_proposalfingerprint_band_bucket ON proposals_proposalfingerprint (band, bucket);
@@ -24,7 +24,7 @@ Proposal module URLs.
 
 from django.conf.urls.defaults import *
 from e_cidadania.apps.proposals.views import ListProposals, ViewProposal, \
-    DeleteProposal, EditProposal, AddProposal
+    DeleteProposal, EditProposal, AddProposal, RankedProposals
 
 urlpatterns = patterns('e_cidadania.apps.proposals.views',
 
@@ -32,6 +32,11 @@ urlpatterns = patterns('e_cidadania.apps.proposals.views',
 
     url(r'^add/', AddProposal.as_view(), name='add-proposal'),
 
+    url(r'^ranking/(?P<sort>hot|trending|support)/$', RankedProposals.as_view(),
+        name='ranked-proposals'),
+
+    url(r'^map/$', 'proposal_map', name='proposal-map'),
+
     url(r'^(?P<prop_id>\w+)/edit/$', EditProposal.as_view(), name='edit-proposal'),
 
     url(r'^(?P<prop_id>\w+)/delete/$', DeleteProposal.as_view(), name='delete-proposal'),
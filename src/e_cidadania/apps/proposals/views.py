@@ -22,6 +22,8 @@
 Proposal module views.
 """
 
+import json
+
 # Generic class-based views
 from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
@@ -32,25 +34,34 @@ from django.shortcuts import render_to_response, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, permission_required
 from django.template import RequestContext
 from django.views.decorators.http import require_POST
-from django.db.models import Count
 from django.utils.decorators import method_decorator
 
 from django.views.generic.create_update import update_object
 from django.db.models import F
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 
+from e_cidadania.pagination import KeysetPaginationMixin
 from e_cidadania.apps.proposals.models import Proposal
 from e_cidadania.apps.proposals.forms import ProposalForm, VoteProposal
-from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.proposals.votes import get_vote_buffer
+from e_cidadania.apps.proposals.ranking import SORTS
+from e_cidadania.apps.proposals import geo
+from e_cidadania.apps.proposals.duplicates import find_similar
+from e_cidadania.apps.proposals.settings import PROPOSAL_RANKING_PAGE_SIZE, \
+    PROPOSAL_MAP_MAX_POINTS
+from e_cidadania.apps.spaces.resolver import SpaceMixin, get_space_or_404
 
 
-class AddProposal(FormView):
+class AddProposal(SpaceMixin, FormView):
 
     """
     Create a new proposal.
 
+    If there are proposals similar to the new one the form is shown again
+    with them, and the proposal is only published when sent again.
+
     :rtype: HTML Form
-    :context: form, get_place
+    :context: form, get_place, duplicates
     """
     form_class = ProposalForm
     template_name = 'proposals/proposal_add.html'
@@ -59,7 +70,14 @@ class AddProposal(FormView):
         return '/spaces/' + self.kwargs['space_name']
     
     def form_valid(self, form):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        if not self.request.POST.get('ignore_duplicates'):
+            similar = find_similar(self.get_space(),
+                                   form.cleaned_data['title'],
+                                   form.cleaned_data['description'])
+            if similar:
+                return self.render_to_response(self.get_context_data(
+                    form=form, duplicates=similar))
+        self.space = self.get_space()
         form_uncommited = form.save(commit=False)
         form_uncommited.space = self.space
         form_uncommited.author = self.request.user
@@ -68,7 +86,7 @@ class AddProposal(FormView):
     
     def get_context_data(self, **kwargs):
         context = super(AddProposal, self).get_context_data(**kwargs)
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         context['get_place'] = self.space
         return context
         
@@ -77,7 +95,7 @@ class AddProposal(FormView):
         return super(AddProposal, self).dispatch(*args, **kwargs)
 
 
-class ViewProposal(DetailView):
+class ViewProposal(SpaceMixin, DetailView):
 
     """
     Detail view of a proposal. Inherits from django :class:`DetailView` generic
@@ -95,14 +113,21 @@ class ViewProposal(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(ViewProposal, self).get_context_data(**kwargs)
-        support_votes_count = Proposal.objects.annotate(Count('support_votes'))
-        current_proposal = int(self.kwargs['prop_id']) - 1
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
-        context['support_votes_count'] = support_votes_count[current_proposal].support_votes__count
+        context['get_place'] = self.get_space()
+        context['support_votes_count'] = self.object.support_count
+        context['user_voted'] = self.request.user.is_authenticated() and \
+            self.object.support_votes.filter(pk=self.request.user.pk).exists()
+
+        # Show the votes that are still in the buffer
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is not None:
+            context['support_votes_count'] += vote_buffer.pending_count(self.object.pk)
+            context['user_voted'] = context['user_voted'] or \
+                vote_buffer.has_voted(self.request.user.pk, self.object.pk)
         return context
 
 
-class EditProposal(UpdateView):
+class EditProposal(SpaceMixin, UpdateView):
 
     """
     The proposal can be edited by space and global admins, but also by their
@@ -123,7 +148,7 @@ class EditProposal(UpdateView):
         
     def get_context_data(self, **kwargs):
         context = super(EditProposal, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
     @method_decorator(permission_required('proposals.edit_proposal'))
@@ -131,7 +156,7 @@ class EditProposal(UpdateView):
         return super(EditProposal, self).dispatch(*args, **kwargs)
                              
             
-class DeleteProposal(DeleteView):
+class DeleteProposal(SpaceMixin, DeleteView):
 
     """
     Delete a proposal.
@@ -148,7 +173,7 @@ class DeleteProposal(DeleteView):
 
     def get_context_data(self, **kwargs):
         context = super(DeleteProposal, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context                 
                   
            
@@ -156,8 +181,20 @@ class DeleteProposal(DeleteView):
 def vote_proposal(request, space_name):
 
     """
-    Increment support votes for the proposal in 1.
+    Increment support votes for the proposal in 1. If a vote buffer is
+    configured the vote is accepted into it and written later in a batch.
     """
+    vote_buffer = get_vote_buffer()
+    if vote_buffer is not None:
+        if not request.user.is_authenticated():
+            return HttpResponse("You must be logged in to vote.", status=403)
+        try:
+            prop_id = int(request.POST['propid'])
+        except (KeyError, ValueError):
+            raise Http404
+        vote_buffer.add(request.user.pk, prop_id)
+        return HttpResponse("Vote emmited.")
+
     prop = get_object_or_404(Proposal, pk=request.POST['propid'])
 #    if Proposal.objects.filter(support_votes__contains=request.user):
 #        return HttpResponse("You already voted")
@@ -166,7 +203,7 @@ def vote_proposal(request, space_name):
     return HttpResponse("Vote emmited.")
 
 
-class ListProposals(ListView):
+class ListProposals(SpaceMixin, KeysetPaginationMixin, ListView):
 
     """
     List all proposals stored whithin a space. Inherits from django :class:`ListView`
@@ -176,15 +213,95 @@ class ListProposals(ListView):
     :context: proposal
     """
     paginate_by = 50
+    keyset = 'pub_date'
+    count_timeout = 300
     context_object_name = 'proposal'
 
     def get_queryset(self):
-        place = get_object_or_404(Space, url=self.kwargs['space_name'])
-        objects = Proposal.objects.annotate(Count('support_votes')).filter(space=place.id).order_by('pub_date')
+        place = self.get_space()
+        objects = Proposal.objects.filter(space=place.id).order_by('pub_date')
         return objects
 
     def get_context_data(self, **kwargs):
         context = super(ListProposals, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
+        # Proposals of this page already supported by the user, in one query
+        user_votes = []
+        if self.request.user.is_authenticated():
+            user_votes = self.request.user.proposal_set.filter(
+                pk__in=[p.pk for p in context['object_list']]) \
+                .values_list('pk', flat=True)
+        context['user_votes'] = set(user_votes)
+
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is not None and self.request.user.is_authenticated():
+            context['user_votes'].update(
+                vote_buffer.pending_for_user(self.request.user.pk))
         return context
 
+
+class RankedProposals(ListProposals):
+
+    """
+    List the proposals of a space sorted by one of the rankings (hot,
+    trending or support), from best to worst.
+
+    :rtype: Object list
+    :context: proposal, get_place, sort
+    """
+    paginate_by = PROPOSAL_RANKING_PAGE_SIZE
+    count_timeout = None
+    template_name = 'proposals/proposal_list.html'
+
+    def get_keyset(self):
+        return '-' + SORTS[self.kwargs['sort']]
+
+    def get_context_data(self, **kwargs):
+        context = super(RankedProposals, self).get_context_data(**kwargs)
+        context['sort'] = self.kwargs['sort']
+        return context
+
+
+def proposal_map(request, space_name):
+
+    """
+    Returns the proposals of the space inside the map area as JSON. The area
+    comes in the 'bbox' GET parameter as "west,south,east,north" and the map
+    zoom in the 'zoom' parameter.
+
+    If there are more than PROPOSAL_MAP_MAX_POINTS proposals in the area the
+    answer has the clusters of the zoom level, lowered for large areas, as
+    [cell, count, latitude, longitude] lists, otherwise it has the proposals as [id, latitude,
+    longitude, title] lists.
+
+    .. versionadded:: 0.1.5
+    """
+    place = get_space_or_404(space_name)
+    try:
+        west, south, east, north = [float(v) for v in
+                                    request.GET['bbox'].split(',')]
+        zoom = int(request.GET.get('zoom', 0))
+    except (KeyError, ValueError):
+        return HttpResponse("Invalid bbox or zoom.", status=400)
+    # Also rejects nan, which fails every comparison
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and
+            -180 <= east <= 180):
+        return HttpResponse("Invalid bbox or zoom.", status=400)
+
+    level = min(geo.zoom_level(zoom), geo.max_level(south, west, north, east))
+    clusters = list(geo.clusters(place, level, south, west, north, east))
+    response_data = {'level': level, 'clusters': [], 'proposals': []}
+    if sum(c.count for c in clusters) > PROPOSAL_MAP_MAX_POINTS:
+        for c in clusters:
+            latitude, longitude = c.centroid()
+            response_data['clusters'].append(
+                [c.cell, c.count, round(latitude, 6), round(longitude, 6)])
+    else:
+        proposals = geo.in_bbox(Proposal.objects.filter(space=place),
+                                south, west, north, east)
+        response_data['proposals'] = [
+            [pk, float(latitude), float(longitude), title]
+            for pk, latitude, longitude, title in proposals.values_list(
+                'pk', 'latitude', 'longitude', 'title')[:PROPOSAL_MAP_MAX_POINTS]]
+    return HttpResponse(json.dumps(response_data, separators=(',', ':')),
+                        mimetype="application/json")
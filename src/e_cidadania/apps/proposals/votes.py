@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Buffered ingestion of proposal support votes. Instead of writing every vote
+in its own request, the votes are accepted into a buffer and written to the
+support_votes table in batches. The buffer is also checked when reading, so
+users see their own votes immediately.
+"""
+
+import os
+import fcntl
+import atexit
+import threading
+
+from django.db import connection, transaction
+
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.proposals.ranking import register_votes
+from e_cidadania.apps.spaces.stats import add_votes
+from e_cidadania.apps.proposals.settings import PROPOSAL_VOTE_BUFFER, \
+    PROPOSAL_VOTE_BATCH_SIZE, PROPOSAL_VOTE_FLUSH_INTERVAL, PROPOSAL_VOTE_JOURNAL
+
+# Maximum number of ids sent in a single IN clause
+CHUNK_SIZE = 500
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+@transaction.commit_on_success
+def write_votes(votes):
+    """
+    Write a batch of (user_id, proposal_id) votes to the support_votes table
+    in a single transaction. Votes for proposals that don't exist and votes
+    already in the table are skipped, so writing the same vote twice is
+    harmless. The support counters and the ranking of the voted proposals and
+    the vote counters of their spaces are updated.
+
+    :rtype: number of votes written
+    """
+    votes = set(votes)
+    if not votes:
+        return 0
+    proposals = set()
+    for ids in chunks(set(p for u, p in votes)):
+        proposals.update(Proposal.objects.filter(pk__in=ids)
+                         .values_list('pk', flat=True))
+    votes = [(p, u) for u, p in votes if p in proposals]
+
+    qn = connection.ops.quote_name
+    through = Proposal.support_votes.through._meta
+    table = qn(through.db_table)
+    proposal_col = qn(through.get_field('proposal').column)
+    user_col = qn(through.get_field('user').column)
+    sql = "INSERT INTO %s (%s, %s) SELECT %%s, %%s WHERE NOT EXISTS " \
+          "(SELECT 1 FROM %s WHERE %s = %%s AND %s = %%s)" % (
+              table, proposal_col, user_col, table, proposal_col, user_col)
+    cursor = connection.cursor()
+    cursor.executemany(sql, [(p, u, p, u) for p, u in votes])
+    written = cursor.rowcount
+
+    new_votes = {}
+    space_votes = {}
+    for ids in chunks(set(p for p, u in votes)):
+        voted = Proposal.objects.filter(pk__in=ids)
+        before = dict(voted.values_list('pk', 'support_count'))
+        Proposal.objects.rebuild_support_counts(ids)
+        for pk, support, space in voted.values_list('pk', 'support_count',
+                                                    'space'):
+            new_votes[pk] = support - before.get(pk, 0)
+            space_votes[space] = space_votes.get(space, 0) + new_votes[pk]
+    register_votes(new_votes)
+    add_votes(space_votes)
+    return written
+
+
+class VoteBuffer(object):
+
+    """
+    In-process vote buffer. Votes are idempotent per (user, proposal) and are
+    written with :func:`write_votes` when the buffer holds batch_size votes or
+    by a background timer flush_interval seconds after the first pending vote
+    was accepted.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, batch_size=PROPOSAL_VOTE_BATCH_SIZE,
+                 flush_interval=PROPOSAL_VOTE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.pending = set()
+        self.timer = None
+
+    def add(self, user_id, proposal_id):
+        """
+        Accept a vote. Returns False if the vote was already pending or is
+        already written.
+        """
+        vote = (user_id, proposal_id)
+        if self.has_voted(user_id, proposal_id):
+            return False
+        if Proposal.support_votes.through.objects.filter(
+                user=user_id, proposal=proposal_id).exists():
+            return False
+        with self.lock:
+            if vote in self.pending:
+                return False
+            self.store(vote)
+            self.pending.add(vote)
+            full = len(self.pending) >= self.batch_size
+            if not full:
+                self.schedule()
+        if full:
+            self.flush()
+        return True
+
+    def schedule(self):
+        """
+        Start the timer that writes the pending votes if it isn't running.
+        """
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval,
+                                             self.timed_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def timed_flush(self):
+        """
+        Timer callback. Runs in its own thread, so it closes the database
+        connection it opened and tries again later if writing failed.
+        """
+        with self.lock:
+            self.timer = None
+        try:
+            if self.pending_votes():
+                self.flush()
+        except Exception:
+            self.schedule()
+        finally:
+            connection.close()
+
+    def store(self, vote):
+        """
+        Hook for buffers that keep the votes somewhere else too.
+        """
+        pass
+
+    def take(self):
+        """
+        Empty the buffer and return the votes it had.
+        """
+        votes, self.pending = self.pending, set()
+        return votes
+
+    def restore(self, votes):
+        """
+        Put back in the buffer votes that couldn't be written.
+        """
+        self.pending.update(votes)
+
+    def flush(self):
+        """
+        Write all the pending votes. If writing fails the votes are kept in
+        the buffer for the next flush.
+
+        :rtype: number of votes written
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            votes = self.take()
+            try:
+                return write_votes(votes)
+            except:
+                self.restore(votes)
+                raise
+
+    def pending_votes(self):
+        with self.lock:
+            return set(self.pending)
+
+    def has_voted(self, user_id, proposal_id):
+        """
+        True if the user has a vote for the proposal waiting in the buffer.
+        """
+        return (user_id, proposal_id) in self.pending_votes()
+
+    def pending_for_user(self, user_id):
+        """
+        Ids of the proposals with votes of the user waiting in the buffer.
+        """
+        return set(p for u, p in self.pending_votes() if u == user_id)
+
+    def pending_count(self, proposal_id):
+        """
+        Number of votes for the proposal waiting in the buffer.
+        """
+        return len([u for u, p in self.pending_votes() if p == proposal_id])
+
+
+class JournalVoteBuffer(VoteBuffer):
+
+    """
+    Vote buffer shared by all the processes of the host. Every accepted vote
+    is appended to a journal file before answering, so no vote is lost if
+    the process dies, and any process can write the votes of all of them.
+
+    Each process keeps the pending votes in memory and only reads the bytes
+    other processes appended since it last looked. A flush removes the
+    journal file instead of truncating it, so the processes notice it by the
+    inode changing.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, path=PROPOSAL_VOTE_JOURNAL, **kwargs):
+        super(JournalVoteBuffer, self).__init__(**kwargs)
+        self.path = path
+        # Journal file and bytes of it already merged into self.pending
+        self.inode = None
+        self.offset = 0
+
+    def open(self, mode, lock):
+        """
+        Open and lock the current journal file. If another process removed
+        the file while we waited for the lock, open the new one. Returns
+        None if there's no journal and it isn't opened for writing.
+        """
+        while True:
+            try:
+                journal = open(self.path, mode)
+            except IOError:
+                return None
+            fcntl.flock(journal, lock)
+            try:
+                if os.stat(self.path).st_ino == os.fstat(journal.fileno()).st_ino:
+                    return journal
+            except OSError:
+                pass
+            journal.close()
+
+    def store(self, vote):
+        journal = self.open('a', fcntl.LOCK_EX)
+        try:
+            journal.write('%s %s\n' % vote)
+        finally:
+            journal.close()
+
+    def refresh(self):
+        """
+        Merge into the pending set the votes appended to the journal since
+        the last call. If the journal was flushed the pending set starts over.
+        """
+        journal = self.open('r', fcntl.LOCK_SH)
+        if journal is None:
+            self.pending, self.inode, self.offset = set(), None, 0
+            return
+        try:
+            inode = os.fstat(journal.fileno()).st_ino
+            if inode != self.inode:
+                self.pending, self.inode, self.offset = set(), inode, 0
+            journal.seek(self.offset)
+            for line in journal:
+                if not line.endswith('\n'):
+                    # Still being written, read it again next time
+                    break
+                self.offset += len(line)
+                try:
+                    user_id, proposal_id = line.split()
+                    self.pending.add((int(user_id), int(proposal_id)))
+                except ValueError:
+                    # A vote could be half written if a process died
+                    continue
+        finally:
+            journal.close()
+
+    def take(self):
+        """
+        Returns all the votes in the journal and removes it.
+        """
+        self.pending, self.inode, self.offset = set(), None, 0
+        journal = self.open('r', fcntl.LOCK_EX)
+        if journal is None:
+            return set()
+        try:
+            votes = set()
+            for line in journal:
+                try:
+                    user_id, proposal_id = line.split()
+                    votes.add((int(user_id), int(proposal_id)))
+                except ValueError:
+                    continue
+            os.remove(self.path)
+            return votes
+        finally:
+            journal.close()
+
+    def restore(self, votes):
+        for vote in votes:
+            self.store(vote)
+
+    def pending_votes(self):
+        with self.lock:
+            self.refresh()
+            return set(self.pending)
+
+
+_buffer = None
+
+def get_vote_buffer():
+    """
+    Returns the vote buffer configured in PROPOSAL_VOTE_BUFFER or None if the
+    votes are written directly.
+    """
+    global _buffer
+    if _buffer is None and PROPOSAL_VOTE_BUFFER:
+        if PROPOSAL_VOTE_BUFFER == 'journal':
+            _buffer = JournalVoteBuffer()
+        else:
+            _buffer = VoteBuffer()
+        # Don't leave votes behind when the process ends
+        atexit.register(_buffer.flush)
+    return _buffer
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Space activity log. The creation and the modification of spaces, news,
+proposals, debates, documents and events are appended to the
+:class:`Activity` table by the signal handlers of this module. The space
+feed and the overview of a space read it with :func:`space_activity`.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+from django.utils.encoding import force_unicode
+from django.utils.html import strip_tags
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.spaces.models import Space, Document, Event, Activity
+from e_cidadania.apps.spaces.tabs import TABS
+from e_cidadania.apps.spaces.settings import SPACE_ACTIVITY_SUMMARY_LENGTH
+from e_cidadania.apps.news.models import Post
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.debate.models import Debate
+
+
+def _document_url(document):
+    # There is no document view, the documents link to their file
+    return document.docfile and document.docfile.url or ''
+
+
+# Model: (module, creation date field, function returning the title, URL,
+# text and author id of an instance)
+SOURCES = {
+    Space: ('space', 'date', lambda s: (s.name, s.get_absolute_url(),
+                                        s.description, s.author_id)),
+    Post: ('news', 'pub_date', lambda p: (p.post_title, p.get_absolute_url(),
+                                          p.post_message, p.author_id)),
+    Proposal: ('proposals', 'pub_date', lambda p: (
+        p.title, p.get_absolute_url(), p.description, p.author_id)),
+    Debate: ('debates', 'date', lambda d: (d.title, d.get_absolute_url(),
+                                           d.description, d.author_id)),
+    Document: ('docs', 'pub_date', lambda d: (d.title, _document_url(d), '',
+                                              d.author_id)),
+    Event: ('events', 'pub_date', lambda e: (
+        e.title, e.get_absolute_url(), e.description, e.event_author_id)),
+}
+
+
+def summarize(text):
+    """
+    Returns the beginning of the text without HTML tags.
+    """
+    text = strip_tags(force_unicode(text or '')).strip()
+    if len(text) > SPACE_ACTIVITY_SUMMARY_LENGTH:
+        text = text[:SPACE_ACTIVITY_SUMMARY_LENGTH - 3].rstrip() + u'...'
+    return text
+
+
+def make_entry(instance, action, timestamp=None):
+    """
+    Returns an unsaved activity entry for the instance, or None if it
+    doesn't belong to a space.
+    """
+    module, date_field, describe = SOURCES[type(instance)]
+    space_id = module == 'space' and instance.pk or instance.space_id
+    if space_id is None:
+        return None
+    title, url, text, author_id = describe(instance)
+    entry = Activity(space_id=space_id, action=action, module=module,
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk, title=title[:250], url=url[:250],
+        summary=summarize(text), author_id=author_id)
+    if timestamp is not None:
+        entry.timestamp = timestamp
+    return entry
+
+
+def space_activity(space, count):
+    """
+    Returns the latest 'count' entries of the activity of the space, only
+    from the modules enabled in it.
+    """
+    modules = ['space'] + [name for name, tab in TABS.items()
+                           if tab.enabled(space)]
+    return Activity.objects.filter(space=space.id, module__in=modules) \
+        .select_related('author')[:count]
+
+
+def rebuild(spaces=None, batch_size=1000):
+    """
+    Replace the activity log of the given space ids, or of all the spaces,
+    with the creation of their existing content, dated when it was created.
+
+    :rtype: number of entries written
+    """
+    entries = Activity.objects.all()
+    if spaces is not None:
+        entries = entries.filter(space__in=spaces)
+    entries.delete()
+    written = 0
+    for model, (module, date_field, describe) in SOURCES.items():
+        objects = model.objects.all()
+        if model is Space:
+            if spaces is not None:
+                objects = objects.filter(pk__in=spaces)
+        else:
+            objects = objects.filter(space__isnull=False) \
+                .select_related('space')
+            if spaces is not None:
+                objects = objects.filter(space__in=spaces)
+        batch = []
+        for instance in objects.iterator():
+            batch.append(make_entry(instance, Activity.CREATED,
+                                    getattr(instance, date_field)))
+            if len(batch) == batch_size:
+                written += bulk_insert(batch)
+                batch = []
+        written += bulk_insert(batch)
+    return written
+
+
+def log_activity(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Append the creation or the modification of the instance to the log.
+    """
+    if raw:
+        return
+    entry = make_entry(instance, created and Activity.CREATED
+                       or Activity.UPDATED)
+    if entry is not None:
+        entry.save()
+
+
+def forget_activity(sender, instance, **kwargs):
+    """
+    Remove the entries of deleted content, they would link to nothing.
+    """
+    Activity.objects.filter(object_id=instance.pk,
+        content_type=ContentType.objects.get_for_model(sender)).delete()
+
+for model in SOURCES:
+    post_save.connect(log_activity, sender=model)
+    post_delete.connect(forget_activity, sender=model)
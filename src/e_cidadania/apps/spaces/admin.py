@@ -25,9 +25,14 @@ will make their respective data models available for management.
 
 from django.contrib import admin
 from django.http import HttpResponse
-from django.utils.translation import ugettext_lazy as _
+from django.shortcuts import render_to_response
+from django.template import RequestContext
+from django.utils.encoding import smart_str
+from django.utils.translation import ugettext_lazy as _, ungettext
 
 from e_cidadania.apps.spaces.models import Space, Entity, Document, Event
+from e_cidadania.apps.spaces.forms import MemberImportForm
+from e_cidadania.apps.spaces.members import add_members, read_identifiers
 
 class EntityAdmin(admin.ModelAdmin):
 
@@ -76,6 +81,8 @@ class SpaceAdmin(admin.ModelAdmin):
     inlines = [
         EntityInline,
     ]
+
+    actions = ['import_members']
     
     def save_model(self, request, obj, form, change):
         if not change:
@@ -86,6 +93,39 @@ class SpaceAdmin(admin.ModelAdmin):
     def send_email(self, request, queryset):
         user_emails = queryset.objects.values('email')
 
+    def import_members(self, request, queryset):
+        """
+        Add a list of existing users to the selected spaces. The first time
+        it shows a form to upload the list, which posts back to this action.
+        """
+        form = MemberImportForm()
+        if request.POST.get('import'):
+            form = MemberImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                identifiers = [smart_str(line) for line in
+                               form.cleaned_data['users'].splitlines()]
+                if form.cleaned_data['csv_file']:
+                    identifiers.extend(form.cleaned_data['csv_file'])
+                identifiers = list(read_identifiers(identifiers))
+                for space in queryset:
+                    result = add_members(space, identifiers)
+                    self.message_user(request, ungettext(
+                        'Added %(added)d member to %(space)s, %(unknown)d '
+                        'users were not found.',
+                        'Added %(added)d members to %(space)s, %(unknown)d '
+                        'users were not found.', result.added) % {
+                            'added': result.added, 'space': space.name,
+                            'unknown': len(result.unknown)})
+                return None
+
+        return render_to_response('admin/spaces/import_members.html', {
+            'form': form,
+            'spaces': queryset,
+            'action_checkbox_name': admin.ACTION_CHECKBOX_NAME,
+            'opts': self.model._meta,
+        }, context_instance=RequestContext(request))
+    import_members.short_description = _('Import members')
+
 class DocumentAdmin(admin.ModelAdmin):
 
     """
@@ -0,0 +1,481 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Space archives. A space is exported with all its content to a gzipped tar
+stream holding the media files of the space under 'media/' and, after them,
+'space.jsonl', a JSON-lines file with one object per line and the parents
+before their children.
+
+The objects are read by chunks of primary keys and imported with one bulk
+insert per chunk, so the memory used doesn't grow with the number of notes,
+votes or comments. Only the new primary keys of the objects with children
+(the space, events, posts, proposals, debates, rows and columns) are kept
+to remap the foreign keys.
+
+Users are written as usernames, content types as 'app_label.model' and
+tags as their names. The users must exist in the installation where the
+archive is imported; the objects of unknown users are imported without
+author, and their votes, memberships and event registrations are skipped.
+"""
+
+import json
+import time
+import datetime
+import tarfile
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.comments.models import Comment
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Max, FileField
+
+from e_cidadania.bulk import insert_rows
+from e_cidadania.apps.spaces.models import Space, Entity, Document, Event
+from e_cidadania.apps.accounts.models import UserProfile
+from e_cidadania.apps.spaces.settings import SPACE_ARCHIVE_CHUNK_SIZE
+from e_cidadania.apps.spaces import activity, stats
+from e_cidadania.apps.news.models import Post
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.proposals import duplicates, geo
+from e_cidadania.apps.debate.models import Debate, Column, Row, Note
+from e_cidadania.apps.tagging.models import Tag, TaggedItem
+
+ARCHIVE_VERSION = 1
+MEDIA_PREFIX = 'media/'
+RECORDS_NAME = 'space.jsonl'
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def model_label(model):
+    opts = model._meta
+    return '%s.%s' % (opts.app_label, opts.object_name.lower())
+
+
+def _dump(value):
+    # str() keeps the microseconds and the DateTimeField parses it back
+    if isinstance(value, (datetime.date, datetime.time, Decimal)):
+        return unicode(value)
+    return value
+
+
+def _chunked(queryset, columns, chunk_size):
+    """
+    Yields the values of the columns of the objects in primary key order,
+    reading them in chunks. The first column must be the primary key.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        rows = list(chunk.values_list(*columns)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def _groups(iterable, size):
+    group = []
+    for item in iterable:
+        group.append(item)
+        if len(group) == size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+class Table(object):
+
+    """
+    A model exported with the spaces.
+
+    :attributes: - path: lookup from the model to the id of its space
+                 - mapped: the new primary keys of the imported objects are
+                   kept because other tables point to them
+
+    .. versionadded:: 0.1.5
+    """
+    # Foreign keys written as a natural key: the lookup of the key
+    natural = {User: 'username', UserProfile: 'user__username', Tag: 'name'}
+
+    def __init__(self, model, path, mapped=False):
+        self.model = model
+        self.label = model_label(model)
+        self.path = path
+        self.mapped = mapped
+        opts = model._meta
+        self.fields = [f for f in opts.local_fields if f is not opts.pk]
+        self.columns = [f.column for f in self.fields]
+        self.file_fields = [f for f in self.fields if isinstance(f, FileField)]
+
+    def related(self, field):
+        return getattr(field.rel, 'to', None)
+
+    def queryset(self, space):
+        return self.model._base_manager.filter(**{self.path: space.pk})
+
+    def export_column(self, field):
+        key = self.natural.get(self.related(field))
+        return key and '%s__%s' % (field.name, key) or field.attname
+
+    def dump(self, field, value):
+        if value is not None and self.related(field) is ContentType:
+            return model_label(ContentType.objects.get_for_id(value)
+                               .model_class())
+        return _dump(value)
+
+    def records(self, space, chunk_size):
+        return self.dump_rows(self.queryset(space), chunk_size)
+
+    def dump_rows(self, queryset, chunk_size):
+        columns = ['pk'] + [self.export_column(f) for f in self.fields]
+        for row in _chunked(queryset, columns, chunk_size):
+            yield {'model': self.label, 'pk': row[0],
+                   'fields': dict((f.name, self.dump(f, value)) for f, value
+                                  in zip(self.fields, row[1:]))}
+
+    def load(self, fields, importer):
+        """
+        Returns the values of the columns of an imported object, ready for
+        the database, or None if it can't be imported.
+        """
+        values = []
+        for field in self.fields:
+            value = self.load_value(field, fields.get(field.name), importer)
+            if value is None and not field.null:
+                return None
+            values.append(field.get_db_prep_save(value, connection=connection))
+        return values
+
+    def clear(self, rows):
+        """
+        Called with the rows of every chunk before inserting them.
+        """
+        pass
+
+    def load_value(self, field, value, importer):
+        related = self.related(field)
+        if related in self.natural:
+            return importer.natural_key(related, value)
+        if related is ContentType:
+            return importer.content_type(value).pk
+        if related is Site:
+            return settings.SITE_ID
+        if related is not None:
+            return importer.maps.get(related, {}).get(value, None)
+        if isinstance(field, FileField):
+            return importer.files.get(value, value)
+        return field.to_python(value)
+
+
+class GenericTable(Table):
+
+    """
+    A model pointing to the objects of other tables through a content type
+    and an object id, like the tags and the comments.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, model, ct_field, fk_field, parents):
+        super(GenericTable, self).__init__(model, None)
+        self.ct_field = ct_field
+        self.fk_field = fk_field
+        self.parents = parents
+
+    def records(self, space, chunk_size):
+        for parent in self.parents:
+            content_type = ContentType.objects.get_for_model(parent.model)
+            ids = _chunked(parent.queryset(space), ['pk'], chunk_size)
+            for group in _groups(ids, chunk_size):
+                objects = self.model._base_manager.filter(**{
+                    self.ct_field: content_type,
+                    '%s__in' % self.fk_field: [unicode(row[0])
+                                               for row in group]})
+                for record in self.dump_rows(objects, chunk_size):
+                    yield record
+
+    def clear(self, rows):
+        # Deleted objects leave their tags and comments behind, and the new
+        # objects can reuse their ids.
+        names = [f.name for f in self.fields]
+        ct_index = names.index(self.ct_field)
+        fk_index = names.index(self.fk_field)
+        objects = {}
+        for row in rows:
+            objects.setdefault(row[ct_index], []).append(row[fk_index])
+        for content_type, ids in objects.items():
+            self.model._base_manager.filter(**{
+                self.ct_field: content_type,
+                '%s__in' % self.fk_field: ids}).delete()
+
+    def load_value(self, field, value, importer):
+        if field.name == self.fk_field:
+            model = importer.content_type(
+                importer.record_fields[self.ct_field]).model_class()
+            value = importer.maps.get(model, {}).get(int(value))
+            return value is not None and field.to_python(value) or None
+        return super(GenericTable, self).load_value(field, value, importer)
+
+
+SPACE = Table(Space, 'pk', mapped=True)
+EVENTS = Table(Event, 'space', mapped=True)
+POSTS = Table(Post, 'space', mapped=True)
+PROPOSALS = Table(Proposal, 'space', mapped=True)
+DEBATES = Table(Debate, 'space', mapped=True)
+
+# In import order
+TABLES = [
+    SPACE,
+    Table(UserProfile.spaces.through, 'space'),
+    Table(Entity, 'space'),
+    Table(Document, 'space'),
+    EVENTS,
+    Table(Event.user.through, 'event__space'),
+    POSTS,
+    PROPOSALS,
+    Table(Proposal.support_votes.through, 'proposal__space'),
+    DEBATES,
+    Table(Column, 'debate__space', mapped=True),
+    Table(Row, 'debate__space', mapped=True),
+    Table(Note, 'debate__space'),
+    GenericTable(TaggedItem, 'content_type', 'object_id',
+                 (POSTS, PROPOSALS, DEBATES)),
+    GenericTable(Comment, 'content_type', 'object_pk',
+                 (POSTS, PROPOSALS, DEBATES, EVENTS)),
+]
+TABLES_BY_LABEL = dict((table.label, table) for table in TABLES)
+
+
+def _add_file(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = time.time()
+    tar.addfile(info, fileobj)
+
+
+def export_space(space, fileobj, chunk_size=SPACE_ARCHIVE_CHUNK_SIZE):
+    """
+    Write the archive of the space to the file object, which only needs to
+    be writable, so it can be the standard output.
+
+    :rtype: dictionary with the number of objects of every model
+    """
+    counts = {}
+    tar = tarfile.open(mode='w|gz', fileobj=fileobj)
+    try:
+        written = set()
+        for table in TABLES:
+            for field in table.file_fields:
+                names = _chunked(table.queryset(space).exclude(
+                    **{field.attname: ''}), ['pk', field.attname], chunk_size)
+                for pk, name in names:
+                    if name in written or not default_storage.exists(name):
+                        continue
+                    written.add(name)
+                    media = default_storage.open(name)
+                    try:
+                        _add_file(tar, MEDIA_PREFIX + name, media,
+                                  default_storage.size(name))
+                    finally:
+                        media.close()
+
+        # The objects go to a temporary file first, the tar header needs
+        # their size.
+        records = tempfile.TemporaryFile()
+        try:
+            records.write(json.dumps({'version': ARCHIVE_VERSION,
+                                      'space': space.url}) + '\n')
+            for table in TABLES:
+                for record in table.records(space, chunk_size):
+                    records.write(json.dumps(record) + '\n')
+                    counts[table.label] = counts.get(table.label, 0) + 1
+            size = records.tell()
+            records.seek(0)
+            _add_file(tar, RECORDS_NAME, records, size)
+        finally:
+            records.close()
+    finally:
+        tar.close()
+    return counts
+
+
+class SpaceImporter(object):
+
+    """
+    Reads a space archive and creates the space and its content. The media
+    files are saved in the default storage, maybe with new names, before
+    reading the objects that use them.
+
+    :attributes: - space: the imported space
+                 - counts: number of imported objects of every model
+                 - saved_files: names of the media files saved
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, url=None, name=None, chunk_size=SPACE_ARCHIVE_CHUNK_SIZE):
+        self.overrides = dict((k, v) for k, v in (('url', url),
+                              ('name', name)) if v)
+        self.chunk_size = chunk_size
+        self.space = None
+        self.counts = {}
+        self.saved_files = []
+        self.maps = {}
+        self.files = {}
+        self.record_fields = None
+        self._natural = {}
+        self._content_types = {}
+
+    def natural_key(self, model, value):
+        if value is None:
+            return None
+        return self._natural.setdefault(model, {}).get(value)
+
+    def content_type(self, label):
+        if label not in self._content_types:
+            app_label, model = label.split('.')
+            self._content_types[label] = ContentType.objects \
+                .get_by_natural_key(app_label, model)
+        return self._content_types[label]
+
+    def _resolve(self, table, records):
+        # Read the natural keys of the chunk missing in the caches
+        for field in table.fields:
+            model = table.related(field)
+            if model not in Table.natural:
+                continue
+            known = self._natural.setdefault(model, {})
+            keys = set(r['fields'].get(field.name) for r in records) \
+                - set(known) - set([None])
+            if not keys:
+                continue
+            lookup = Table.natural[model]
+            for key in keys:
+                known[key] = None
+            known.update(model._base_manager.filter(**{
+                '%s__in' % lookup: keys}).values_list(lookup, 'pk'))
+            if model is Tag:
+                for key in [k for k in keys if known[k] is None]:
+                    known[key] = Tag.objects.create(name=key).pk
+
+    def insert(self, table, records):
+        self._resolve(table, records)
+        rows, old_pks = [], []
+        for record in records:
+            self.record_fields = fields = record['fields']
+            if table is SPACE:
+                fields.update(self.overrides)
+            row = table.load(fields, self)
+            if row is not None:
+                rows.append(row)
+                old_pks.append(record['pk'])
+
+        manager = table.model._base_manager
+        if table.mapped:
+            last = manager.aggregate(last=Max('pk'))['last'] or 0
+        table.clear(rows)
+        insert_rows(table.model._meta.db_table, table.columns, rows)
+        if table.mapped:
+            new_pks = list(manager.filter(pk__gt=last).order_by('pk')
+                           .values_list('pk', flat=True)[:len(rows) + 1])
+            if len(new_pks) != len(rows):
+                raise ArchiveError("Other %s were created during the "
+                                   "import." % table.label)
+            self.maps.setdefault(table.model, {}).update(zip(old_pks, new_pks))
+        self.counts[table.label] = self.counts.get(table.label, 0) + len(rows)
+
+    def read_records(self, stream):
+        header = json.loads(stream.readline() or '{}')
+        if header.get('version') != ARCHIVE_VERSION:
+            raise ArchiveError("Unknown archive version: %s" %
+                               header.get('version'))
+        table, records = None, []
+        for line in stream:
+            record = json.loads(line)
+            if table is None or record['model'] != table.label \
+                    or len(records) == self.chunk_size:
+                if records:
+                    self.insert(table, records)
+                table, records = TABLES_BY_LABEL.get(record['model']), []
+                if table is None:
+                    raise ArchiveError("Unknown model: %s" % record['model'])
+            records.append(record)
+        if records:
+            self.insert(table, records)
+
+    def save_media(self, name, fileobj):
+        new_name = default_storage.save(name, File(fileobj))
+        self.saved_files.append(new_name)
+        self.files[name] = new_name
+
+    def delete_media(self):
+        """
+        Remove the media files saved by a failed import.
+        """
+        for name in self.saved_files:
+            default_storage.delete(name)
+
+    def read(self, fileobj):
+        """
+        Import the archive read from the file object, which only needs to
+        be readable, so it can be the standard input. The caller manages
+        the transaction.
+
+        :rtype: the new space
+        """
+        tar = tarfile.open(mode='r|*', fileobj=fileobj)
+        try:
+            for member in tar:
+                if member.name.startswith(MEDIA_PREFIX) and member.isfile():
+                    self.save_media(member.name[len(MEDIA_PREFIX):],
+                                    tar.extractfile(member))
+                elif member.name == RECORDS_NAME:
+                    self.read_records(tar.extractfile(member))
+        finally:
+            tar.close()
+        space_ids = self.maps.get(Space, {}).values()
+        if len(space_ids) != 1:
+            raise ArchiveError("The archive doesn't contain a space.")
+        self.space = Space.objects.get(pk=space_ids[0])
+        self.rebuild()
+        return self.space
+
+    def rebuild(self):
+        """
+        Fill the tables derived from the imported content, which are
+        normally kept by signals.
+        """
+        stats.rebuild([self.space.pk])
+        activity.rebuild([self.space.pk])
+        duplicates.rebuild(Proposal.objects.filter(space=self.space))
+        # It commits the transaction, so it goes last
+        geo.rebuild([self.space.pk])
@@ -1,10 +1,28 @@
 import os
-import shutil
-from django.db.models.fields.files import ImageField
+import re
+from django.db.models.fields.files import ImageField, ImageFieldFile
 from django.db.models import signals
 from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 
+# The uploaded images wait in this subdirectory of upload_to until the
+# process_images command resizes them
+INCOMING_DIR = 'incoming'
+
+# Stands for the digest of the uploaded image in the rendition names until
+# the worker reads the file. The digest makes the names immutable, so they
+# can be cached forever.
+DIGEST = '{digest}'
+DIGEST_LENGTH = 12
+HASHED_NAME = re.compile(r'\.[0-9a-f]{%s}$' % DIGEST_LENGTH)
+
+
+def webp_supported():
+    """True if the installed PIL can write WebP images"""
+    from PIL import Image
+    Image.init()
+    return 'WEBP' in Image.SAVE
+
 class ThumbnailField:
     """Instances of this class will be used to access data of the
     generated thumbnails"""
@@ -22,23 +40,82 @@ class ThumbnailField:
         return self.storage.size(self.name)
 
 
+class StdImageFieldFile(ImageFieldFile):
+    """File of a StdImageField. While the uploaded image waits to be resized
+    the templates get the URL of the placeholder of the field"""
+
+    @property
+    def pending(self):
+        """True if the image is still waiting to be resized"""
+        return bool(self.name) and \
+            os.path.basename(os.path.dirname(self.name)) == INCOMING_DIR
+
+    @property
+    def display_url(self):
+        """URL to show the image: the resized image, or the placeholder if
+        it isn't ready or there is no image"""
+        if self.name and not self.pending:
+            return self.url
+        if self.field.placeholder:
+            return '%s/%s' % (settings.STATIC_URL.rstrip('/'),
+                              self.field.placeholder)
+        return ''
+
+    @property
+    def hashed(self):
+        """True if the image has the named renditions of the field. Images
+        resized before the renditions existed only have one file"""
+        return bool(self.name) and not self.pending and \
+            bool(HASHED_NAME.search(os.path.splitext(self.name)[0]))
+
+    def _srcset(self, format):
+        if not self.hashed:
+            return ''
+        return ', '.join(['%s %sw' % (self.storage.url(name), width)
+                          for name, size, fmt, width in
+                          self.field.rendition_names(self.name)
+                          if fmt == format and width])
+
+    @property
+    def srcset(self):
+        """Value of the srcset attribute with the widths of the image"""
+        return self._srcset(None)
+
+    @property
+    def webp_srcset(self):
+        """Same as srcset with the WebP renditions, if there are any"""
+        return self._srcset('WEBP')
+
+
 class StdImageField(ImageField):
     """Django field that behaves as ImageField, with some extra features like:
-        - Auto resizing
+        - Auto resizing, outside of the request
         - Automatically generate thumbnails
     """
+    attr_class = StdImageFieldFile
+
     def __init__(self, verbose_name=None, name=None, width_field=None,
-        height_field=None, size=None, thumbnail_size=None, **kwargs):
+        height_field=None, size=None, thumbnail_size=None, placeholder=None,
+        variants=(), webp=False, **kwargs):
         """Added fields:
             - size: a tuple containing width and height to resize image, and
                 an optional boolean setting if is wanted forcing that size
                 (None for not resizing).
             - thumbnail_size: a tuple with same values than `size' (None for
                 not creating a thumbnail 
+            - placeholder: path of the static image shown until the uploaded
+                image is resized
+            - variants: tuple of (name, width) of smaller copies of the
+                resized image, for the srcset of the responsive images
+            - webp: also make WebP copies of the image and its variants, if
+                PIL supports it
         Example: (640, 480, True) -> Will resize image to a width of 640px and
             a height of 480px. File will be cutted if necessary for forcing
             the image to have the desired size
         """
+        self.placeholder = placeholder
+        self.variants = tuple(variants)
+        self.webp = webp and webp_supported()
         params_size = ('width', 'height', 'force')
         extra_args = dict(size=size, thumbnail_size=thumbnail_size)
         for att_name, att in extra_args.items():
@@ -53,7 +130,7 @@ class StdImageField(ImageField):
         """Call methods for generating all operations on specified signals
         """
         super(StdImageField, self).contribute_to_class(cls, name)
-        signals.post_save.connect(self._rename_resize_image, sender=cls)
+        signals.post_save.connect(self._queue_resize, sender=cls)
         signals.post_init.connect(self._set_thumbnail, sender=cls)
 
     def _get_thumbnail_filename(self, filename):
@@ -66,53 +143,73 @@ class StdImageField(ImageField):
         splitted_filename.insert(1, '.thumbnail')
         return ''.join(splitted_filename)
 
-    def _resize_image(self, filename, size):
-        """Resizes the image to specified width, height and force option
-            - filename: full path of image to resize
-            - size: dictionary containing:
-                - width: new width
-                - height: new height
-                - force: if True, image will be cropped to fit the exact size,
-                    if False, it will have the bigger size that fits the
-                    specified size, but without cropping, so it could be
-                    smaller on width or height
+    def generate_filename(self, instance, filename):
+        """New uploads are saved in the incoming subdirectory of upload_to
         """
-        WIDTH, HEIGHT = 0, 1
-        from PIL import Image, ImageOps
-        img = Image.open(filename)
-        if img.size[WIDTH] > size['width'] or img.size[HEIGHT] > size['height']:
-            if size['force']:
-                img = ImageOps.fit(img, (size['width'], size['height']), Image.ANTIALIAS)
-            else:
-                img.thumbnail((size['width'], size['height']), Image.ANTIALIAS)
-            try:
-                img.save(filename, optimize=1)
-            except IOError:
-                img.save(filename)
-
-    def _rename_resize_image(self, instance=None, **kwargs):
-        """Renames the image, and calls methods to resize and create the
-            thumbnail
+        return os.path.join(self.get_directory_name(), INCOMING_DIR,
+                            self.get_filename(filename))
+
+    def _variant_size(self, width):
+        """Box of a variant: the resized image box scaled to the width"""
+        if not self.size:
+            return {'width': width, 'height': width * 10, 'force': False}
+        return {'width': width, 'force': self.size['force'],
+                'height': max(1, self.size['height'] * width //
+                                 self.size['width'])}
+
+    def rendition_names(self, name):
+        """Returns the (name, size, format, width) of the files made from
+        the resized image with the given name: the image itself, its
+        variants, their WebP copies and the thumbnail. The format is None
+        to keep the format of the upload, and the width is the one of the
+        srcset, if the file is part of it.
         """
-        if getattr(instance, self.name):
-            filename = getattr(instance, self.name).path
-            ext = os.path.splitext(filename)[1].lower().replace('jpg', 'jpeg')
-            dst = self.generate_filename(instance, '%s_%s%s' % (
-                self.name,
-                instance._get_pk_val(),
-                ext))
-            dst_fullpath = os.path.join(settings.MEDIA_ROOT, dst)
-            normpath = lambda x: os.path.normpath(os.path.abspath(x))
-            if normpath(filename) != normpath(dst_fullpath):
-                os.rename(filename, dst_fullpath)
-                if self.size:
-                    self._resize_image(dst_fullpath, self.size)
-                if self.thumbnail_size:
-                    thumbnail_filename = self._get_thumbnail_filename(dst_fullpath)
-                    shutil.copyfile(dst_fullpath, thumbnail_filename)
-                    self._resize_image(thumbnail_filename, self.thumbnail_size)
-                setattr(instance, self.attname, dst)
-                instance.save()
+        root, ext = os.path.splitext(name)
+        files = [(name, self.size, None, self.size and self.size['width'])]
+        for variant, width in self.variants:
+            files.append(('%s.%s%s' % (root, variant, ext),
+                          self._variant_size(width), None, width))
+        if self.webp:
+            files += [(os.path.splitext(n)[0] + '.webp', size, 'WEBP', width)
+                      for n, size, format, width in files]
+        if self.thumbnail_size:
+            files.append((self._get_thumbnail_filename(name),
+                          self.thumbnail_size, None, None))
+        return files
+
+    def renditions(self, pk, filename, digest=DIGEST):
+        """Returns the (name, size, format) of the files made from an
+        uploaded image of the object with the given primary key, see
+        rendition_names(). The first one is the new value of the field.
+        Until the digest of the upload is known the names have the DIGEST
+        mark in its place.
+        """
+        ext = os.path.splitext(filename)[1].lower().replace('jpg', 'jpeg')
+        resized = os.path.join(self.get_directory_name(),
+                               '%s_%s.%s%s' % (self.name, pk, digest, ext))
+        return [(name, size, format) for name, size, format, width
+                in self.rendition_names(resized)]
+
+    def pre_save(self, model_instance, add):
+        """Instances loaded before their image was resized would save the
+        name of the uploaded file, which is deleted after resizing it
+        """
+        uploaded = not getattr(model_instance, self.attname)._committed
+        file = super(StdImageField, self).pre_save(model_instance, add)
+        if file.pending and not uploaded:
+            from e_cidadania.apps.spaces.images import resized_name
+            file.name = resized_name(model_instance, self.name,
+                                     file.name) or file.name
+        return file
+
+    def _queue_resize(self, instance=None, raw=False, **kwargs):
+        """Adds a job to resize the image if it's a new upload. The resized
+        image is saved in the field by the process_images command
+        """
+        file = getattr(instance, self.name)
+        if not raw and file.pending:
+            from e_cidadania.apps.spaces.images import enqueue
+            enqueue(instance, self.name, file.name)
 
     def _set_thumbnail(self, instance=None, **kwargs):
         """Creates a "thumbnail" object as attribute of the ImageField instance
@@ -120,10 +217,8 @@ class StdImageField(ImageField):
         "path", "url"... properties can be used
         """
         if getattr(instance, self.name):
-            filename = self.generate_filename(
-                instance,
-                os.path.basename(
-                    getattr(instance, self.name).path))
+            filename = os.path.join(self.get_directory_name(),
+                os.path.basename(getattr(instance, self.name).name))
             thumbnail_filename = self._get_thumbnail_filename(filename)
             thumbnail_field = ThumbnailField(thumbnail_filename)
             setattr(getattr(instance, self.name), 'thumbnail', thumbnail_field)
@@ -24,7 +24,9 @@ documents, meetings and entities. Most of the forms are directly generated
 from the data models.
 """
 
+from django import forms
 from django.forms import ModelForm, ValidationError
+from django.utils.translation import ugettext_lazy as _
 from django.forms.models import modelformset_factory
 
 from e_cidadania.apps.spaces.models import Space, Document, Event, Entity
@@ -90,3 +92,25 @@ class EventForm(ModelForm):
     """
     class Meta:
         model = Event
+
+
+class MemberImportForm(forms.Form):
+
+    """
+    Returns the form of the admin action which adds users to the selected
+    spaces. The users can be given in a CSV file, in the text field or both.
+
+    :rtype: HTML Form
+
+    .. versionadded:: 0.1.5
+    """
+    csv_file = forms.FileField(label=_('CSV file'), required=False,
+        help_text=_('Usernames or emails in the first column'))
+    users = forms.CharField(label=_('Users'), required=False,
+        widget=forms.Textarea, help_text=_('One username or email per line'))
+
+    def clean(self):
+        if not (self.cleaned_data.get('csv_file') or
+                self.cleaned_data.get('users', '').strip()):
+            raise ValidationError(_('Enter some usernames or emails.'))
+        return self.cleaned_data
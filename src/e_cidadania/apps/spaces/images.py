@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Background processing of the images uploaded to :class:`StdImageField`
+fields. The request only saves the uploaded file and adds an
+:class:`ImageJob`; the process_images command takes the jobs in batches,
+resizes the images in a pool of worker processes and points the fields to
+the resized images with an UPDATE, without saving the objects again.
+
+Large JPEG images are decoded in draft mode, at the smallest power of two
+reduction still bigger than every rendition, so a photo from a phone is
+never decoded at full size. Every image gets the renditions declared by
+its field, named after the digest of the upload so their URLs never change.
+"""
+
+import shutil
+import hashlib
+import datetime
+import traceback
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+
+from e_cidadania.apps.spaces.models import ImageJob
+from e_cidadania.apps.spaces.fields import DIGEST, DIGEST_LENGTH
+from e_cidadania.apps.spaces.settings import SPACE_IMAGE_BATCH_SIZE, \
+    SPACE_IMAGE_MAX_ATTEMPTS, SPACE_IMAGE_JOB_TIMEOUT
+
+
+def enqueue(instance, field_name, source):
+    """
+    Adds a job to resize the uploaded file of the field of the instance,
+    unless there is one waiting already. The names of the uploads are
+    reused once they are deleted, so the old jobs don't count.
+    """
+    if ImageJob.objects.filter(source=source, status__in=(ImageJob.PENDING,
+                               ImageJob.RUNNING)).exists():
+        return None
+    return ImageJob.objects.create(object_id=instance.pk,
+        content_type=ContentType.objects.get_for_model(instance),
+        field_name=field_name, source=source)
+
+
+def resized_name(instance, field_name, source):
+    """
+    Returns the name of the resized image of the file uploaded to the field
+    of the instance, or None if it isn't ready. The upload names are shared
+    by every object, so the job has to be the one of this field.
+    """
+    names = ImageJob.objects.filter(object_id=instance.pk,
+        content_type=ContentType.objects.get_for_model(instance),
+        field_name=field_name, source=source, status=ImageJob.DONE) \
+        .order_by('-id').values_list('result', flat=True)[:1]
+    return names and names[0] or None
+
+
+def render(task):
+    """
+    Makes the renditions of an uploaded image. It runs in the worker
+    processes, so it only works with paths.
+
+    :param task: (source path, [(destination path, size, format), ...]),
+                 the sizes like the 'size' of :class:`StdImageField`, or
+                 None to keep the size, and the format None to keep the
+                 format of the upload. The destination paths have the
+                 DIGEST mark.
+    :rtype: the digest of the uploaded file
+    """
+    from PIL import Image, ImageOps
+    source, renditions = task
+    digest = hashlib.md5()
+    with open(source, 'rb') as upload:
+        for data in iter(lambda: upload.read(65536), ''):
+            digest.update(data)
+    digest = digest.hexdigest()[:DIGEST_LENGTH]
+
+    img = Image.open(source)
+    width, height = img.size
+    sizes = [size for path, size, format in renditions if size]
+    if sizes:
+        img.draft(img.mode, (max([s['width'] for s in sizes]),
+                             max([s['height'] for s in sizes])))
+    for path, size, format in renditions:
+        path = path.replace(DIGEST, digest)
+        if size is None or (width <= size['width'] and
+                            height <= size['height']):
+            if format is None:
+                shutil.copyfile(source, path)
+                continue
+            resized = img
+        elif size['force']:
+            resized = ImageOps.fit(img, (size['width'], size['height']),
+                                   Image.ANTIALIAS)
+        else:
+            resized = img.copy()
+            resized.thumbnail((size['width'], size['height']),
+                              Image.ANTIALIAS)
+        if format is not None and resized.mode not in ('RGB', 'RGBA'):
+            resized = resized.convert('RGBA')
+        try:
+            resized.save(path, format, optimize=1)
+        except IOError:
+            resized.save(path, format)
+    return digest
+
+
+def _safe_render(task):
+    # An exception would stop the whole batch of the pool
+    try:
+        return render(task), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def claim(limit=SPACE_IMAGE_BATCH_SIZE):
+    """
+    Takes up to 'limit' pending jobs. The jobs running for longer than
+    SPACE_IMAGE_JOB_TIMEOUT seconds belong to a dead worker and they are
+    put back in the queue first.
+    """
+    now = datetime.datetime.now()
+    ImageJob.objects.filter(status=ImageJob.RUNNING, started__lt=now -
+        datetime.timedelta(seconds=SPACE_IMAGE_JOB_TIMEOUT)) \
+        .update(status=ImageJob.PENDING)
+    jobs = []
+    for job in ImageJob.objects.filter(status=ImageJob.PENDING)[:limit]:
+        # Other workers could take it first
+        if ImageJob.objects.filter(pk=job.pk, status=ImageJob.PENDING) \
+                .update(status=ImageJob.RUNNING, started=now,
+                        attempts=F('attempts') + 1):
+            job.attempts += 1
+            jobs.append(job)
+    return jobs
+
+
+def _field(job):
+    model = ContentType.objects.get_for_id(job.content_type_id).model_class()
+    return model, model._meta.get_field(job.field_name)
+
+
+def finish(job, digest, error=None):
+    """
+    Points the field to the resized image and removes the uploaded file
+    and the renditions of the previous image of the field, or puts the job
+    back in the queue if the image couldn't be resized.
+    """
+    now = datetime.datetime.now()
+    if error is not None:
+        failed = job.attempts >= SPACE_IMAGE_MAX_ATTEMPTS
+        ImageJob.objects.filter(pk=job.pk).update(error=error, finished=now,
+            status=failed and ImageJob.FAILED or ImageJob.PENDING)
+        return
+
+    model, field = _field(job)
+    result = field.renditions(job.object_id, job.source, digest)[0][0]
+    # A newer upload has its own job
+    updated = model._base_manager.filter(**{'pk': job.object_id,
+                                            field.attname: job.source}) \
+        .update(**{field.attname: result})
+    ImageJob.objects.filter(pk=job.pk).update(status=ImageJob.DONE,
+        result=result, error='', finished=now)
+    field.storage.delete(job.source)
+    if not updated:
+        return
+
+    previous = ImageJob.objects.filter(content_type=job.content_type_id,
+        object_id=job.object_id, field_name=job.field_name,
+        status=ImageJob.DONE, id__lt=job.pk).exclude(result=result) \
+        .values_list('result', flat=True)
+    for name in previous:
+        for rendition in field.rendition_names(name):
+            field.storage.delete(rendition[0])
+
+
+def process_jobs(pool=None, limit=SPACE_IMAGE_BATCH_SIZE):
+    """
+    Takes a batch of jobs and resizes their images in the pool of worker
+    processes, or in this process if there is no pool.
+
+    :rtype: number of processed jobs
+    """
+    jobs = claim(limit)
+    tasks = []
+    for job in jobs:
+        model, field = _field(job)
+        tasks.append((field.storage.path(job.source),
+                      [(field.storage.path(name), size, format)
+                       for name, size, format in
+                       field.renditions(job.object_id, job.source)]))
+    results = pool is not None and pool.map(_safe_render, tasks) \
+        or map(_safe_render, tasks)
+    for job, (digest, error) in zip(jobs, results):
+        finish(job, digest, error)
+    return len(jobs)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Measure how the personal timeline latency scales with the number of spaces
+of the user. All the data created by the benchmark is rolled back at the
+end.
+
+Usage: python manage.py benchmark_timeline --spaces=10,50,200,500 --entries=20
+"""
+
+import time
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from e_cidadania.bulk import bulk_insert
+from e_cidadania.apps.spaces.models import Space, Activity
+from e_cidadania.apps.spaces.timeline import merge_activity
+from e_cidadania.apps.spaces.settings import SPACE_TIMELINE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    """
+    Read the first and a deep page of the timeline of a user in an
+    increasing number of spaces, merging one stream per chunk of spaces and
+    one stream per space.
+    """
+    help = "Benchmark the personal timeline against the membership size."
+    option_list = BaseCommand.option_list + (
+        make_option('--spaces', dest='spaces', default='10,50,200,500',
+                    help='Comma separated list of membership sizes to test.'),
+        make_option('--entries', dest='entries', type='int', default=20,
+                    help='Number of activity entries of every space.'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Number of reads of every page, the best is shown.'),
+    )
+
+    def best_time(self, ids, after, chunk_size, repeat):
+        times = []
+        for i in range(repeat):
+            start = time.time()
+            merge_activity(ids, after, chunk_size=chunk_size)
+            times.append(time.time() - start)
+        return min(times)
+
+    def time_pages(self, ids, chunk_size, repeat):
+        """
+        Returns the best time reading the first and the fifth pages.
+        """
+        cursor = None
+        for i in range(4):
+            cursor = merge_activity(ids, cursor, chunk_size=chunk_size)[1]
+        return (self.best_time(ids, None, chunk_size, repeat),
+                self.best_time(ids, cursor, chunk_size, repeat))
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        sizes = [int(n) for n in options['spaces'].split(',')]
+        try:
+            user = User.objects.create(username='benchmark-timeline')
+            profile = user.get_profile()
+            content_type = ContentType.objects.get_for_model(Space)
+            now = datetime.datetime.now()
+
+            self.stdout.write("spaces\tfirst page (s)\tpage 5 (s)\t"
+                              "per space: first (s)\tpage 5 (s)\n")
+            spaces = []
+            for size in sizes:
+                while len(spaces) < size:
+                    space = Space.objects.create(
+                        name='benchmark %s' % len(spaces),
+                        url='benchmark_timeline_%s' % len(spaces),
+                        mod_news=True, mod_proposals=True)
+                    bulk_insert([Activity(space=space, timestamp=now -
+                        datetime.timedelta(minutes=i * 7 + len(spaces)),
+                        action=Activity.CREATED, module='news',
+                        content_type=content_type, object_id=space.id,
+                        title='entry %s' % i, url=space.get_absolute_url())
+                        for i in range(options['entries'])])
+                    profile.spaces.add(space)
+                    spaces.append(space)
+
+                ids = [space.id for space in spaces]
+                chunked = self.time_pages(ids, SPACE_TIMELINE_CHUNK_SIZE,
+                                          options['repeat'])
+                per_space = self.time_pages(ids, 1, options['repeat'])
+                self.stdout.write("%s\t%.4f\t\t%.4f\t\t%.4f\t\t\t%.4f\n" % (
+                    size, chunked[0], chunked[1], per_space[0], per_space[1]))
+        finally:
+            transaction.rollback()
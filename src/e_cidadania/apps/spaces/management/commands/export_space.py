@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Export a space with all its content and media files to an archive, which
+can be loaded in another installation with the import_space command. Use
+'-' as file name to write the archive to the standard output.
+
+Usage: python manage.py export_space space_url archive.tar.gz
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.spaces.archive import export_space
+from e_cidadania.apps.spaces.settings import SPACE_ARCHIVE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    """
+    Write the archive of a space and report how many objects of every
+    model it holds.
+    """
+    args = 'space_url archive'
+    help = "Export a space and its content to an archive."
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=SPACE_ARCHIVE_CHUNK_SIZE,
+                    help='Number of objects read by every query.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError("Enter the URL of the space and the archive.")
+        try:
+            space = Space.objects.get(url=args[0])
+        except Space.DoesNotExist:
+            raise CommandError("The space '%s' doesn't exist." % args[0])
+
+        to_stdout = args[1] == '-'
+        archive = to_stdout and sys.stdout or open(args[1], 'wb')
+        try:
+            counts = export_space(space, archive, options['chunk_size'])
+        finally:
+            if not to_stdout:
+                archive.close()
+        # Keep the standard output clean for the archive
+        report = to_stdout and sys.stderr or self.stdout
+        if int(options.get('verbosity', 1)) > 0:
+            for label in sorted(counts):
+                report.write("%s\t%s\n" % (label, counts[label]))
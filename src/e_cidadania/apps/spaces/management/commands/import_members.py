@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Add existing users to a space from a CSV file, or a file with one username
+or email per line. The standard input is read when there is no file or the
+file is '-'.
+
+Usage: python manage.py import_members space_url [file ...]
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.encoding import smart_str
+
+from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.spaces.members import add_members, read_identifiers
+from e_cidadania.apps.spaces.settings import SPACE_IMPORT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    """
+    Import the members of a space and report the progress after every
+    chunk of users.
+    """
+    args = 'space_url [file ...]'
+    help = "Add the users with the given usernames or emails to a space."
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=SPACE_IMPORT_CHUNK_SIZE,
+                    help='Number of users resolved by every query.'),
+    )
+
+    def read(self, paths):
+        for path in paths or ['-']:
+            stream = path == '-' and sys.stdin or open(path, 'rU')
+            try:
+                for identifier in read_identifiers(stream):
+                    yield identifier
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+    def progress(self, result):
+        self.stdout.write("Read %s users, %s new members.\n" % (
+            result.read, result.added))
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("Enter the URL of the space.")
+        try:
+            space = Space.objects.get(url=args[0])
+        except Space.DoesNotExist:
+            raise CommandError("The space '%s' doesn't exist." % args[0])
+
+        verbosity = int(options.get('verbosity', 1))
+        result = add_members(space, self.read(args[1:]),
+                             options['chunk_size'],
+                             verbosity > 0 and self.progress or None)
+        self.stdout.write("Added %s members to %s, %s already were members "
+                          "and %s users were not found.\n" % (
+                              result.added, smart_str(space.name),
+                              result.existing, len(result.unknown)))
+        if verbosity > 1:
+            for identifier in result.unknown:
+                self.stdout.write("Unknown user: %s\n" % smart_str(identifier))
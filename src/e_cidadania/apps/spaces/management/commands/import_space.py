@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Create a space from an archive written by the export_space command. Use
+'-' as file name to read the archive from the standard input. The users
+referenced by the archive must already exist.
+
+Usage: python manage.py import_space archive.tar.gz [--url=new_url --name=name]
+"""
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, IntegrityError
+from django.utils.encoding import smart_str
+
+from e_cidadania.apps.spaces.archive import SpaceImporter, ArchiveError
+from e_cidadania.apps.spaces.settings import SPACE_ARCHIVE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+
+    """
+    Import a space archive in a single transaction. The media files saved
+    are deleted again if the import fails.
+    """
+    args = 'archive'
+    help = "Import a space and its content from an archive."
+    option_list = BaseCommand.option_list + (
+        make_option('--url', dest='url', default=None,
+                    help='URL of the new space, instead of the archived one.'),
+        make_option('--name', dest='name', default=None,
+                    help='Name of the new space, instead of the archived one.'),
+        make_option('--chunk-size', dest='chunk_size', type='int',
+                    default=SPACE_ARCHIVE_CHUNK_SIZE,
+                    help='Number of objects inserted by every query.'),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Enter the archive to import.")
+        importer = SpaceImporter(options['url'], options['name'],
+                                 options['chunk_size'])
+        archive = args[0] == '-' and sys.stdin or open(args[0], 'rb')
+        try:
+            space = importer.read(archive)
+            transaction.commit()
+        except (ArchiveError, IntegrityError), e:
+            transaction.rollback()
+            importer.delete_media()
+            raise CommandError("The archive can't be imported: %s" % e)
+        except:
+            transaction.rollback()
+            importer.delete_media()
+            raise
+        finally:
+            if archive is not sys.stdin:
+                archive.close()
+
+        if int(options.get('verbosity', 1)) > 0:
+            for label in sorted(importer.counts):
+                self.stdout.write("%s\t%s\n" % (label, importer.counts[label]))
+        self.stdout.write("Imported the space %s.\n" % smart_str(space.url))
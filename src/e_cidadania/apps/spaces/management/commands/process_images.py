@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Resize the images uploaded to the StdImageField fields. The uploads are
+queued as image jobs and this command processes them in a pool of worker
+processes. It runs until it's stopped, unless --once is given.
+
+Usage: python manage.py process_images --workers=2 [--once]
+"""
+
+import time
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from e_cidadania.apps.spaces.images import process_jobs
+from e_cidadania.apps.spaces.settings import SPACE_IMAGE_WORKERS, \
+    SPACE_IMAGE_BATCH_SIZE, SPACE_IMAGE_POLL_INTERVAL
+
+
+class Command(NoArgsCommand):
+
+    """
+    Process the queue of uploaded images.
+    """
+    help = "Resize the uploaded images waiting in the image job queue."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', dest='workers', type='int',
+                    default=SPACE_IMAGE_WORKERS,
+                    help='Number of worker processes, 0 to resize the '
+                         'images in this process.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=SPACE_IMAGE_BATCH_SIZE,
+                    help='Number of jobs taken at once.'),
+        make_option('--interval', dest='interval', type='float',
+                    default=SPACE_IMAGE_POLL_INTERVAL,
+                    help='Seconds to wait when the queue is empty.'),
+        make_option('--once', dest='once', action='store_true',
+                    default=False,
+                    help='Exit when the queue is empty.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options['verbosity'])
+        # The workers are forked before this process opens the database
+        pool = None
+        if options['workers'] > 0:
+            pool = multiprocessing.Pool(options['workers'])
+        try:
+            while True:
+                processed = process_jobs(pool, options['batch_size'])
+                if processed and verbosity >= 1:
+                    self.stdout.write("Processed %s images.\n" % processed)
+                if not processed:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        finally:
+            if pool is not None:
+                pool.terminate()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Fill the space activity log with the creation of all the existing content.
+The log is written by signals, this is only needed once after installing it
+or after loading content directly in the database. The modifications
+logged so far are lost.
+
+Usage: python manage.py rebuild_activity
+"""
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from e_cidadania.apps.spaces.activity import rebuild
+
+
+class Command(NoArgsCommand):
+
+    """
+    Rebuild the space activity log from the content tables.
+    """
+    help = "Rebuild the activity log of the spaces from the existing content."
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        self.stdout.write("Logged %s activity entries.\n" % rebuild())
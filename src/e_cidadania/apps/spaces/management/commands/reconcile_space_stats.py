@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Rebuild the materialized statistics of the spaces from the tables. The
+statistics are updated by signals, this is only needed once when deploying
+the statistics table on a site with spaces, and after changing the counted
+tables directly in the database.
+
+Usage: python manage.py reconcile_space_stats [space_url ...]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from e_cidadania.apps.spaces.models import Space, SpaceStats
+from e_cidadania.apps.spaces.stats import FIELDS, rebuild
+
+
+class Command(BaseCommand):
+
+    """
+    Rebuild the statistics of all the spaces or of the given spaces and
+    report the spaces whose counters were out of sync.
+    """
+    args = '[space_url ...]'
+    help = "Rebuild the statistics of the spaces."
+
+    def _snapshot(self, spaces):
+        stats = SpaceStats.objects.all()
+        if spaces is not None:
+            stats = stats.filter(space__in=spaces)
+        return dict((row[0], row[1:]) for row in
+                    stats.values_list('space', *FIELDS).iterator())
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        spaces = None
+        if args:
+            spaces = list(Space.objects.filter(url__in=args)
+                          .values_list('pk', flat=True))
+        before = self._snapshot(spaces)
+        rebuilt = rebuild(spaces)
+        after = self._snapshot(spaces)
+        drifted = [pk for pk, counts in after.items()
+                   if before.get(pk) != counts]
+        self.stdout.write("Rebuilt the statistics of %s spaces, %s were out "
+                          "of sync.\n" % (rebuilt, len(drifted)))
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Bulk import of space members. The users are resolved by username or email
+in chunks, the missing profiles are created and the memberships are
+inserted with one statement per chunk, skipping the users who already
+belong to the space. The inserts don't send signals, so the member count
+of the space is updated at the end.
+"""
+
+import csv
+
+from django.contrib.auth.models import User
+from django.utils.encoding import smart_unicode
+
+from e_cidadania.bulk import bulk_insert, insert_rows
+from e_cidadania.apps.accounts.models import UserProfile
+from e_cidadania.apps.spaces.stats import recount
+from e_cidadania.apps.spaces.settings import SPACE_IMPORT_CHUNK_SIZE
+
+
+class ImportResult(object):
+
+    """
+    Counters of a member import.
+
+    :attributes: - read: number of different usernames or emails read
+                 - added: number of new members of the space
+                 - existing: number of users who already were members
+                 - unknown: list of usernames or emails without user
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self):
+        self.read = 0
+        self.added = 0
+        self.existing = 0
+        self.unknown = []
+        # Users found so far, in case they are given twice
+        self.users = set()
+
+
+def read_identifiers(stream):
+    """
+    Yields the usernames or emails of the first column of a CSV file, or of
+    a file with one of them per line. Empty lines and lines starting with
+    '#' are skipped.
+    """
+    for row in csv.reader(stream):
+        if row and row[0].strip() and not row[0].startswith('#'):
+            yield smart_unicode(row[0].strip())
+
+
+def _resolve_users(identifiers):
+    """
+    Returns the {identifier: user id} of the known usernames and emails.
+    The emails are only looked up when there is no user with that name,
+    the username is indexed and the email isn't.
+    """
+    found = dict(User.objects.filter(username__in=identifiers)
+                 .values_list('username', 'id'))
+    emails = [i for i in identifiers if '@' in i and i not in found]
+    if emails:
+        by_email = {}
+        for email, pk in User.objects.filter(email__in=emails) \
+                .values_list('email', 'id'):
+            # An email shared by several users can't tell them apart
+            by_email[email] = by_email.get(email, pk) == pk and pk or None
+        found.update((email, pk) for email, pk in by_email.items()
+                     if pk is not None)
+    return found
+
+
+def _profiles(user_ids):
+    """
+    Returns the {user id: profile id} of the users, creating the missing
+    profiles.
+    """
+    def read():
+        return dict(UserProfile.objects.filter(user__in=user_ids)
+                    .values_list('user', 'id'))
+    profiles = read()
+    missing = [pk for pk in user_ids if pk not in profiles]
+    if missing:
+        bulk_insert([UserProfile(user_id=pk) for pk in missing])
+        profiles = read()
+    return profiles
+
+
+def _add_chunk(space, identifiers, result):
+    users = _resolve_users(identifiers)
+    result.unknown.extend([i for i in identifiers if i not in users])
+    user_ids = set(users.values()) - result.users
+    result.users.update(user_ids)
+    profiles = _profiles(list(user_ids))
+
+    through = UserProfile.spaces.through
+    existing = set(through.objects.filter(space=space.pk,
+        userprofile__in=profiles.values()).values_list('userprofile',
+                                                       flat=True))
+    new = [(user_id, profile_id) for user_id, profile_id in profiles.items()
+           if profile_id not in existing]
+    opts = through._meta
+    insert_rows(opts.db_table, [opts.get_field('userprofile').column,
+                                opts.get_field('space').column],
+                [(profile_id, space.pk) for user_id, profile_id in new])
+    result.added += len(new)
+    result.existing += len(existing)
+
+
+def add_members(space, identifiers, chunk_size=SPACE_IMPORT_CHUNK_SIZE,
+                progress=None):
+    """
+    Add the users with the given usernames or emails to the space.
+
+    :param identifiers: iterable of usernames or emails
+    :param progress: function called with the result after every chunk
+    :rtype: :class:`ImportResult`
+    """
+    result = ImportResult()
+    seen = set()
+    chunk = []
+    for identifier in identifiers:
+        if identifier in seen:
+            continue
+        seen.add(identifier)
+        chunk.append(identifier)
+        if len(chunk) == chunk_size:
+            result.read += len(chunk)
+            _add_chunk(space, chunk, result)
+            chunk = []
+            if progress is not None:
+                progress(result)
+    if chunk:
+        result.read += len(chunk)
+        _add_chunk(space, chunk, result)
+        if progress is not None:
+            progress(result)
+    if result.added:
+        recount([space.pk], ('members',))
+    return result
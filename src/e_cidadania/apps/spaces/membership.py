@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Space membership. The ids of the spaces of a user are read with a single
+query the first time they are needed in a request and kept in the user
+instance until the request ends. They aren't kept in the cache: access
+checks must see a user leaving a space at once in every process.
+"""
+
+from e_cidadania.apps.accounts.models import UserProfile
+
+
+def space_ids(user):
+    """
+    Returns the set of ids of the spaces the user belongs to. The set is
+    kept in the user instance for the rest of the request.
+    """
+    if not user.is_authenticated():
+        return frozenset()
+    ids = getattr(user, '_space_ids', None)
+    if ids is None:
+        ids = frozenset(UserProfile.spaces.through.objects.filter(
+            userprofile__user=user.pk).values_list('space_id', flat=True))
+        user._space_ids = ids
+    return ids
+
+
+def is_member(user, space):
+    """
+    Returns True if the user belongs to the space (a Space or its id).
+    """
+    return getattr(space, 'pk', space) in space_ids(user)
@@ -18,10 +18,13 @@
 # You should have received a copy of the GNU General Public License
 # along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
+
 from django.core.validators import RegexValidator
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 
 from e_cidadania.apps.spaces.file_validation import ContentTypeRestrictedFileField
 from fields import StdImageField
@@ -62,9 +65,14 @@ class Space(models.Model):
     author = models.ForeignKey(User, blank=True, null=True,
                                 verbose_name=_('Space creator'))
 
-    logo = StdImageField(upload_to='spaces/logos', size=(100, 75, False), 
+    logo = StdImageField(upload_to='spaces/logos', size=(100, 75, False),
+                         placeholder='assets/logos/index.png',
+                         variants=(('small', 50),), webp=True,
                          help_text = _('Valid extensions are jpg, jpeg, png and gif'))
     banner = StdImageField(upload_to='spaces/banners', size=(500, 75, False),
+                           placeholder='assets/banners/index.png',
+                           variants=(('small', 160), ('medium', 320)),
+                           webp=True,
                            help_text = _('Valid extensions are jpg, jpeg, png and gif'))
 #    logo = models.ImageField(upload_to='spaces/logos',
 #                             verbose_name=_('Logotype'),
@@ -192,3 +200,129 @@ class Event(models.Model):
         return ('view-event', (), {
             'space_name': self.space.url,
             'event_id': str(self.id)})
+
+
+class SpaceStats(models.Model):
+
+    """
+    Materialized statistics of a space. The counters are updated by the
+    signal handlers in :mod:`e_cidadania.apps.spaces.stats` and they can be
+    rebuilt with the reconcile_space_stats command.
+
+    .. versionadded:: 0.1.5
+    """
+    space = models.OneToOneField(Space, primary_key=True, related_name='stats')
+    members = models.IntegerField(_('Members'), default=0)
+    proposals = models.IntegerField(_('Proposals'), default=0)
+    votes = models.IntegerField(_('Support votes'), default=0)
+    debates = models.IntegerField(_('Debates'), default=0)
+    notes = models.IntegerField(_('Debate notes'), default=0)
+    documents = models.IntegerField(_('Documents'), default=0)
+    posts = models.IntegerField(_('News'), default=0)
+
+    class Meta:
+        verbose_name = _('Space statistics')
+        verbose_name_plural = _('Space statistics')
+
+    def __unicode__(self):
+        return unicode(self.space_id)
+
+
+class Activity(models.Model):
+
+    """
+    Append-only log of the content created or updated in a space. Every
+    entry keeps what is needed to show it, so the recent activity of a space
+    is read with a single range scan of the (space, timestamp) index, no
+    matter how many kinds of content there are. The entries are written by
+    the signal handlers in :mod:`e_cidadania.apps.spaces.activity`.
+
+    .. versionadded:: 0.1.5
+    """
+    CREATED = 'c'
+    UPDATED = 'u'
+    ACTIONS = (
+        (CREATED, _('created')),
+        (UPDATED, _('updated')),
+    )
+    MODULES = (
+        ('space', _('space')),
+        ('news', _('news')),
+        ('proposals', _('proposal')),
+        ('debates', _('debate')),
+        ('docs', _('document')),
+        ('events', _('event')),
+    )
+
+    space = models.ForeignKey(Space)
+    timestamp = models.DateTimeField(_('Date'), default=datetime.datetime.now)
+    action = models.CharField(_('Action'), max_length=1, choices=ACTIONS)
+    module = models.CharField(_('Module'), max_length=20, choices=MODULES)
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(_('Title'), max_length=250)
+    url = models.CharField(_('URL'), max_length=250)
+    summary = models.TextField(_('Summary'), blank=True)
+    author = models.ForeignKey(User, blank=True, null=True,
+                               related_name='space_activity')
+
+    class Meta:
+        ordering = ['-timestamp', '-id']
+        verbose_name = _('Activity')
+        verbose_name_plural = _('Activity')
+        get_latest_by = 'timestamp'
+
+    def __unicode__(self):
+        return u'%s %s' % (self.get_action_display(), self.title)
+
+    def get_absolute_url(self):
+        return self.url
+
+
+class ImageJob(models.Model):
+
+    """
+    Durable queue of the uploaded images waiting to be resized. The images
+    of the :class:`StdImageField` fields are saved as they come and a job is
+    added here; the process_images command does the work outside of the
+    request and points the field to the resized image.
+
+    .. versionadded:: 0.1.5
+    """
+    PENDING = 'p'
+    RUNNING = 'r'
+    DONE = 'd'
+    FAILED = 'f'
+    STATUSES = (
+        (PENDING, _('pending')),
+        (RUNNING, _('running')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    field_name = models.CharField(_('Field'), max_length=50)
+    source = models.CharField(_('Uploaded file'), max_length=255)
+    result = models.CharField(_('Resized file'), max_length=255, blank=True)
+    status = models.CharField(_('Status'), max_length=1, choices=STATUSES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(_('Attempts'), default=0)
+    error = models.TextField(_('Error'), blank=True)
+    created = models.DateTimeField(_('Created'), default=datetime.datetime.now)
+    started = models.DateTimeField(_('Started'), blank=True, null=True)
+    finished = models.DateTimeField(_('Finished'), blank=True, null=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = _('Image job')
+        verbose_name_plural = _('Image jobs')
+
+    def __unicode__(self):
+        return self.source
+
+# The statistics and the activity log are kept by signal handlers on the
+# models of other applications, they must be connected before any of them
+# is saved.
+import e_cidadania.apps.spaces.stats
+import e_cidadania.apps.spaces.activity
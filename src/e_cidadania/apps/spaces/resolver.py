@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Space resolver. Almost every view of the platform works inside a space given
+by its URL, so the spaces are kept in a process-wide cache by URL which is
+invalidated when a space is saved or deleted. The views get the space with
+:class:`SpaceMixin` or :func:`get_space_or_404` and read it once per request.
+
+Other processes can serve a cached space for SPACE_CACHE_TIMEOUT seconds
+after it changed, so access checks must use :func:`is_public` instead of the
+'public' attribute of the cached space.
+"""
+
+import copy
+import time
+import threading
+
+from django.db.models.signals import post_save, post_delete
+from django.http import Http404
+
+from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.spaces.settings import SPACE_CACHE_TIMEOUT
+
+# url: (expiration time, space)
+_spaces = {}
+_lock = threading.Lock()
+
+
+def get_space(url):
+    """
+    Returns the space with the given URL or None if it doesn't exist. Every
+    call returns a different copy of the space, so changing it doesn't
+    change the cached space.
+    """
+    now = time.time()
+    cached = _spaces.get(url)
+    if cached is None or cached[0] < now:
+        try:
+            space = Space.objects.get(url=url)
+        except Space.DoesNotExist:
+            return None
+        cached = (now + SPACE_CACHE_TIMEOUT, space)
+        with _lock:
+            _spaces[url] = cached
+    return copy.copy(cached[1])
+
+
+def get_space_or_404(url):
+    """
+    Like :func:`get_space` but raises Http404 if the space doesn't exist.
+    """
+    space = get_space(url)
+    if space is None:
+        raise Http404('No space with url %s' % url)
+    return space
+
+
+def is_public(space):
+    """
+    Returns whether the space is public, read from the database and not from
+    the cache, since making a space private must take effect at once.
+    """
+    return Space.objects.filter(pk=space.pk, public=True).exists()
+
+
+def invalidate_space(sender, instance, **kwargs):
+    """
+    Remove a space from the cache. It's looked up by id, since its URL may
+    have just changed, and by URL, in case it's a new space reusing it.
+    """
+    with _lock:
+        for url, (expires, space) in _spaces.items():
+            if space.pk == instance.pk or url == instance.url:
+                del _spaces[url]
+
+post_save.connect(invalidate_space, sender=Space)
+post_delete.connect(invalidate_space, sender=Space)
+
+
+class SpaceMixin(object):
+
+    """
+    Mixin for the class-based views inside a space. It gets the space from
+    the URL once per request.
+
+    :attributes: space_url_kwarg: name of the URL argument with the space URL
+    """
+    space_url_kwarg = 'space_name'
+
+    def get_space(self):
+        if getattr(self, '_space', None) is None:
+            self._space = get_space_or_404(self.kwargs[self.space_url_kwarg])
+        return self._space
@@ -0,0 +1,61 @@
+"""
+Convenience module for access of custom spaces application settings,
+which enforces default settings when the main settings module does not
+contain the appropriate settings.
+"""
+from django.conf import settings
+
+# Seconds a space stays in the process-wide space cache. Changes made in the
+# same process are seen at once, this bounds how long other processes of
+# the site can show an old copy of a space.
+SPACE_CACHE_TIMEOUT = getattr(settings, 'SPACE_CACHE_TIMEOUT', 300)
+
+# Number of recent items of every module shown in the overview of a space.
+SPACE_OVERVIEW_ITEMS = getattr(settings, 'SPACE_OVERVIEW_ITEMS', 5)
+
+# Number of items in every page of the module tabs of a space.
+SPACE_TAB_PAGE_SIZE = getattr(settings, 'SPACE_TAB_PAGE_SIZE', 10)
+
+# Seconds a rendered page of a module tab stays in the cache. The pages are
+# keyed by the activity of the module, so they are not read again once an
+# item of the module is saved or deleted.
+SPACE_TAB_CACHE_TIMEOUT = getattr(settings, 'SPACE_TAB_CACHE_TIMEOUT', 600)
+
+# Seconds the browsers may reuse a page of a module tab without asking.
+SPACE_TAB_MAX_AGE = getattr(settings, 'SPACE_TAB_MAX_AGE', 60)
+
+# Number of entries of the space activity log shown in the overview of a
+# space and in the space feed.
+SPACE_ACTIVITY_ITEMS = getattr(settings, 'SPACE_ACTIVITY_ITEMS', 10)
+SPACE_FEED_ITEMS = getattr(settings, 'SPACE_FEED_ITEMS', 20)
+
+# Maximum length of the summary of the content kept in the activity log.
+SPACE_ACTIVITY_SUMMARY_LENGTH = getattr(settings,
+                                        'SPACE_ACTIVITY_SUMMARY_LENGTH', 300)
+
+# Number of entries in every page of the personal timeline of a user, and
+# seconds a page stays in the cache. The timeline isn't invalidated, so keep
+# the timeout short.
+SPACE_TIMELINE_ITEMS = getattr(settings, 'SPACE_TIMELINE_ITEMS', 20)
+SPACE_TIMELINE_CACHE_TIMEOUT = getattr(settings,
+                                       'SPACE_TIMELINE_CACHE_TIMEOUT', 60)
+
+# Maximum number of spaces read by every stream of the timeline merge.
+SPACE_TIMELINE_CHUNK_SIZE = getattr(settings, 'SPACE_TIMELINE_CHUNK_SIZE', 50)
+
+# Number of usernames or emails resolved by every query of the bulk import
+# of members. SQLite doesn't accept more than 999 parameters per query.
+SPACE_IMPORT_CHUNK_SIZE = getattr(settings, 'SPACE_IMPORT_CHUNK_SIZE', 400)
+
+# Number of objects read or inserted by every query of the space archives.
+SPACE_ARCHIVE_CHUNK_SIZE = getattr(settings, 'SPACE_ARCHIVE_CHUNK_SIZE', 500)
+
+# Background processing of the uploaded images: number of worker processes
+# and of jobs taken at once, seconds between polls of the job table, tries
+# before giving up on an image and seconds after which a running job is
+# considered lost and run again.
+SPACE_IMAGE_WORKERS = getattr(settings, 'SPACE_IMAGE_WORKERS', 2)
+SPACE_IMAGE_BATCH_SIZE = getattr(settings, 'SPACE_IMAGE_BATCH_SIZE', 20)
+SPACE_IMAGE_POLL_INTERVAL = getattr(settings, 'SPACE_IMAGE_POLL_INTERVAL', 2)
+SPACE_IMAGE_MAX_ATTEMPTS = getattr(settings, 'SPACE_IMAGE_MAX_ATTEMPTS', 3)
+SPACE_IMAGE_JOB_TIMEOUT = getattr(settings, 'SPACE_IMAGE_JOB_TIMEOUT', 600)
@@ -0,0 +1,6 @@
+-- Composite index for the range scans of the activity of a space.
+CREATE INDEX spaces_activity_space_timestamp ON spaces_activity (space_id, timestamp, id);
+-- Index to remove the activity of deleted content.
+CREATE INDEX spaces_activity_content ON spaces_activity (content_type_id, object_id);
+-- Index for the versions of the module tabs of a space.
+CREATE INDEX spaces_activity_space_module ON spaces_activity (space_id, module, id);
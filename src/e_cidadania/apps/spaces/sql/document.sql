@@ -0,0 +1,2 @@
+-- Composite index for the keyset pagination of the space document list.
+CREATE INDEX spaces_document_space_pub_date ON spaces_document (space_id, pub_date, id);
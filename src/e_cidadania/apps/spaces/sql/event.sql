@@ -0,0 +1,2 @@
+-- Composite index for the keyset pagination of the space event list.
+CREATE INDEX spaces_event_space_event_date ON spaces_event (space_id, event_date, id);
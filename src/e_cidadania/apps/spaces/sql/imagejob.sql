@@ -0,0 +1,4 @@
+-- Index for the workers looking for the next pending image jobs.
+CREATE INDEX spaces_imagejob_status ON spaces_imagejob (status, id);
+-- Index to find the resized image of an uploaded file.
+CREATE INDEX spaces_imagejob_source ON spaces_imagejob (source);
@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Materialized space statistics. Every space has a :class:`SpaceStats` row
+with the number of members, proposals, support votes, debates, debate notes,
+documents and news posts, so showing them costs a single row read. The
+counters are updated incrementally by the signal handlers of this module
+and :func:`rebuild` recalculates them in bulk from the tables.
+
+The spaces created before this table existed have no row, and the
+reconcile_space_stats command must be run once when deploying it to fill
+them. Until then their rows are created on demand.
+"""
+
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, pre_delete, \
+    post_delete, m2m_changed
+from django.contrib.auth.models import User
+
+from e_cidadania.apps.spaces.models import Space, SpaceStats, Document
+from e_cidadania.apps.accounts.models import UserProfile
+from e_cidadania.apps.news.models import Post
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.debate.models import Debate, Note
+
+FIELDS = ('members', 'proposals', 'votes', 'debates', 'notes', 'documents',
+          'posts')
+
+# Maximum number of ids sent in a single IN clause
+CHUNK_SIZE = 500
+
+
+def _count_sql(space_column):
+    """
+    Returns a dictionary with the SQL subquery which counts every statistic
+    of the space whose id is in the given column.
+    """
+    qn = connection.ops.quote_name
+
+    def column(model, name):
+        opts = model._meta
+        return '%s.%s' % (qn(opts.db_table), qn(opts.get_field(name).column))
+
+    def count(model, field):
+        return "SELECT COUNT(*) FROM %s WHERE %s = %s" % (
+            qn(model._meta.db_table), column(model, field), space_column)
+
+    def count_joined(model, fk, parent):
+        return "SELECT COUNT(*) FROM %s INNER JOIN %s ON %s = %s " \
+               "WHERE %s = %s" % (
+                   qn(model._meta.db_table), qn(parent._meta.db_table),
+                   column(model, fk), column(parent, parent._meta.pk.name),
+                   column(parent, 'space'), space_column)
+
+    return {
+        'members': count(UserProfile.spaces.through, 'space'),
+        'proposals': count(Proposal, 'space'),
+        'votes': count_joined(Proposal.support_votes.through, 'proposal',
+                              Proposal),
+        'debates': count(Debate, 'space'),
+        'notes': count_joined(Note, 'debate', Debate),
+        'documents': count(Document, 'space'),
+        'posts': count(Post, 'space'),
+    }
+
+
+def _chunks(items):
+    items = list(items)
+    for i in range(0, len(items), CHUNK_SIZE):
+        yield items[i:i + CHUNK_SIZE]
+
+
+def _batches(sql, column, spaces):
+    """
+    Returns the (sql, params) statements that run 'sql' for all the rows or,
+    if spaces isn't None, for every batch of the given space ids.
+    """
+    if spaces is None:
+        return [(sql, [])]
+    return [(sql + " AND %s IN (%s)" % (column, ', '.join(['%s'] * len(ids))),
+             ids) for ids in _chunks(set(spaces))]
+
+
+def _update(spaces=None, fields=FIELDS):
+    """
+    Recalculate the existing statistics of the given space ids, or of all the
+    spaces, with one UPDATE statement per batch.
+
+    :rtype: number of updated rows
+    """
+    qn = connection.ops.quote_name
+    opts = SpaceStats._meta
+    space_column = '%s.%s' % (qn(opts.db_table), qn(opts.pk.column))
+    counts = _count_sql(space_column)
+    sql = "UPDATE %s SET %s WHERE 1 = 1" % (qn(opts.db_table), ', '.join(
+        ['%s = (%s)' % (qn(opts.get_field(f).column), counts[f])
+         for f in fields]))
+    cursor = connection.cursor()
+    updated = 0
+    for statement, params in _batches(sql, space_column, spaces):
+        cursor.execute(statement, params)
+        updated += cursor.rowcount
+    return updated
+
+
+def _insert_missing(spaces=None, retries=3):
+    """
+    Create the statistics of the given space ids, or of all the spaces, which
+    don't have them yet, with one INSERT ... SELECT ... WHERE NOT EXISTS
+    statement per batch. If a concurrent request created some of them first
+    the batch is tried again, skipping them.
+
+    :rtype: number of created rows
+    """
+    qn = connection.ops.quote_name
+    opts = SpaceStats._meta
+    stats_table = qn(opts.db_table)
+    space_table = qn(Space._meta.db_table)
+    space_pk = '%s.%s' % (space_table, qn(Space._meta.pk.column))
+    counts = _count_sql(space_pk)
+    sql = "INSERT INTO %s (%s, %s) SELECT %s, %s FROM %s WHERE NOT EXISTS " \
+          "(SELECT 1 FROM %s WHERE %s.%s = %s)" % (
+              stats_table, qn(opts.pk.column),
+              ', '.join([qn(opts.get_field(f).column) for f in FIELDS]),
+              space_pk, ', '.join(['(%s)' % counts[f] for f in FIELDS]),
+              space_table, stats_table, stats_table, qn(opts.pk.column),
+              space_pk)
+    cursor = connection.cursor()
+    inserted = 0
+    for statement, params in _batches(sql, space_pk, spaces):
+        for attempt in range(retries, 0, -1):
+            sid = transaction.savepoint()
+            try:
+                cursor.execute(statement, params)
+                transaction.savepoint_commit(sid)
+                inserted += cursor.rowcount
+                break
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                if attempt == 1:
+                    raise
+    return inserted
+
+
+def rebuild(spaces=None):
+    """
+    Recalculate the statistics of the given space ids, or of all the spaces.
+    The existing rows are updated in place and the missing ones inserted, so
+    it can run while the counters are being updated. The caller manages the
+    transaction.
+
+    :rtype: number of rebuilt spaces
+    """
+    rebuilt = _update(spaces) + _insert_missing(spaces)
+    transaction.commit_unless_managed()
+    return rebuilt
+
+
+def recount(spaces, fields=FIELDS):
+    """
+    Recalculate some statistics of the given space ids. The spaces without
+    statistics are created.
+    """
+    spaces = set(s for s in spaces if s is not None)
+    if not spaces:
+        return
+    _update(spaces, fields)
+    _insert_missing(spaces)
+    transaction.commit_unless_managed()
+
+
+def increment(spaces, **deltas):
+    """
+    Add the deltas to the statistics of the given space ids, atomically.
+    The spaces without statistics are rebuilt instead.
+    """
+    spaces = set(s for s in spaces if s is not None)
+    deltas = dict((f, F(f) + d) for f, d in deltas.items() if d)
+    if not spaces or not deltas:
+        return
+    if len(spaces) == 1:
+        missing = not SpaceStats.objects.filter(space__in=spaces) \
+            .update(**deltas) and spaces
+    else:
+        SpaceStats.objects.filter(space__in=spaces).update(**deltas)
+        missing = spaces.difference(SpaceStats.objects.filter(
+            space__in=spaces).values_list('space', flat=True))
+    if missing:
+        rebuild(missing)
+
+
+def add_votes(votes):
+    """
+    Count votes written without the m2m_changed signal.
+
+    :param votes: dictionary of space id: number of new votes
+    """
+    for space_id, count in votes.items():
+        increment([space_id], votes=count)
+
+
+def get_stats(space):
+    """
+    Returns the statistics of a space (a Space or its id), rebuilding them
+    if they don't exist yet.
+    """
+    space_id = getattr(space, 'pk', space)
+    try:
+        return SpaceStats.objects.get(space=space_id)
+    except SpaceStats.DoesNotExist:
+        rebuild([space_id])
+        try:
+            return SpaceStats.objects.get(space=space_id)
+        except SpaceStats.DoesNotExist:
+            return SpaceStats(space_id=space_id)
+
+
+def attach_stats(spaces):
+    """
+    Set the 'space_stats' attribute of every space of the list with a
+    single query. Spaces without statistics get empty ones.
+    """
+    spaces = list(spaces)
+    stats = SpaceStats.objects.in_bulk([space.pk for space in spaces])
+    for space in spaces:
+        space.space_stats = stats.get(space.pk) or SpaceStats(space=space)
+    return spaces
+
+
+#
+# Signal handlers
+#
+
+def create_stats(sender, instance, created=False, **kwargs):
+    """
+    A new space starts with empty statistics.
+    """
+    if created:
+        SpaceStats.objects.create(space=instance)
+
+
+# Model: statistic counted for every instance in its space
+COUNTED = {
+    Proposal: 'proposals',
+    Debate: 'debates',
+    Document: 'documents',
+    Post: 'posts',
+}
+
+# Statistics which move with an item when it changes of space
+CONTAINED = {
+    Proposal: ('votes',),
+    Debate: ('notes',),
+}
+
+
+def remember_space(sender, instance, **kwargs):
+    instance._stats_space_id = instance.space_id
+
+
+def count_item(sender, instance, created=False, **kwargs):
+
+    """
+    Count a new item in its space, or move it between spaces.
+    """
+    field = COUNTED[sender]
+    old = getattr(instance, '_stats_space_id', None)
+    if created:
+        increment([instance.space_id], **{field: 1})
+    elif old != instance.space_id:
+        increment([old], **{field: -1})
+        increment([instance.space_id], **{field: 1})
+        if sender in CONTAINED:
+            recount([old, instance.space_id], CONTAINED[sender])
+    instance._stats_space_id = instance.space_id
+
+
+def uncount_item(sender, instance, **kwargs):
+
+    """
+    Discount a deleted item. The votes of a proposal and the notes of a
+    debate are deleted with it without signals, so they are recounted.
+    """
+    increment([instance.space_id], **{COUNTED[sender]: -1})
+    if sender in CONTAINED:
+        recount([instance.space_id], CONTAINED[sender])
+
+
+def _debate_space(debate_id):
+    if debate_id is None:
+        return None
+    spaces = list(Debate.objects.filter(pk=debate_id)
+                  .values_list('space', flat=True)[:1])
+    return spaces and spaces[0] or None
+
+
+def remember_debate(sender, instance, **kwargs):
+    instance._stats_debate_id = instance.debate_id
+
+
+def count_note(sender, instance, created=False, **kwargs):
+    old = getattr(instance, '_stats_debate_id', None)
+    if created:
+        debate = getattr(instance, '_debate_cache', None)
+        space_id = debate is not None and debate.space_id \
+                   or _debate_space(instance.debate_id)
+        increment([space_id], notes=1)
+    elif old != instance.debate_id:
+        recount([_debate_space(old), _debate_space(instance.debate_id)],
+                ('notes',))
+    instance._stats_debate_id = instance.debate_id
+
+
+def uncount_note(sender, instance, **kwargs):
+    # The debate is read again, when the note is deleted with its debate
+    # the debate is already gone and its post_delete handler recounts.
+    increment([_debate_space(instance.debate_id)], notes=-1)
+
+
+def count_members(sender, instance, action, reverse, pk_set, **kwargs):
+
+    """
+    Keep the member counters in sync with the spaces of the user profiles.
+    Added members are counted, removed or cleared ones are recounted.
+    """
+    if action == 'post_add' and pk_set:
+        if reverse:
+            increment([instance.pk], members=len(pk_set))
+        else:
+            increment(pk_set, members=1)
+    elif action == 'pre_clear' and not reverse:
+        instance._stats_spaces = list(instance.spaces.values_list('pk',
+                                                                  flat=True))
+    elif action == 'post_remove':
+        recount(reverse and [instance.pk] or pk_set or [], ('members',))
+    elif action == 'post_clear':
+        recount(reverse and [instance.pk] or
+                getattr(instance, '_stats_spaces', []), ('members',))
+
+
+def remember_member_spaces(sender, instance, **kwargs):
+    instance._stats_spaces = list(instance.spaces.values_list('pk', flat=True))
+
+
+def recount_member_spaces(sender, instance, **kwargs):
+    recount(getattr(instance, '_stats_spaces', []), ('members',))
+
+
+def _proposal_spaces(proposals):
+    spaces = {}
+    for ids in _chunks(proposals):
+        for space_id in Proposal.objects.filter(pk__in=ids) \
+                .values_list('space', flat=True):
+            spaces[space_id] = spaces.get(space_id, 0) + 1
+    return spaces
+
+
+def count_votes(sender, instance, action, reverse, pk_set, **kwargs):
+
+    """
+    Keep the vote counters in sync with the support votes of the proposals.
+    """
+    if action == 'post_add' and pk_set:
+        if reverse:
+            add_votes(_proposal_spaces(pk_set))
+        else:
+            increment([instance.space_id], votes=len(pk_set))
+    elif action == 'pre_clear' and reverse:
+        instance._stats_voted_spaces = list(instance.proposal_set
+            .values_list('space', flat=True).distinct())
+    elif action in ('post_remove', 'post_clear'):
+        if not reverse:
+            recount([instance.space_id], ('votes',))
+        elif action == 'post_remove':
+            recount(_proposal_spaces(pk_set or []), ('votes',))
+        else:
+            recount(getattr(instance, '_stats_voted_spaces', []), ('votes',))
+
+
+def remember_voted_spaces(sender, instance, **kwargs):
+    instance._stats_voted_spaces = list(instance.proposal_set
+        .values_list('space', flat=True).distinct())
+
+
+def recount_voted_spaces(sender, instance, **kwargs):
+    recount(getattr(instance, '_stats_voted_spaces', []), ('votes',))
+
+
+post_save.connect(create_stats, sender=Space)
+
+for model in COUNTED:
+    post_init.connect(remember_space, sender=model)
+    post_save.connect(count_item, sender=model)
+    post_delete.connect(uncount_item, sender=model)
+
+post_init.connect(remember_debate, sender=Note)
+post_save.connect(count_note, sender=Note)
+post_delete.connect(uncount_note, sender=Note)
+
+m2m_changed.connect(count_members, sender=UserProfile.spaces.through)
+pre_delete.connect(remember_member_spaces, sender=UserProfile)
+post_delete.connect(recount_member_spaces, sender=UserProfile)
+
+m2m_changed.connect(count_votes, sender=Proposal.support_votes.through)
+pre_delete.connect(remember_voted_spaces, sender=User)
+post_delete.connect(recount_voted_spaces, sender=User)
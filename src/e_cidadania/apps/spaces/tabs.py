@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Module tabs of the space index page. The index page only renders the
+overview of the space, and every module tab (news, debates, proposals,
+documents and events) is loaded on demand from its own paginated fragment.
+The rendered fragments are cached by space, tab and page under a version
+of the tab read from the activity log, so every process of the site stops
+reading the old pages as soon as an item of the module is saved or deleted.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils import translation
+
+from e_cidadania.apps.spaces.models import Document, Event, Activity
+from e_cidadania.apps.news.models import Post
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.debate.models import Debate
+
+
+class SpaceTab(object):
+
+    """
+    A module tab of the space index page.
+
+    :attributes: - name: name of the tab in the URL
+                 - module: Space field which enables the module
+                 - model: model of the items listed in the tab
+                 - keyset: sort field of the items, '-' for descending
+                 - related: foreign keys rendered with every item, besides
+                   the space
+                 - perms: permissions that change the rendered items
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, name, module, model, keyset, related=(), perms=()):
+        self.name = name
+        self.module = module
+        self.model = model
+        self.keyset = keyset
+        self.related = related
+        self.perms = perms
+
+    @property
+    def template_name(self):
+        return 'spaces/tabs/%s.html' % self.name
+
+    def enabled(self, space):
+        return bool(getattr(space, self.module))
+
+    def get_queryset(self, space):
+        # The URLs of the items are built with the URL of their space
+        return self.model.objects.filter(space=space.id) \
+            .select_related('space', *self.related)
+
+    def version(self, space_id):
+        """
+        Returns the current version of the tab in the space: the newest
+        activity entry of the module and the number of them. Saving an item
+        appends an entry and deleting it removes its entries, so the old
+        pages are never read again.
+        """
+        log = Activity.objects.filter(space=space_id, module=self.name) \
+            .aggregate(last=Max('id'), entries=Count('id'))
+        return '%s.%s' % (log['last'] or 0, log['entries'])
+
+    def cache_key(self, space, user, page):
+        """
+        Returns the cache key of a page of the tab as seen by the user. The
+        user only matters through the permissions of the tab.
+        """
+        perms = ''.join([user.has_perm(perm) and '1' or '0'
+                         for perm in self.perms])
+        return 'space-tab:%s:%s:%s:%s:%s:%s' % (
+            space.id, self.name, self.version(space.id), perms,
+            translation.get_language(), hashlib.md5(page).hexdigest())
+
+
+TABS = dict((tab.name, tab) for tab in (
+    SpaceTab('news', 'mod_news', Post, '-pub_date', related=('author',),
+             perms=('news.edit_post', 'news.delete_post')),
+    SpaceTab('debates', 'mod_debate', Debate, '-date', related=('author',)),
+    SpaceTab('proposals', 'mod_proposals', Proposal, '-pub_date',
+             related=('author',)),
+    SpaceTab('docs', 'mod_docs', Document, '-pub_date'),
+    SpaceTab('events', 'mod_cal', Event, '-event_date'),
+))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+from django import template
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, sizes=None):
+    """
+    Draws a responsive image of a StdImageField: a <picture> with the
+    WebP and the original format renditions of the image, so the browser
+    downloads the smallest one that fills the space. Images without
+    renditions are drawn with a plain <img>.
+
+    Usage (in template):
+
+    {% load space_images %}
+    {% picture get_place.banner %}
+    {% picture get_place.logo "50px" %}
+
+    The sizes attribute defaults to the full width of the screen up to the
+    width of the resized image.
+    """
+    src = conditional_escape(image.display_url)
+    srcset = image.srcset
+    if not srcset:
+        return mark_safe('<img src="%s" />' % src)
+
+    if sizes is None and image.field.size:
+        width = image.field.size['width']
+        sizes = '(max-width: %spx) 100vw, %spx' % (width, width)
+    elif sizes is None:
+        sizes = '100vw'
+    sizes = conditional_escape(sizes)
+    html = ['<picture>']
+    if image.webp_srcset:
+        html.append('<source type="image/webp" srcset="%s" sizes="%s" />' %
+                    (conditional_escape(image.webp_srcset), sizes))
+    html.append('<img src="%s" srcset="%s" sizes="%s" />' %
+                (src, conditional_escape(srcset), sizes))
+    html.append('</picture>')
+    return mark_safe(''.join(html))
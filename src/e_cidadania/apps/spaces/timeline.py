@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Personal timeline. It shows to a user the activity of all the spaces of
+their profile, newest first. Every stream of the merge reads the activity log
+of a chunk of the spaces with the (space, timestamp) index, and the streams
+are merged with a heap, so a page costs the same number of queries for a
+user in five spaces and for a user in two hundred.
+"""
+
+import base64
+import hashlib
+import heapq
+from calendar import timegm
+from itertools import islice
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.encoding import smart_str, smart_unicode
+
+from e_cidadania.pagination import InvalidCursor
+from e_cidadania.apps.spaces.models import Space, Activity
+from e_cidadania.apps.spaces.membership import space_ids
+from e_cidadania.apps.spaces.tabs import TABS
+from e_cidadania.apps.spaces.settings import SPACE_TIMELINE_ITEMS, \
+    SPACE_TIMELINE_CACHE_TIMEOUT, SPACE_TIMELINE_CHUNK_SIZE
+
+# Maximum number of ids in the queries of the space modules
+SPACE_BATCH_SIZE = 500
+
+
+def make_cursor(entry):
+    """
+    Returns the opaque cursor of the page that starts after the entry.
+    """
+    return base64.urlsafe_b64encode('%s:%s' % (entry.pk, entry.timestamp))
+
+
+def parse_cursor(cursor):
+    """
+    Returns the (primary key, timestamp) of a cursor.
+    """
+    try:
+        pk, value = base64.urlsafe_b64decode(smart_str(cursor)).split(':', 1)
+        timestamp = Activity._meta.get_field('timestamp') \
+            .to_python(smart_unicode(value))
+        return int(pk), timestamp
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _sort_key(entry):
+    # heapq only merges in ascending order
+    stamp = entry.timestamp
+    return (-(timegm(stamp.timetuple()) * 1000000 + stamp.microsecond),
+            -entry.pk)
+
+
+def _stream(queryset):
+    for entry in queryset:
+        yield _sort_key(entry), entry
+
+
+def module_groups(ids):
+    """
+    Returns the given space ids grouped by the modules enabled in them, as
+    a {(module, ...): [space_id, ...]} dictionary.
+    """
+    ids = sorted(ids)
+    flags = [tab.module for tab in TABS.values()]
+    groups = {}
+    for start in range(0, len(ids), SPACE_BATCH_SIZE):
+        spaces = Space.objects.filter(pk__in=ids[start:start + SPACE_BATCH_SIZE])
+        for space in spaces.only('id', *flags):
+            modules = ['space'] + [name for name, tab in TABS.items()
+                                   if tab.enabled(space)]
+            groups.setdefault(tuple(sorted(modules)), []).append(space.id)
+    return groups
+
+
+def merge_activity(ids, after=None, count=SPACE_TIMELINE_ITEMS,
+                   chunk_size=SPACE_TIMELINE_CHUNK_SIZE):
+    """
+    Returns the 'count' newest activity entries of the given spaces older
+    than the 'after' cursor, and the cursor of the next page, or None if it
+    is the last one. Only the modules enabled in every space are read.
+    """
+    seek = None
+    if after is not None:
+        pk, timestamp = parse_cursor(after)
+        seek = Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk)
+
+    streams = []
+    for modules, group in module_groups(ids).items():
+        for start in range(0, len(group), chunk_size):
+            entries = Activity.objects.filter(
+                space__in=group[start:start + chunk_size], module__in=modules)
+            if seek is not None:
+                entries = entries.filter(seek)
+            entries = entries.select_related('space', 'author') \
+                .order_by('-timestamp', '-id')[:count + 1]
+            streams.append(_stream(entries))
+
+    entries = [entry for key, entry in
+               islice(heapq.merge(*streams), count + 1)]
+    if len(entries) > count:
+        return entries[:count], make_cursor(entries[count - 1])
+    return entries, None
+
+
+def user_timeline(user, after=None, count=SPACE_TIMELINE_ITEMS):
+    """
+    Returns a page of the timeline of the user, like :func:`merge_activity`.
+    The pages are cached for a short time for every user, and they are
+    thrown away when the spaces of the user change.
+    """
+    ids = space_ids(user)
+    key = 'space-timeline:%s:%s' % (user.pk, hashlib.md5('%s|%s|%s' % (
+        sorted(ids), after, count)).hexdigest())
+    page = cache.get(key)
+    if page is None:
+        page = merge_activity(ids, after, count)
+        cache.set(key, page, SPACE_TIMELINE_CACHE_TIMEOUT)
+    return page
@@ -28,7 +28,8 @@ from e_cidadania.apps.spaces.views import GoToSpace, ViewSpaceIndex, ListSpaces,
                                           DeleteSpace, ListDocs, DeleteDocument, \
                                           ListEvents, DeleteEvent, ViewEvent, \
                                           ListPosts, SpaceFeed, AddDocument, \
-                                          EditDocument, AddEvent, EditEvent
+                                          EditDocument, AddEvent, EditEvent, \
+                                          SpaceTabView, Timeline
 
 # NOTICE: Don't change the order of urlpatterns or it will probably break.
 
@@ -87,8 +88,12 @@ urlpatterns += patterns('e_cidadania.apps.spaces.views',
     url(r'^(?P<space_name>\w+)/delete/$', DeleteSpace.as_view(), name='delete-space'),
     
     url(r'^(?P<space_name>\w+)/news/', ListPosts.as_view(), name='list-space-news'),
+
+    url(r'^(?P<space_name>\w+)/tab/(?P<tab>\w+)/$', SpaceTabView.as_view(), name='space-tab'),
         
     url(r'^add/$', 'create_space', name='create-space'),
+
+    url(r'^timeline/$', Timeline.as_view(), name='space-timeline'),
     
     url(r'^$', ListSpaces.as_view(), name='list-spaces'),
 
@@ -23,7 +23,6 @@ These are the views that control the spaces, meetings and documents.
 """
 
 import datetime
-import itertools
 
 # Generic class-based views
 from django.views.generic.base import TemplateView, RedirectView
@@ -39,15 +38,18 @@ from django.contrib.auth.decorators import login_required, permission_required
 
 # Response types
 from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import render_to_response, get_object_or_404, redirect
 
 # Some extras
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.template import RequestContext
-from django.contrib.syndication.views import Feed, FeedDoesNotExist
 from django.utils.translation import ugettext_lazy as _
 from django.db import connection
+from django.db.models import Q, Max, Count
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
 
 # Function-based views
 from django.views.generic.list_detail import object_list, object_detail
@@ -55,20 +57,32 @@ from django.views.generic.create_update import create_object, update_object
 from django.views.generic.create_update import delete_object
 
 # e-cidadania data models
-from e_cidadania.apps.spaces.models import Space, Entity, Document, Event
+from e_cidadania.feeds import CachedFeed
+from e_cidadania.pagination import KeysetPaginationMixin, InvalidCursor
+from e_cidadania.apps.spaces.models import Space, Entity, Document, Event, \
+     Activity
+from e_cidadania.apps.spaces.resolver import SpaceMixin, get_space_or_404, \
+    is_public
+from e_cidadania.apps.spaces.membership import is_member
+from e_cidadania.apps.spaces.tabs import TABS
+from e_cidadania.apps.spaces.stats import get_stats, attach_stats
+from e_cidadania.apps.spaces.activity import space_activity
+from e_cidadania.apps.spaces.timeline import user_timeline
+from e_cidadania.apps.spaces.settings import SPACE_OVERVIEW_ITEMS, \
+     SPACE_TAB_PAGE_SIZE, SPACE_TAB_CACHE_TIMEOUT, SPACE_TAB_MAX_AGE, \
+     SPACE_ACTIVITY_ITEMS, SPACE_FEED_ITEMS
+from e_cidadania.apps.accounts.models import prefetch_profiles
 from e_cidadania.apps.news.models import Post
 from e_cidadania.apps.spaces.forms import SpaceForm, DocForm, EventForm, \
      EntityFormSet
-from e_cidadania.apps.proposals.models import Proposal
 from e_cidadania.apps.staticpages.models import StaticPage
-from e_cidadania.apps.debate.models import Debate
 from django.conf import settings
 
 #
 # RSS FEED
 #
 
-class SpaceFeed(Feed):
+class SpaceFeed(CachedFeed):
 
     """
     Returns a space feed with the content of various applciations. In the future
@@ -76,9 +90,17 @@ class SpaceFeed(Feed):
     """
 
     def get_object(self, request, space_name):
-        current_space = get_object_or_404(Space, url=space_name)
+        current_space = get_space_or_404(space_name)
         return current_space
 
+    def feed_key(self, obj):
+        return 'space:%s' % obj.pk
+
+    def state(self, obj):
+        state = Activity.objects.filter(space=obj.pk) \
+            .aggregate(newest=Max('timestamp'), items=Count('id'))
+        return state['newest'], state['items']
+
     def title(self, obj):
         return _("%s feed") % obj.name
 
@@ -89,13 +111,23 @@ class SpaceFeed(Feed):
         return _("All the recent activity in %s ") % obj.name
 
     def items(self, obj):
-        results = itertools.chain(
-            Post.objects.all().filter(space=obj).order_by('-pub_date')[:10],
-            Proposal.objects.all().filter(space=obj).order_by('-pub_date')[:10],
-            Event.objects.all().filter(space=obj).order_by('-pub_date')[:10],
-        ) 
-        
-        return sorted(results, key=lambda x: x.pub_date, reverse=True)
+        return space_activity(obj, SPACE_FEED_ITEMS)
+
+    def item_title(self, item):
+        return u'%s: %s' % (item.get_module_display(), item.title)
+
+    def item_description(self, item):
+        return item.summary
+
+    def item_link(self, item):
+        return item.url
+
+    def item_guid(self, item):
+        # The same content can be in the feed several times
+        return u'%s#%s' % (item.url, item.pk)
+
+    def item_pubdate(self, item):
+        return item.timestamp
 
 #
 # SPACE VIEWS
@@ -150,7 +182,7 @@ def create_space(request):
                                   context_instance=RequestContext(request))
                                   
 
-class ViewSpaceIndex(DetailView):
+class ViewSpaceIndex(SpaceMixin, DetailView):
 
     """
     Returns the index page for a space. The access to spaces is restricted and
@@ -159,16 +191,16 @@ class ViewSpaceIndex(DetailView):
     
     :attributes: space_object, place
     :rtype: Object
-    :context: get_place, entities, documents, proposals, publication
+    :context: get_place, entities, activity, next_events, stats
     """
     context_object_name = 'get_place'
     template_name = 'spaces/space_index.html'
     
     def get_object(self):
         space_name = self.kwargs['space_name']
-        space_object = get_object_or_404(Space, url = space_name)
+        space_object = self.get_space()
 
-        if space_object.public == True or self.request.user.is_staff:
+        if self.request.user.is_staff or is_public(space_object):
             if self.request.user.is_anonymous():
                 messages.info(self.request, _("Hello anonymous user. Remember \
                                               that this space is public to view, but \
@@ -183,9 +215,8 @@ class ViewSpaceIndex(DetailView):
             self.template_name = 'not_allowed.html'
             return space_object
 
-        for i in self.request.user.profile.spaces.all():
-            if i.url == space_name:
-                return space_object
+        if is_member(self.request.user, space_object):
+            return space_object
         
         messages.warning(self.request, _("You're not registered to this space."))
         self.template_name = 'not_allowed.html'
@@ -194,15 +225,101 @@ class ViewSpaceIndex(DetailView):
     # Get extra context data
     def get_context_data(self, **kwargs):
         context = super(ViewSpaceIndex, self).get_context_data(**kwargs)
-        place = get_object_or_404(Space, url=self.kwargs['space_name'])
+        place = self.get_space()
         context['entities'] = Entity.objects.filter(space=place.id)
-        context['documents'] = Document.objects.filter(space=place.id)
-        context['proposals'] = Proposal.objects.filter(space=place.id).order_by('-pub_date')
-        context['publication'] = Post.objects.filter(space=place.id).order_by('-pub_date')[:10]
+        context['stats'] = get_stats(place)
         context['page'] = StaticPage.objects.filter(show_footer=True).order_by('-order')
         context['messages'] = messages.get_messages(self.request)
-        context['debates'] = Debate.objects.filter(space=place.id).order_by('-date')
-        context['event'] = Event.objects.filter(space=place.id).order_by('-event_date')
+        # The tabs are loaded on demand by SpaceTabView
+        context['activity'] = space_activity(place, SPACE_ACTIVITY_ITEMS)
+        if place.mod_cal:
+            context['next_events'] = Event.objects.filter(space=place.id,
+                event_date__gte=datetime.date.today()).select_related('space') \
+                .order_by('event_date', 'pk')[:SPACE_OVERVIEW_ITEMS]
+        return context
+
+
+class SpaceTabView(SpaceMixin, KeysetPaginationMixin, ListView):
+
+    """
+    Returns a page of one of the module tabs of the space index page, as an
+    HTML fragment. Disabled modules return 404 without any query. The pages
+    are cached until an item of the module is saved or deleted in the
+    space, and browsers may keep them for SPACE_TAB_MAX_AGE seconds.
+
+    :rtype: HTML fragment
+    :context: get_place, tab, object_list, page_obj
+    """
+    context_object_name = 'object_list'
+    paginate_by = SPACE_TAB_PAGE_SIZE
+
+    def get_tab(self):
+        try:
+            return TABS[self.kwargs['tab']]
+        except KeyError:
+            raise Http404
+
+    def get_keyset(self):
+        return self.get_tab().keyset
+
+    def get_template_names(self):
+        return [self.get_tab().template_name]
+
+    def get_queryset(self):
+        return self.get_tab().get_queryset(self.get_space())
+
+    def get(self, request, *args, **kwargs):
+        place = self.get_space()
+        tab = self.get_tab()
+        if not tab.enabled(place):
+            raise Http404
+        if not (request.user.is_staff or is_member(request.user, place)
+                or is_public(place)):
+            raise PermissionDenied
+
+        key = tab.cache_key(place, request.user, request.GET.urlencode())
+        content = cache.get(key)
+        if content is None:
+            response = super(SpaceTabView, self).get(request, *args, **kwargs)
+            content = response.render().content
+            cache.set(key, content, SPACE_TAB_CACHE_TIMEOUT)
+        response = HttpResponse(content)
+        patch_cache_control(response, private=True,
+                            max_age=SPACE_TAB_MAX_AGE)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super(SpaceTabView, self).get_context_data(**kwargs)
+        context['get_place'] = self.get_space()
+        context['tab'] = self.get_tab().name
+        return context
+
+
+class Timeline(TemplateView):
+
+    """
+    Show the activity of all the spaces of the user, newest first. The
+    older pages are read from the 'after' GET parameter.
+
+    :rtype: HTML
+    :context: entries, next_cursor
+    """
+    template_name = 'spaces/timeline.html'
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super(Timeline, self).dispatch(*args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(Timeline, self).get_context_data(**kwargs)
+        try:
+            entries, next_cursor = user_timeline(self.request.user,
+                                                 self.request.GET.get('after'))
+        except InvalidCursor:
+            raise Http404
+        context['entries'] = entries
+        context['next_cursor'] = next_cursor
         return context
         
 
@@ -249,12 +366,11 @@ def edit_space(request, space_name):
             #messages.success(request, _('Space edited successfully'))
             return redirect('/spaces/' + space)
 
-    for i in request.user.profile.spaces.all():
-        if i.url == space_name or request.user.is_staff:
-            return render_to_response('spaces/space_edit.html',
-                              {'form': form, 'get_place': place,
-                              'entityformset': entity_forms},
-                              context_instance=RequestContext(request))
+    if request.user.is_staff or is_member(request.user, place):
+        return render_to_response('spaces/space_edit.html',
+                          {'form': form, 'get_place': place,
+                          'entityformset': entity_forms},
+                          context_instance=RequestContext(request))
             
     return render_to_response('not_allowed.html', context_instance=RequestContext(request))
 
@@ -293,7 +409,7 @@ class GoToSpace(RedirectView):
         return '/spaces/%s' % self.place.url
 
 
-class ListSpaces(ListView):
+class ListSpaces(KeysetPaginationMixin, ListView):
 
     """
     Return a list of spaces in the system (except private ones) using a generic view.
@@ -304,22 +420,29 @@ class ListSpaces(ListView):
     :contexts: object_list
     """
     paginate_by = 10
+    keyset = 'name'
+    count_timeout = 300
     
     def get_queryset(self):
         public_spaces = Space.objects.all().filter(public=True)
         
         if not self.request.user.is_anonymous():
-            user_spaces = self.request.user.profile.spaces.all()
-            return public_spaces | user_spaces
+            return Space.objects.filter(Q(public=True) |
+                Q(userprofile__user=self.request.user)).distinct()
             
         return public_spaces
+
+    def get_context_data(self, **kwargs):
+        context = super(ListSpaces, self).get_context_data(**kwargs)
+        attach_stats(context['object_list'])
+        return context
  
 
 #
 # DOCUMENTS VIEWS
 #
 
-class AddDocument(FormView):
+class AddDocument(SpaceMixin, FormView):
 
     """
     Upload a new document and attach it to the current space.
@@ -331,11 +454,11 @@ class AddDocument(FormView):
     template_name = 'spaces/document_add.html'
     
     def get_success_url(self):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         return '/spaces/' + self.space.name
 
     def form_valid(self, form):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         form_uncommited = form.save(commit=False)
         form_uncommited.space = self.space
         form_uncommited.author = self.request.user
@@ -345,7 +468,7 @@ class AddDocument(FormView):
     
     def get_context_data(self, **kwargs):
         context = super(AddDocument, self).get_context_data(**kwargs)
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         context['get_place'] = self.space
         return context
         
@@ -354,7 +477,7 @@ class AddDocument(FormView):
         return super(AddDocument, self).dispatch(*args, **kwargs)
         
 
-class EditDocument(UpdateView):
+class EditDocument(SpaceMixin, UpdateView):
 
     """
     Returns a DocForm filled with the current document data.
@@ -366,7 +489,7 @@ class EditDocument(UpdateView):
     template_name = 'spaces/document_edit.html'
 
     def get_success_url(self):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         return '/spaces/' + self.space.name
 
     def get_object(self):
@@ -375,7 +498,7 @@ class EditDocument(UpdateView):
         
     def get_context_data(self, **kwargs):
         context = super(EditDocument, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
     @method_decorator(permission_required('spaces.edit_document'))
@@ -383,7 +506,7 @@ class EditDocument(UpdateView):
         return super(EditDocument, self).dispatch(*args, **kwargs)
         
 
-class DeleteDocument(DeleteView):
+class DeleteDocument(SpaceMixin, DeleteView):
 
     """
     Returns a confirmation page before deleting the current document.
@@ -401,11 +524,11 @@ class DeleteDocument(DeleteView):
         
     def get_context_data(self, **kwargs):
         context = super(DeleteDocument, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
 
 
-class ListDocs(ListView):
+class ListDocs(SpaceMixin, KeysetPaginationMixin, ListView):
 
     """
     Returns a list of documents attached to the current space.
@@ -414,10 +537,12 @@ class ListDocs(ListView):
     :context: object_list, get_place
     """
     paginate_by = 25
+    keyset = 'pub_date'
+    count_timeout = 300
     context_object_name = 'document_list'
 
     def get_queryset(self):
-        place = get_object_or_404(Space, url=self.kwargs['space_name'])
+        place = self.get_space()
         objects = Document.objects.all().filter(space=place.id).order_by('pub_date')
         
         if self.request.user.is_staff:
@@ -427,16 +552,15 @@ class ListDocs(ListView):
             self.template_name = 'not_allowed.html'
             return objects
         
-        for i in self.request.user.profile.spaces.all():
-            if i.url == place:
-                return objects
+        if is_member(self.request.user, place):
+            return objects
         
         self.template_name = 'not_allowed.html'
         return objects
 
     def get_context_data(self, **kwargs):
         context = super(ListDocs, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
         
@@ -444,7 +568,7 @@ class ListDocs(ListView):
 # EVENT VIEWS
 #
 
-class AddEvent(FormView):
+class AddEvent(SpaceMixin, FormView):
 
     """
     Returns an empty MeetingForm to create a new Meeting. Space and author fields
@@ -460,7 +584,7 @@ class AddEvent(FormView):
          return '/spaces/' + self.space.name
 
     def form_valid(self, form):
-        self.space = get_object_or_404(Space, url=self.kwarspace_name)
+        self.space = self.get_space()
         form_uncommited = form.save(commit=False)
         form_uncommited.event_author = self.request.user
         form_uncommited.space = self.space
@@ -469,17 +593,17 @@ class AddEvent(FormView):
 
     def get_context_data(self, **kwargs):
         context = super(AddEvent, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
 
 
-class ViewEvent(DetailView):
+class ViewEvent(SpaceMixin, DetailView):
     
     """
     View the content of a event.
     
     :rtype: Object
-    :context: event, get_place
+    :context: event, get_place, attendants
     """
     context_object_name = 'event'
     template_name = 'spaces/event_detail.html'
@@ -489,17 +613,19 @@ class ViewEvent(DetailView):
 
         if self.request.user.is_anonymous():
             self.template_name = 'not_allowed.html'
-            return get_object_or_404(Space, url = space_name)
+            return self.get_space()
 
         return get_object_or_404(Event, pk = self.kwargs['event_id'])
 
     def get_context_data(self, **kwargs):
         context = super(ViewEvent, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
+        if isinstance(self.object, Event):
+            context['attendants'] = prefetch_profiles(self.object.user.all())
         return context
 
 
-class EditEvent(UpdateView):
+class EditEvent(SpaceMixin, UpdateView):
 
     """
     Returns a MeetingForm filled with the current Meeting data to be edited.
@@ -515,12 +641,12 @@ class EditEvent(UpdateView):
         return cur_event
         
     def get_success_url(self):
-        self.space = get_object_or_404(Space, url=self.kwargs['space_name'])
+        self.space = self.get_space()
         return '/spaces/' + self.space.name
     
     def get_context_data(self, **kwargs):
         context = super(EditEvent, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
     @method_decorator(permission_required('spaces.edit_event'))
@@ -528,7 +654,7 @@ class EditEvent(UpdateView):
         return super(EditEvent, self).dispatch(*args, **kwargs)
         
       
-class DeleteEvent(DeleteView):
+class DeleteEvent(SpaceMixin, DeleteView):
 
     """
     Returns a confirmation page before deleting the Meeting object.
@@ -546,11 +672,11 @@ class DeleteEvent(DeleteView):
    
     def get_context_data(self, **kwargs):
         context = super(DeleteEvent, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
         
           
-class ListEvents(ListView):
+class ListEvents(SpaceMixin, KeysetPaginationMixin, ListView):
 
     """
     List all the events attached to a space.
@@ -559,24 +685,26 @@ class ListEvents(ListView):
     :context: event_list, get_place
     """
     paginate_by = 25
+    keyset = 'event_date'
+    count_timeout = 300
     context_object_name = 'event_list'
 
     def get_queryset(self):
-        place = get_object_or_404(Space, url=self.kwargs['space_name'])
+        place = self.get_space()
         objects = Event.objects.all().filter(space=place.id).order_by\
             ('event_date')
         return objects
 
     def get_context_data(self, **kwargs):
         context = super(ListEvents, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         return context
 
 #
 # NEWS RELATED
 #
 
-class ListPosts(ListView):
+class ListPosts(SpaceMixin, KeysetPaginationMixin, ListView):
 
     """
     Returns a list with all the posts attached to that space. It's similar to
@@ -586,11 +714,13 @@ class ListPosts(ListView):
     :context: post_list
     """
     paginate_by = 10
+    keyset = '-pub_date'
+    count_timeout = 300
     context_object_name = 'post_list'
     template_name = 'news/news_list.html'
     
     def get_queryset(self):
-        place = get_object_or_404(Space, url=self.kwargs['space_name'])
+        place = self.get_space()
         
         if settings.DEBUG:
             messages.set_level(self.request, messages.DEBUG)
@@ -600,7 +730,7 @@ class ListPosts(ListView):
     
     def get_context_data(self, **kwargs):
         context = super(ListPosts, self).get_context_data(**kwargs)
-        context['get_place'] = get_object_or_404(Space, url=self.kwargs['space_name'])
+        context['get_place'] = self.get_space()
         context['messages'] = messages.get_messages(self.request)
         return context
     
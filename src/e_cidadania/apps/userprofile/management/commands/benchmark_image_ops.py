@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Compare the cost of a chain of image operations (scale, crop, watermark and
+comment) run in a single PIL pass by TuxieMagick.Image against the original
+implementation, which spawns one ImageMagick process per operation. The
+ImageMagick path is skipped if it isn't installed.
+
+Usage: python manage.py benchmark_image_ops --size=2000 --repeat=10
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from optparse import make_option
+from distutils.spawn import find_executable
+
+import Image as PILImage
+from django.core.management.base import BaseCommand
+
+from e_cidadania.apps.userprofile.utils.TuxieMagick import Image, \
+    MagickImage
+
+
+class Command(BaseCommand):
+
+    """
+    Time the same chain of image operations with both implementations.
+    """
+    help = "Benchmark the in-process image operations against ImageMagick."
+    option_list = BaseCommand.option_list + (
+        make_option('--size', dest='size', type='int', default=2000,
+                    help='Width of the test image.'),
+        make_option('--repeat', dest='repeat', type='int', default=10,
+                    help='Number of times the chain is run.'),
+    )
+
+    def run(self, image_class, source, target, watermark, repeat):
+        start = time.time()
+        for i in range(repeat):
+            image = image_class(source)
+            image.scale(800)
+            image.crop('400x400')
+            image.watermark(watermark, '30')
+            image.comment('e-cidadania')
+            if not image.write(target):
+                return None
+        return (time.time() - start) / repeat
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(workdir, 'source.jpg')
+            watermark = os.path.join(workdir, 'watermark.png')
+            size = options['size']
+            PILImage.new('RGB', (size, size * 3 // 4), 'red').save(source)
+            PILImage.new('RGBA', (100, 40), (255, 255, 255, 128)) \
+                .save(watermark)
+            repeat = options['repeat']
+
+            self.stdout.write("path\t\tper chain (s)\n")
+            pil = self.run(Image, source, os.path.join(workdir, 'pil.jpg'),
+                           watermark, repeat)
+            self.stdout.write("single pass\t%.4f\n" % pil)
+            if not (find_executable('convert') and
+                    find_executable('composite')):
+                self.stdout.write("imagemagick\tskipped, not installed\n")
+                return
+            magick = self.run(MagickImage, source,
+                              os.path.join(workdir, 'magick.jpg'),
+                              watermark, repeat)
+            if magick is None:
+                self.stdout.write("imagemagick\tfailed\n")
+            else:
+                self.stdout.write("imagemagick\t%.4f\n" % magick)
+        finally:
+            shutil.rmtree(workdir)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Write all the sizes of the valid avatars. The sizes are written when an
+avatar is validated, this is only needed once for the avatars validated
+before, whose sizes were made the first time a page showed them.
+
+Usage: python manage.py make_avatar_sizes
+"""
+
+from django.core.management.base import NoArgsCommand
+
+from e_cidadania.apps.userprofile.models import Avatar
+from e_cidadania.apps.userprofile.thumbnails import make_sizes
+
+
+class Command(NoArgsCommand):
+
+    """
+    Write the sizes of every valid avatar.
+    """
+    help = "Write all the sizes of the valid avatars."
+
+    def handle_noargs(self, **options):
+        done = 0
+        for avatar in Avatar.objects.filter(valid=True).iterator():
+            try:
+                make_sizes(avatar.image.path)
+                done += 1
+            except IOError, e:
+                self.stderr.write("%s: %s\n" % (avatar.image.name, e))
+        self.stdout.write("Wrote the sizes of %s avatars.\n" % done)
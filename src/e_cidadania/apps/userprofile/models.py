@@ -44,13 +44,31 @@ class BaseProfile(models.Model):
 
 class Avatar(models.Model):
     """
-    Avatar model
+    Avatar model. The uploaded images are normalized, cropped and resized
+    by the process_avatars command, the status tells what is waiting.
     """
+    NEW = 'n'
+    UPLOADED = 'u'
+    CROP = 'c'
+    READY = 'r'
+    FAILED = 'f'
+    STATUSES = (
+        (NEW, _('normalizing')),
+        (UPLOADED, _('uploaded')),
+        (CROP, _('cropping')),
+        (READY, _('ready')),
+        (FAILED, _('failed')),
+    )
+
     #image = models.ImageField(upload_to="avatars/%Y/%b/%d")
     image = models.ImageField(upload_to="avatars/")
     user = models.ForeignKey(User)
     date = models.DateTimeField(auto_now_add=True)
     valid = models.BooleanField()
+    status = models.CharField(max_length=1, choices=STATUSES, default=READY)
+    box = models.CommaSeparatedIntegerField(max_length=50, blank=True)
+    started = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
 
     class Meta:
         unique_together = (('user', 'valid'),)
@@ -58,29 +76,29 @@ class Avatar(models.Model):
     def __unicode__(self):
         return _("%s's Avatar") % self.user
 
+    def files(self):
+        """
+        Returns the names of the image of the avatar and of all its sizes.
+        """
+        if not self.image.name:
+            return []
+        base, extension = os.path.splitext(self.image.name)
+        return [self.image.name] + ["%s.%s%s" % (base, key, extension)
+                                    for key in AVATAR_SIZES]
+
     def delete(self):
-        base, filename = os.path.split(self.image.path)
-        name, extension = os.path.splitext(filename)
-        for key in AVATAR_SIZES:
-            try:
-                os.remove(os.path.join(base, "%s.%s%s" % (name, key, extension)))
-            except:
-                pass
+        for name in self.files():
+            self.image.storage.delete(name)
 
         super(Avatar, self).delete()
 
-    def save(self):
+    def save(self, *args, **kwargs):
+        # The web views never replace an avatar, the process_avatars
+        # command retires the old ones in batches
         for avatar in Avatar.objects.filter(user=self.user, valid=self.valid).exclude(id=self.id):
-            base, filename = os.path.split(avatar.image.path)
-            name, extension = os.path.splitext(filename)
-            for key in AVATAR_SIZES:
-                try:
-                    os.remove(os.path.join(base, "%s.%s%s" % (name, key, extension)))
-                except:
-                    pass
             avatar.delete()
 
-        super(Avatar, self).save()
+        super(Avatar, self).save(*args, **kwargs)
 
 
 class EmailValidationManager(models.Manager):
@@ -160,3 +178,7 @@ class EmailValidation(models.Model):
         self.save()
         return True
 
+
+# The cached avatars are invalidated by signal handlers, they must be
+# connected before any avatar is saved.
+import e_cidadania.apps.userprofile.thumbnails
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Avatar pipeline. The avatar views only save the uploaded image and the crop
+box; the process_avatars command does the image work in a pool of worker
+processes:
+
+1. The uploaded image is normalized: scaled down to AVATAR_UPLOAD_SIZE and
+   saved as JPEG, for the crop page.
+2. Once the user chooses the crop box, the normalized image is cropped into
+   the final name of the avatar and all the AVATAR_SIZES are written. The
+   normalized image is kept until the avatar is valid, so a crop taken
+   again always starts from it. The previous avatars of the users of the
+   batch are removed in the same transaction that makes the new ones
+   valid, and their files are deleted by the workers. A user who uploaded
+   another image while the crop was running keeps the previous avatar.
+
+The status of an avatar tells the crop page what is waiting, see
+avatar_status().
+"""
+
+import os
+import datetime
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+
+from e_cidadania.apps.userprofile.models import Avatar
+from e_cidadania.apps.userprofile.thumbnails import make_sizes, \
+    avatar_url, forget_avatars
+
+# Number of worker processes and of avatars taken at once, seconds between
+# polls of the avatar table, and seconds after which an avatar being
+# processed is considered lost and processed again.
+AVATAR_WORKERS = getattr(settings, 'AVATAR_WORKERS', 2)
+AVATAR_BATCH_SIZE = getattr(settings, 'AVATAR_BATCH_SIZE', 20)
+AVATAR_POLL_INTERVAL = getattr(settings, 'AVATAR_POLL_INTERVAL', 1)
+AVATAR_JOB_TIMEOUT = getattr(settings, 'AVATAR_JOB_TIMEOUT', 300)
+
+# Biggest side of the uploaded images shown in the crop page.
+AVATAR_UPLOAD_SIZE = getattr(settings, 'AVATAR_UPLOAD_SIZE', 480)
+
+# The uploaded images wait here until they are normalized.
+INCOMING_DIR = 'avatars/incoming'
+
+# Names of the normalized image and of the cropped avatar.
+NORMALIZED_NAME = 'avatars/%s.upload.jpg'
+AVATAR_NAME = 'avatars/%s.jpg'
+
+# Names of the statuses in avatar_status()
+STATUS_NAMES = {
+    Avatar.NEW: 'normalizing',
+    Avatar.UPLOADED: 'uploaded',
+    Avatar.CROP: 'cropping',
+    Avatar.READY: 'ready',
+    Avatar.FAILED: 'failed',
+}
+
+_storage = Avatar._meta.get_field('image').storage
+
+
+def upload(user, image):
+    """
+    Saves the uploaded image and queues it to be normalized. The avatar of
+    the user waiting to be cropped, if any, is reused.
+    """
+    name = _storage.save(os.path.join(INCOMING_DIR, '%s.jpg' % user.username),
+                         image)
+    try:
+        avatar = Avatar.objects.get(user=user, valid=False)
+    except Avatar.DoesNotExist:
+        return Avatar.objects.create(user=user, valid=False, image=name,
+                                     status=Avatar.NEW)
+    # An upload that the workers didn't take yet is replaced
+    if avatar.status == Avatar.NEW and avatar.started is None:
+        _storage.delete(avatar.image.name)
+    if not Avatar.objects.filter(pk=avatar.pk, valid=False).update(
+            image=name, box='', error='', status=Avatar.NEW, started=None):
+        # It became the user avatar since we read it
+        return Avatar.objects.create(user=user, valid=False, image=name,
+                                     status=Avatar.NEW)
+    return avatar
+
+
+def crop(avatar, box):
+    """
+    Queues the avatar to be cropped with the given (left, top, right,
+    bottom) box.
+
+    :rtype: False if the avatar isn't waiting to be cropped
+    """
+    return bool(Avatar.objects.filter(pk=avatar.pk,
+        status__in=(Avatar.UPLOADED, Avatar.CROP)).update(
+        box=','.join([str(int(n)) for n in box]), status=Avatar.CROP,
+        started=None))
+
+
+def avatar_status(user):
+    """
+    Returns a dictionary with the status of the last avatar of the user, to
+    be polled by the crop pages: 'normalizing' and 'cropping' mean it's
+    waiting for the workers, 'uploaded' that it can be cropped, with the
+    'image' URL to crop, and 'ready' that it's the user avatar, with its
+    'avatar' URL.
+    """
+    avatars = dict((avatar.valid, avatar) for avatar in
+                   Avatar.objects.filter(user=user))
+    avatar = avatars.get(False) or avatars.get(True)
+    if avatar is None:
+        return {'status': 'none'}
+    data = {'status': STATUS_NAMES[avatar.status]}
+    if avatar.status == Avatar.UPLOADED:
+        data['image'] = avatar.image.url
+    elif avatar.valid:
+        data['avatar'] = avatar_url((avatar.image.name, avatar.pk), 96)
+    return data
+
+
+def run(task):
+    """
+    Does the image work of one avatar. It runs in the worker processes, so
+    it only works with paths.
+
+    :param task: ('normalize', upload path, normalized path),
+                 ('crop', normalized path, box, avatar path) or
+                 ('cleanup', [paths])
+    """
+    import Image
+    operation = task[0]
+    if operation == 'cleanup':
+        for path in task[1]:
+            if os.path.exists(path):
+                os.remove(path)
+        return
+
+    image = Image.open(task[1])
+    if operation == 'normalize':
+        # thumbnail() decodes JPEG images in draft mode by itself, PIL
+        # crashes if draft() is called twice
+        image.thumbnail((AVATAR_UPLOAD_SIZE, AVATAR_UPLOAD_SIZE),
+                        Image.ANTIALIAS)
+        image.convert('RGB').save(task[2], 'JPEG')
+        os.remove(task[1])
+    else:
+        image = image.crop(task[2])
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        image.save(task[3], 'JPEG')
+        make_sizes(task[3])
+
+
+def _safe_run(task):
+    # An exception would stop the whole batch of the pool
+    try:
+        run(task)
+        return None
+    except Exception:
+        return traceback.format_exc()
+
+
+def claim(limit=AVATAR_BATCH_SIZE):
+    """
+    Takes up to 'limit' avatars waiting for the workers. The avatars being
+    processed for longer than AVATAR_JOB_TIMEOUT seconds belong to a dead
+    worker and they are put back in the queue first.
+    """
+    now = datetime.datetime.now()
+    waiting = (Avatar.NEW, Avatar.CROP)
+    Avatar.objects.filter(status__in=waiting, started__lt=now -
+        datetime.timedelta(seconds=AVATAR_JOB_TIMEOUT)).update(started=None)
+    avatars = []
+    for avatar in Avatar.objects.filter(status__in=waiting,
+            started__isnull=True).order_by('id')[:limit]:
+        # Other workers could take it first
+        if Avatar.objects.filter(pk=avatar.pk, status=avatar.status,
+                started__isnull=True).update(started=now):
+            avatar.started = now
+            avatars.append(avatar)
+    return avatars
+
+
+def _task(avatar):
+    path = _storage.path(avatar.image.name)
+    if avatar.status == Avatar.NEW:
+        return ('normalize', path,
+                _storage.path(NORMALIZED_NAME % avatar.pk))
+    return ('crop', path, [int(n) for n in avatar.box.split(',')],
+            _storage.path(AVATAR_NAME % avatar.pk))
+
+
+@transaction.commit_on_success
+def _replace(avatars):
+    """
+    Makes the cropped avatars valid and removes the avatars they replace.
+    An avatar whose user uploaded another image after it was claimed is left
+    alone, and so is the previous avatar of that user.
+
+    :rtype: (replaced avatars, removed avatars)
+    """
+    held = [avatar for avatar in avatars if Avatar.objects.filter(
+        pk=avatar.pk, status=Avatar.CROP, started=avatar.started).update(
+        image=AVATAR_NAME % avatar.pk, status=Avatar.READY, started=None)]
+    # The old avatars must go before the new ones are valid
+    old = list(Avatar.objects.filter(valid=True,
+                                     user__in=[a.user_id for a in held]))
+    Avatar.objects.filter(pk__in=[a.pk for a in old]).delete()
+    Avatar.objects.filter(pk__in=[a.pk for a in held]).update(valid=True)
+    return held, old
+
+
+def _validate(avatars, pool=None):
+    held, old = _replace(avatars)
+    forget_avatars([a.user_id for a in held])
+
+    tasks = [('cleanup', [_storage.path(name) for name in avatar.files()])
+             for avatar in old]
+    # The normalized images aren't needed once the avatars are valid
+    tasks += [('cleanup', [_storage.path(avatar.image.name)])
+              for avatar in held]
+    if pool is not None:
+        pool.map(_safe_run, tasks)
+    else:
+        map(_safe_run, tasks)
+
+
+def process_avatars(pool=None, limit=AVATAR_BATCH_SIZE):
+    """
+    Takes a batch of avatars and does their image work in the pool of
+    worker processes, or in this process if there is no pool.
+
+    :rtype: number of processed avatars
+    """
+    avatars = claim(limit)
+    tasks = [_task(avatar) for avatar in avatars]
+    errors = pool is not None and pool.map(_safe_run, tasks) \
+        or map(_safe_run, tasks)
+
+    cropped = []
+    for avatar, error in zip(avatars, errors):
+        taken = Avatar.objects.filter(pk=avatar.pk, status=avatar.status,
+                                      started=avatar.started)
+        if error is not None:
+            taken.update(status=Avatar.FAILED, error=error, started=None)
+        elif avatar.status == Avatar.NEW:
+            # A newer upload is taken again with its own name
+            taken.filter(image=avatar.image.name).update(
+                image=NORMALIZED_NAME % avatar.pk, status=Avatar.UPLOADED,
+                started=None)
+        else:
+            cropped.append(avatar)
+    if cropped:
+        _validate(cropped, pool)
+    return len(avatars)
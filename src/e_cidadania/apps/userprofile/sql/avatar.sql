@@ -0,0 +1,2 @@
+-- Index for the workers looking for the avatars waiting to be processed.
+CREATE INDEX userprofile_avatar_status ON userprofile_avatar (status, started, id);
@@ -1,22 +1,15 @@
 # coding=UTF-8
 from django.template import Library, Node, Template, TemplateSyntaxError, \
-                            Variable
+                            Variable, VariableDoesNotExist
 from django.utils.translation import ugettext as _
-from e_cidadania.apps.userprofile.models import Avatar, AVATAR_SIZES
-from django.contrib.auth.models import User
-from django.conf import settings
-import Image
-# from PythonMagick import Image
-#from utils.TuxieMagick import Image
-import os
-import time
+from e_cidadania.apps.userprofile.models import AVATAR_SIZES
+from e_cidadania.apps.userprofile.thumbnails import avatar_versions, \
+                            avatar_url, default_url
 
 register = Library()
 
-if hasattr(settings, "DEFAULT_AVATAR") and settings.DEFAULT_AVATAR:
-    DEFAULT_AVATAR = settings.DEFAULT_AVATAR
-else:
-    DEFAULT_AVATAR = os.path.join(settings.MEDIA_ROOT, "generic.jpg")
+# Context variable with the avatar versions read by prefetch_avatars
+PREFETCHED = '_avatar_versions'
 
 class ResizedThumbnailNode(Node):
     def __init__(self, size, username=None):
@@ -31,34 +24,26 @@ class ResizedThumbnailNode(Node):
 
     def render(self, context):
         # If size is not an int, then it's a Variable, so try to resolve it.
-        if not isinstance(self.size, int):
-            self.size = int(self.size.resolve(context))
+        size = self.size
+        if not isinstance(size, int):
+            size = int(size.resolve(context))
 
-        if not self.size in AVATAR_SIZES:
+        if not size in AVATAR_SIZES:
             return ''
 
         try:
-            user = self.user.resolve(context)
-            avatar = Avatar.objects.get(user=user, valid=True).image
-            avatar_path = avatar.path
-            base, filename = os.path.split(avatar_path)
-            name, extension = os.path.splitext(filename)
-            filename = os.path.join(base, "%s.%s%s" % (name, self.size, extension))
-            base, temp = os.path.split(avatar.url)
-            url = os.path.join(base, "%s.%s%s" % (name, self.size, extension))
-        except:
-            avatar_path = DEFAULT_AVATAR
-            base, filename = os.path.split(avatar_path)
-            generic, extension = os.path.splitext(filename)
-            filename = os.path.join(base, "%s.%s%s" % (generic, self.size, extension))
-            url = filename.replace(settings.MEDIA_ROOT, settings.MEDIA_URL)
-
-        if not os.path.isfile(filename):
-            image = Image.open(avatar_path)
-            image.thumbnail((self.size, self.size), Image.ANTIALIAS)
-            image.save(filename, "JPEG")
+            user_id = getattr(self.user.resolve(context), 'pk', None)
+        except VariableDoesNotExist:
+            user_id = None
+        if not user_id:
+            return default_url(size)
 
-        return url
+        # The sizes are written when the avatar is validated, and the
+        # avatar of the user comes from the prefetched ones or the cache
+        versions = context.get(PREFETCHED) or {}
+        if user_id not in versions:
+            versions = avatar_versions([user_id])
+        return avatar_url(versions[user_id], size)
 
 @register.tag('avatar')
 def Thumbnail(parser, token):
@@ -73,3 +58,31 @@ def Thumbnail(parser, token):
     elif len(bits) < 2:
         bits.append("96")
     return ResizedThumbnailNode(bits[1], username)
+
+
+class PrefetchAvatarsNode(Node):
+    def __init__(self, users):
+        self.users = Variable(users)
+
+    def render(self, context):
+        users = self.users.resolve(context)
+        versions = dict(context.get(PREFETCHED) or {})
+        versions.update(avatar_versions([getattr(user, 'pk', user)
+                                         for user in users]))
+        context[PREFETCHED] = versions
+        return ''
+
+@register.tag('prefetch_avatars')
+def PrefetchAvatars(parser, token):
+    """
+    Reads the avatars of a list of users (or user ids) at once, so the
+    avatar tags that follow in the same block don't look for them one by
+    one. Usage:
+
+    {% prefetch_avatars authors %}
+    {% for author in authors %}<img src="{% avatar 32 author %}" />{% endfor %}
+    """
+    bits = token.contents.split()
+    if len(bits) != 2:
+        raise TemplateSyntaxError, _(u"You have to provide the list of users.")
+    return PrefetchAvatarsNode(bits[1])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+"""
+Avatar sizes. All the AVATAR_SIZES of an avatar are written when it's
+validated, and the avatar of every user is kept in the cache as its image
+name and id, so the avatar template tag builds the URLs without touching
+the database or the disk. The cached avatars of a whole page can be read
+at once with avatar_versions().
+"""
+
+import os
+
+import Image
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+from e_cidadania.apps.userprofile.models import Avatar, AVATAR_SIZES
+
+if hasattr(settings, "DEFAULT_AVATAR") and settings.DEFAULT_AVATAR:
+    DEFAULT_AVATAR = settings.DEFAULT_AVATAR
+else:
+    DEFAULT_AVATAR = os.path.join(settings.MEDIA_ROOT, "generic.jpg")
+
+# Seconds to keep the avatar of every user in the cache.
+AVATAR_CACHE_TIMEOUT = getattr(settings, 'AVATAR_CACHE_TIMEOUT', 60 * 60)
+
+_default_urls = {}
+
+
+def size_name(name, size):
+    """
+    Returns the name of the given size of an avatar image: the size goes
+    before the extension, like in 'user.96.jpg'.
+    """
+    base, extension = os.path.splitext(name)
+    return "%s.%s%s" % (base, size, extension)
+
+
+def make_sizes(path, sizes=AVATAR_SIZES):
+    """
+    Writes every size of the avatar image next to it. The image is decoded
+    once and every size is made from the previous one, from the biggest.
+    """
+    image = Image.open(path)
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        image.save(size_name(path, size), "JPEG")
+
+
+def default_url(size):
+    """
+    Returns the URL of the given size of the default avatar. The sizes are
+    written the first time they are needed by this process.
+    """
+    if not _default_urls:
+        if not all(os.path.isfile(size_name(DEFAULT_AVATAR, size))
+                   for size in AVATAR_SIZES):
+            make_sizes(DEFAULT_AVATAR)
+        for key in AVATAR_SIZES:
+            _default_urls[key] = size_name(DEFAULT_AVATAR, key).replace(
+                settings.MEDIA_ROOT, settings.MEDIA_URL)
+    return _default_urls[size]
+
+
+def _cache_key(user_id):
+    return 'avatar-version:%s' % user_id
+
+
+def avatar_versions(user_ids):
+    """
+    Returns a dictionary with the (image name, avatar id) of the valid
+    avatar of every user id, or an empty string for the users without one.
+    The cached versions are read with a single call and the missing ones
+    with a single query.
+    """
+    keys = dict((_cache_key(pk), pk) for pk in set(user_ids))
+    versions = dict((keys[key], version) for key, version in
+                    cache.get_many(keys.keys()).items())
+    missing = [pk for pk in keys.values() if pk not in versions]
+    if missing:
+        found = dict((user_id, (name, pk)) for user_id, name, pk in
+                     Avatar.objects.filter(user__in=missing, valid=True)
+                     .values_list('user', 'image', 'id'))
+        loaded = dict((pk, found.get(pk, '')) for pk in missing)
+        cache.set_many(dict((_cache_key(pk), version) for pk, version in
+                            loaded.items()), AVATAR_CACHE_TIMEOUT)
+        versions.update(loaded)
+    return versions
+
+
+def avatar_url(version, size):
+    """
+    Returns the URL of the given size of an avatar version, see
+    avatar_versions(). The avatar id is added to the URL because the names
+    of the avatar images are reused.
+    """
+    if not version:
+        return default_url(size)
+    name, pk = version
+    storage = Avatar._meta.get_field('image').storage
+    return "%s?%s" % (storage.url(size_name(name, size)), pk)
+
+
+def forget_avatars(user_ids):
+    """
+    Invalidate the cached avatars of the given users.
+    """
+    cache.delete_many([_cache_key(pk) for pk in user_ids])
+
+
+def forget_avatar(sender, instance, **kwargs):
+    """
+    Invalidate the cached avatar of the user when any of their avatars
+    changes.
+    """
+    forget_avatars([instance.user_id])
+
+post_save.connect(forget_avatar, sender=Avatar)
+post_delete.connect(forget_avatar, sender=Avatar)
@@ -43,6 +43,9 @@ urlpatterns = patterns('',
     url(r'^edit/avatar/crop/$', avatarcrop,
         name='profile_avatar_crop'),
 
+    url(r'^edit/avatar/status/$', avatarstatus,
+        name='profile_avatar_status'),
+
     url(r'^edit/avatar/crop/done/$', direct_to_template,
         { 'extra_context': {'section': 'avatar'},
         'template': 'userprofile/avatar/done.html'},
@@ -44,6 +44,9 @@ urlpatterns = patterns('',
     url(r'^perfil/editar/avatar/recortar/$', avatarcrop,
         name='profile_avatar_crop'),
 
+    url(r'^perfil/editar/avatar/estado/$', avatarstatus,
+        name='profile_avatar_status'),
+
     url(r'^perfil/edit/avatar/recortar/listo/$', direct_to_template,
         { 'extra_context': {'section': 'avatar'},
         'template': 'userprofile/avatar/done.html'},
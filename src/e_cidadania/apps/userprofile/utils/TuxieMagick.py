@@ -3,10 +3,201 @@
 TuxieMagick 0.5
     by Alvaro Mouriño ( http://tuxie.debianuruguay.org )
 GPLv3 ( http://www.gnu.org/licenses/gpl-3.0.html )
+
+Image records the chain of operations and runs all of them in a single PIL
+pass when write() is called: the image is decoded once, there are no
+intermediate files and no processes are spawned. MagickImage is the
+original ImageMagick implementation, one process per operation.
 """
+import re
+import shutil
 from os import path
+from StringIO import StringIO
+
+import Image as PILImage
+import PngImagePlugin
+
+# Position of the gravity names in the image, as (x, y) fractions of the
+# free space
+GRAVITIES = {
+    'northwest': (0, 0), 'north': (0.5, 0), 'northeast': (1, 0),
+    'west': (0, 0.5), 'center': (0.5, 0.5), 'east': (1, 0.5),
+    'southwest': (0, 1), 'south': (0.5, 1), 'southeast': (1, 1),
+}
+
+GEOMETRY = re.compile(r'^(\d+)x(\d+)(?:([+-]\d+)([+-]\d+))?$')
 
 class Image:
+    """
+    Lazy chain of image operations, with the API of the ImageMagick
+    version. Nothing is read until write() is called.
+    """
+    def __init__(self, filename):
+        self.x, self.y = 0, 0
+        self.actions = []
+        self.exists = path.exists(filename)
+        self.filename = filename
+
+    def size(self):
+        return Dimension(self)
+
+    def scale(self, width, height=None):
+        """
+        Scale the image to the width, or to fit in width x height, keeping
+        the aspect ratio (like convert -scale).
+        """
+        self.actions.append(('scale', (width, height)))
+
+    def crop(self, size, gravity='center'):
+        """
+        Crop a 'WxH+X+Y' region of the image. Without the offsets the
+        region is placed by the gravity.
+        """
+        self.actions.append(('crop', (size, gravity)))
+
+    def watermark(self, watermark, brightness='13.0', gravity='southeast'):
+        """
+        Blend the watermark image file with the given brightness (a
+        percentage) at the gravity position (like composite -watermark).
+        """
+        self.actions.append(('watermark', (watermark, brightness, gravity)))
+
+    def comment(self, comment):
+        """
+        Store the comment in the image file, for JPEG and PNG images.
+        """
+        self.actions.append(('comment', (comment,)))
+
+    def write(self, filename=None):
+        """
+        Run the recorded operations and save the result, in the same
+        format, to the file (or over the original one).
+
+        :rtype: True if the image was written
+        """
+        if not filename:
+            filename = self.filename
+        try:
+            if not self.actions:
+                if filename != self.filename:
+                    shutil.copyfile(self.filename, filename)
+                return True
+            image = PILImage.open(self.filename)
+            format = image.format
+            comment = None
+            for action, args in self.actions:
+                if action == 'comment':
+                    comment = args[0]
+                else:
+                    image = getattr(self, '_' + action)(image, *args)
+            self._save(image, filename, format, comment)
+        except (IOError, ValueError):
+            return False
+        self.filename = filename
+        self.actions = []
+        return True
+
+    def _scale(self, image, width, height):
+        old_width, old_height = image.size
+        ratio = float(width) / old_width
+        if height:
+            ratio = min(ratio, float(height) / old_height)
+        size = (max(1, int(round(old_width * ratio))),
+                max(1, int(round(old_height * ratio))))
+        # Not decoded yet: JPEG images can be decoded already reduced
+        if image.format == 'JPEG' and image.tile:
+            image.draft(image.mode, size)
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        return image.resize(size, PILImage.ANTIALIAS)
+
+    def _place(self, image, size, gravity):
+        fx, fy = GRAVITIES.get(gravity, GRAVITIES['center'])
+        return (int((image.size[0] - size[0]) * fx),
+                int((image.size[1] - size[1]) * fy))
+
+    def _crop(self, image, size, gravity):
+        match = GEOMETRY.match(str(size))
+        if not match:
+            raise ValueError("Invalid crop geometry: %s" % size)
+        width, height = int(match.group(1)), int(match.group(2))
+        if match.group(3):
+            left, top = int(match.group(3)), int(match.group(4))
+        else:
+            left, top = self._place(image, (width, height), gravity)
+        left, top = max(0, left), max(0, top)
+        return image.crop((left, top, min(image.size[0], left + width),
+                           min(image.size[1], top + height)))
+
+    def _watermark(self, image, watermark, brightness, gravity):
+        mark = PILImage.open(watermark)
+        if image.mode not in ('L', 'RGB', 'RGBA'):
+            image = image.convert('RGB')
+        # The part of the watermark that fits in the image
+        mark = mark.crop((0, 0, min(mark.size[0], image.size[0]),
+                          min(mark.size[1], image.size[1])))
+        mark.load()
+        mask = None
+        if mark.mode == 'RGBA':
+            mask = mark.split()[3]
+        left, top = self._place(image, mark.size, gravity)
+        box = (left, top, left + mark.size[0], top + mark.size[1])
+        region = image.crop(box)
+        blended = PILImage.blend(region, mark.convert(region.mode),
+                                 float(brightness) / 100)
+        image.paste(blended, box, mask)
+        return image
+
+    def _save(self, image, filename, format, comment):
+        if format == 'JPEG' and image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        if format == 'PNG' and comment:
+            info = PngImagePlugin.PngInfo()
+            info.add_text('Comment', comment)
+            image.save(filename, format, pnginfo=info)
+        elif format == 'JPEG' and comment:
+            # PIL can't write JPEG comments: the COM segment goes right
+            # after the start of image marker
+            data = StringIO()
+            image.save(data, format)
+            data = data.getvalue()
+            comment = comment.encode('utf-8')[:65533]
+            segment = '\xff\xfe' + chr((len(comment) + 2) >> 8) + \
+                chr((len(comment) + 2) & 0xff) + comment
+            output = open(filename, 'wb')
+            try:
+                output.write(data[:2] + segment + data[2:])
+            finally:
+                output.close()
+        else:
+            image.save(filename, format)
+
+class Dimension:
+    """
+    Size of the image file. Only the header of the file is read.
+    """
+    def __init__(self, image):
+        if image.exists:
+            self.x, self.y = PILImage.open(image.filename).size
+        else:
+            self.x, self.y = 0, 0
+        self.image = image
+
+    def __str__(self):
+        return "%ix%i" % (self.x, self.y)
+
+    def width(self):
+        return self.x
+
+    def height(self):
+        return self.y
+
+class MagickImage:
+    """
+    The original implementation: every operation is a convert or composite
+    process that rewrites the file. It needs ImageMagick and it's only kept
+    for the image operations benchmark.
+    """
     def __init__(self, filename):
         self.x, self.y = 0, 0
         self.actions = []
@@ -18,7 +209,7 @@ class Image:
         self.filename = filename
 
     def size(self):
-        return Dimension(self)
+        return MagickDimension(self)
 
     def scale(self, width, height=None):
         self.x = width
@@ -85,7 +276,6 @@ class Image:
                      'size': self.crop,
                      'input': self.filename,
                      'output': filename}
-            print command + '\n'
             if os.system(command) != 0:
                 return False
             self.filename = filename
@@ -101,7 +291,7 @@ class Image:
         self.comment = comment
         self.actions.append('comment')
 
-class Dimension:
+class MagickDimension:
     def __init__(self, image):
         import commands
         if image.exists:
@@ -20,7 +20,6 @@
 
 import base64
 import cPickle as pickle
-import Image
 import os
 import random
 import urllib
@@ -47,6 +46,7 @@ from e_cidadania.apps.userprofile.forms import AvatarForm, AvatarCropForm, Email
                               ProfileForm, RegistrationForm, LocationForm, \
                               PublicFieldsForm
 from e_cidadania.apps.userprofile.models import EmailValidation, Avatar
+from e_cidadania.apps.userprofile import pipeline
 
 
 if not settings.AUTH_PROFILE_MODULE:
@@ -140,7 +140,7 @@ def overview(request):
     # WARNING, THIS IS HARDCODED, MUST BE IMPLEMENTED WELL
     # AFTER TESTING
     proposals = Proposal.objects.annotate(models.Count('support_votes')).filter(author=request.user.id).order_by('pub_date')
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    profile = request.user.profile
     validated = False
     try:
         email = EmailValidation.objects.get(user=request.user).email
@@ -159,7 +159,7 @@ def personal(request):
     """
     Personal data of the user profile
     """
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    profile = request.user.profile
 
     if request.method == "POST":
         form = ProfileForm(request.POST, instance=profile)
@@ -180,7 +180,7 @@ def location(request):
     """
     Location selection of the user profile
     """
-    profile, created = Profile.objects.get_or_create(user=request.user)
+    profile = request.user.profile
 
     if request.method == "POST":
         form = LocationForm(request.POST, instance=profile)
@@ -222,19 +222,15 @@ def avatarchoose(request):
     """
     Avatar choose
     """
-    profile, created = Profile.objects.get_or_create(user = request.user)
+    profile = request.user.profile
     if not request.method == "POST":
         form = AvatarForm()
     else:
         form = AvatarForm(request.POST, request.FILES)
         if form.is_valid():
             image = form.cleaned_data.get('url') or form.cleaned_data.get('photo')
-            avatar = Avatar(user=request.user, image=image, valid=False)
-            avatar.image.save("%s.jpg" % request.user.username, image)
-            image = Image.open(avatar.image.path)
-            image.thumbnail((480, 480), Image.ANTIALIAS)
-            image.convert("RGB").save(avatar.image.path, "JPEG")
-            avatar.save()
+            # The image is normalized by the process_avatars command
+            pipeline.upload(request.user, image)
             return HttpResponseRedirect('%scrop/' % request.path_info)
 
             base, filename = os.path.split(avatar_path)
@@ -270,22 +266,27 @@ def avatarcrop(request):
             right = int(form.cleaned_data.get('right'))
             bottom = int(form.cleaned_data.get('bottom'))
 
-            image = Image.open(avatar.image.path)
+            # The avatar is cropped and resized by the process_avatars
+            # command, the done page polls its status
             box = [ left, top, right, bottom ]
-            image = image.crop(box)
-            if image.mode not in ('L', 'RGB'):
-                image = image.convert('RGB')
-
-            image.save(avatar.image.path)
-            avatar.valid = True
-            avatar.save()
-            return HttpResponseRedirect(reverse("profile_avatar_crop_done"))
+            if pipeline.crop(avatar, box):
+                return HttpResponseRedirect(reverse("profile_avatar_crop_done"))
 
     template = "userprofile/avatar/crop.html"
     data = { 'section': 'avatar', 'avatar': avatar, 'form': form, }
     return render_to_response(template, data, context_instance=RequestContext(request))
 
 
+@login_required
+def avatarstatus(request):
+    """
+    Status of the last avatar of the user, polled by the crop pages while
+    the avatar is being processed.
+    """
+    return HttpResponse(simplejson.dumps(pipeline.avatar_status(request.user)),
+                        mimetype='application/json')
+
+
 @login_required
 def avatardelete(request, avatar_id=False):
     if request.META.get('HTTP_X_REQUESTED_WITH') == 'XMLHttpRequest':
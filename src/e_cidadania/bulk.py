@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Bulk database operations. Django 1.3 has no bulk_create, so these helpers
+build the INSERT statements from the model metadata and send all the values
+with a single executemany() call.
+"""
+
+from django.db import connection, transaction
+from django.db.models import AutoField
+
+
+def bulk_insert(objs):
+    """
+    Insert all the given unsaved model instances with a single statement.
+    All the instances must be of the same model. Field defaults and
+    auto_now/auto_now_add values are filled like in Model.save(), but the
+    primary keys of the instances are NOT set and no signals are sent.
+
+    :param objs: list of unsaved model instances
+    :rtype: number of inserted objects
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    opts = objs[0]._meta
+    fields = [f for f in opts.local_fields if not isinstance(f, AutoField)]
+    values = [[f.get_db_prep_save(f.pre_save(obj, True), connection=connection)
+               for f in fields] for obj in objs]
+    return insert_rows(opts.db_table, [f.column for f in fields], values)
+
+
+def insert_rows(table, columns, rows):
+    """
+    Insert the rows (sequences of values ready for the database) in the
+    table columns with a single executemany() call.
+
+    :rtype: number of inserted rows
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(table), ', '.join([qn(c) for c in columns]),
+        ', '.join(['%s'] * len(columns)))
+    cursor = connection.cursor()
+    cursor.executemany(sql, rows)
+    transaction.commit_unless_managed()
+    return len(rows)
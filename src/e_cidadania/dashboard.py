@@ -12,6 +12,8 @@ from django.core.urlresolvers import reverse
 from grappelli.dashboard import modules, Dashboard
 from grappelli.dashboard.utils import get_admin_site_name
 
+from e_cidadania.apps.spaces.models import SpaceStats
+
 
 class CustomIndexDashboard(Dashboard):
     """
@@ -154,6 +156,30 @@ class CustomIndexDashboard(Dashboard):
             ]
         ))
         
+        # append a link list module with the statistics of the biggest
+        # spaces, read from the materialized statistics table.
+        self.children.append(modules.LinkList(
+            _('Spaces'),
+            column=3,
+            collapsible=False,
+            children=[
+                {
+                    'title': _('%(name)s: %(members)s members, %(proposals)s '
+                               'proposals, %(votes)s votes, %(debates)s '
+                               'debates') % {
+                        'name': stats.space.name,
+                        'members': stats.members,
+                        'proposals': stats.proposals,
+                        'votes': stats.votes,
+                        'debates': stats.debates},
+                    'url': stats.space.get_absolute_url(),
+                    'external': False,
+                }
+                for stats in SpaceStats.objects.select_related('space')
+                                               .order_by('-members')[:10]
+            ]
+        ))
+
         # append a recent actions module
         self.children.append(modules.RecentActions(
             _('Recent Actions'),
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cached feeds with conditional GET support. The validators of every feed are
+derived from the time of its newest item and its number of items, read from
+the database with a single aggregate, so every process of the site agrees
+on them and a feed reader poll costs one query: the feed answers '304 Not
+Modified' when the reader copy is current, and otherwise sends the XML
+rendered the first time since the last change.
+"""
+
+import time
+import hashlib
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.syndication.views import Feed
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from django.utils.translation import get_language
+
+# Seconds the rendered feeds stay in the cache. They are cached by their
+# validators, so a changed feed is never served from the cache.
+FEED_CACHE_TIMEOUT = getattr(settings, 'FEED_CACHE_TIMEOUT', 900)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class CachedFeed(Feed):
+
+    """
+    Feed that answers conditional GETs and caches its rendered XML. The
+    subclasses name the feed of every object with feed_key() and give the
+    time of its newest item and its number of items with state(). The count
+    changes the validators when an item other than the newest is deleted.
+
+    .. versionadded:: 0.1.5
+    """
+    def feed_key(self, obj):
+        raise NotImplementedError
+
+    def state(self, obj):
+        """
+        Returns the (time of the newest item, number of items) of the feed.
+        """
+        raise NotImplementedError
+
+    def not_modified(self, request, etag, changed):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return etag in parse_etags(if_none_match)
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        # HTTP dates have no fractions of a second
+        return if_modified_since is not None and \
+            if_modified_since >= int(time.mktime(changed.timetuple()))
+
+    def __call__(self, request, *args, **kwargs):
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+
+        changed, count = self.state(obj)
+        changed = changed or EPOCH
+        version = hashlib.md5('%s:%s:%s:%s' % (self.feed_key(obj),
+            changed.isoformat(), count, get_language())).hexdigest()
+        etag = '"%s"' % version
+        if self.not_modified(request, version, changed):
+            response = HttpResponseNotModified()
+        else:
+            key = 'feed-content:%s' % version
+            cached = cache.get(key)
+            if cached is None:
+                feedgen = self.get_feed(obj, request)
+                response = HttpResponse(mimetype=feedgen.mime_type)
+                feedgen.write(response, 'utf-8')
+                cached = (response['Content-Type'], response.content)
+                cache.set(key, cached, FEED_CACHE_TIMEOUT)
+            response = HttpResponse(cached[1], content_type=cached[0])
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(time.mktime(changed.timetuple()))
+        patch_vary_headers(response, ('Accept-Language',))
+        return response
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2010 Cidadanía Coop.
+# Written by: Oscar Carballal Prego <info@oscarcp.com>
+#
+# This file is part of e-cidadania.
+#
+# e-cidadania is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# e-cidadania is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with e-cidadania. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Keyset pagination for the list views. Instead of page numbers the pages are
+addressed with opaque cursors holding the sort key and id of the first or
+last object of the previous page, so every page is an index range scan of
+the same cost, no matter how deep it is. Use it with a composite index on
+the filter fields, the sort key and the id.
+"""
+
+import base64
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+from django.utils.encoding import smart_str, smart_unicode
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage(object):
+
+    """
+    A page of objects. It implements the part of the django Page interface
+    used by the templates, plus the cursors of the next and previous pages.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Page %s>' % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor(self.object_list[-1], self.number + 1)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor(self.object_list[0], self.number - 1)
+
+
+class KeysetPaginator(object):
+
+    """
+    Paginate a queryset sorted by 'key' (a field name, with a '-' prefix for
+    descending order) and then by primary key. The key field can't be null.
+
+    The total number of objects is only counted if count_timeout is given,
+    and then it's cached for that many seconds, so it can be a bit behind.
+
+    .. versionadded:: 0.1.5
+    """
+    def __init__(self, queryset, per_page, key='pk', count_timeout=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = key.startswith('-')
+        self.key = key.lstrip('-')
+        self.count_timeout = count_timeout
+        opts = queryset.model._meta
+        self.field = opts.pk if self.key == 'pk' else opts.get_field(self.key)
+        self._count = None
+
+    def cursor(self, obj, number):
+        """
+        Returns the opaque cursor of the page 'number' which starts after or
+        ends before the given object.
+        """
+        value = getattr(obj, self.field.attname)
+        # str() rounds floats, repr() keeps all the digits
+        value = isinstance(value, float) and repr(value) or smart_str(value)
+        return base64.urlsafe_b64encode('%s:%s:%s' % (number, obj.pk, value))
+
+    def parse_cursor(self, cursor):
+        """
+        Returns the (page number, primary key, key value) of a cursor.
+        """
+        try:
+            number, pk, value = base64.urlsafe_b64decode(smart_str(cursor)) \
+                .split(':', 2)
+            return (int(number), self.queryset.model._meta.pk.to_python(pk),
+                    self.field.to_python(smart_unicode(value)))
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _order(self, backwards):
+        descending = self.descending != backwards
+        prefix = descending and '-' or ''
+        return descending, ('%s%s' % (prefix, self.key), '%spk' % prefix)
+
+    def _seek(self, queryset, cursor, backwards):
+        descending, order = self._order(backwards)
+        queryset = queryset.order_by(*order)
+        if cursor is None:
+            return 1, queryset
+        number, pk, value = self.parse_cursor(cursor)
+        lookup = descending and 'lt' or 'gt'
+        return number, queryset.filter(
+            Q(**{'%s__%s' % (self.key, lookup): value}) |
+            Q(**{self.key: value, 'pk__%s' % lookup: pk}))
+
+    def page(self, after=None, before=None):
+        """
+        Returns the page that starts after the 'after' cursor, the page that
+        ends before the 'before' cursor or the first page.
+        """
+        backwards = before is not None
+        number, queryset = self._seek(self.queryset,
+                                      backwards and before or after, backwards)
+        objects = list(queryset[:self.per_page + 1])
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if backwards:
+            objects.reverse()
+            return KeysetPage(objects, number, self, True, more)
+        return KeysetPage(objects, number, self, more, number > 1)
+
+    @property
+    def count(self):
+        """
+        Cached total number of objects, or None if counting is disabled.
+        """
+        if self.count_timeout is None:
+            return None
+        if self._count is None:
+            sql, params = self.queryset.query.get_compiler(
+                using=self.queryset.db).as_sql()
+            key = 'keyset-count:%s' % hashlib.md5(
+                smart_str(sql) + repr(params)).hexdigest()
+            self._count = cache.get(key)
+            if self._count is None:
+                self._count = self.queryset.count()
+                cache.set(key, self._count, self.count_timeout)
+        return self._count
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, (self.count + self.per_page - 1) // self.per_page)
+
+
+class KeysetPaginationMixin(object):
+
+    """
+    Replace the page number pagination of a ListView with keyset pagination.
+    The pages are read from the 'after' and 'before' GET parameters.
+
+    :attributes: - keyset: sort field of the list, '-' for descending
+                 - count_timeout: seconds to cache the total number of
+                   objects, None to not count them
+
+    .. versionadded:: 0.1.5
+    """
+    keyset = 'pk'
+    count_timeout = None
+
+    def get_keyset(self):
+        return self.keyset
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.get_keyset(),
+                                    self.count_timeout)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'),
+                                  before=self.request.GET.get('before'))
+        except InvalidCursor:
+            raise Http404
+        return (paginator, page, page.object_list, page.has_other_pages())
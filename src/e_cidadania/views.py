@@ -24,7 +24,6 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.views.generic.create_update import update_object
 from django.views.generic.create_update import delete_object
 from django.views.generic.list_detail import object_detail
-from django.contrib.syndication.views import Feed
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic.list import ListView
 from django.contrib import messages
@@ -36,6 +35,10 @@ from django.views.generic import FormView
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required, permission_required
 
+from django.db.models import Max, Count
+
+from e_cidadania.feeds import CachedFeed
+from e_cidadania.pagination import KeysetPaginationMixin
 from e_cidadania.apps.news.models import Post
 from e_cidadania.apps.news.forms import NewsForm
 from e_cidadania.apps.spaces.models import Space
@@ -73,7 +76,7 @@ def index_view(request):
                               context_instance=RequestContext(request))
 
 
-class IndexEntriesFeed(Feed):
+class IndexEntriesFeed(CachedFeed):
 
     """
     Creates an RSS feed out of the news posts in the index page.
@@ -87,6 +90,14 @@ class IndexEntriesFeed(Feed):
     link = '/news/'
     description = _('Updates on the main e-cidadania site.')
 
+    def feed_key(self, obj):
+        return 'site'
+
+    def state(self, obj):
+        state = Post.objects.aggregate(newest=Max('post_lastup'),
+                                       items=Count('id'))
+        return state['newest'], state['items']
+
     def items(self):
         return Post.objects.all().order_by('-pub_date')[:10]
 
@@ -174,12 +185,13 @@ class DeletePost(DeleteView):
         return super(DeletePost, self).dispatch(*args, **kwargs)
 
 
-class ListNews(ListView):
+class ListNews(KeysetPaginationMixin, ListView):
 
     """
     List all the news within a space.
     """
     paginate_by = 10
+    keyset = '-pub_date'
     template_name = 'news/news_list.html'
 
     def get_queryset(self):
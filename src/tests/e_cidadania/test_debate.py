@@ -0,0 +1,145 @@
+import json
+import datetime
+
+from django.test import TestCase
+
+from tests.utils import ECDTestCase
+from django.forms.formsets import formset_factory
+
+from e_cidadania.apps.debate.models import Debate, Note, Row, Column, \
+    NoteChange
+from e_cidadania.apps.debate.board import DebateBoard, move_notes
+from e_cidadania.apps.debate.views import save_debate
+from e_cidadania.apps.debate.forms import DebateForm, RowForm, ColumnForm
+
+
+class TestDebateBoard(TestCase):
+
+    def setUp(self):
+        today = datetime.date.today()
+        self.debate = Debate.objects.create(title='Board test',
+            start_date=today, end_date=today + datetime.timedelta(days=1))
+        self.rows = [Row.objects.create(debate=self.debate, criteria='r%s' % i)
+                     for i in range(2)]
+        self.columns = [Column.objects.create(debate=self.debate,
+                                              criteria='c%s' % i)
+                        for i in range(2)]
+
+    def testNotesAreBucketed(self):
+        first = Note.objects.create(debate=self.debate, title='first',
+                                    row=self.rows[0], column=self.columns[1])
+        second = Note.objects.create(debate=self.debate, title='second',
+                                     row=self.rows[1], column=self.columns[0])
+        Note.objects.create(debate=self.debate, title='unplaced')
+
+        board = DebateBoard(self.debate)
+        cells = dict((cell.headers(), [n.id for n in cell.notes])
+                     for row, row_cells in board for cell in row_cells)
+        self.assertEqual(len(cells), 4)
+        self.assertEqual(cells['%s-%s' % (self.columns[1].id, self.rows[0].id)],
+                         [first.id])
+        self.assertEqual(cells['%s-%s' % (self.columns[0].id, self.rows[1].id)],
+                         [second.id])
+
+    def testConstantQueries(self):
+        for i in range(20):
+            Note.objects.create(debate=self.debate, title='n%s' % i,
+                                row=self.rows[i % 2], column=self.columns[i % 2])
+        self.assertNumQueries(3, DebateBoard, self.debate)
+
+    def testMoveNotes(self):
+        notes = [Note.objects.create(debate=self.debate, title='n%s' % i,
+                                     row=self.rows[0], column=self.columns[0])
+                 for i in range(3)]
+        results = move_notes(self.debate, [
+            (notes[0].id, self.rows[1].id, self.columns[1].id),
+            (notes[1].id, self.rows[1].id, self.columns[0].id),
+            (notes[2].id, self.rows[1].id, 0),
+            (0, self.rows[1].id, self.columns[1].id),
+        ])
+        self.assertEqual(results, {notes[0].id: 'ok', notes[1].id: 'ok',
+                                   notes[2].id: 'invalid column',
+                                   0: 'unknown note'})
+        self.assertEqual(Note.objects.get(pk=notes[0].id).column_id,
+                         self.columns[1].id)
+        self.assertEqual(Note.objects.get(pk=notes[2].id).row_id,
+                         self.rows[0].id)
+        self.assertEqual(NoteChange.objects.since(self.debate, 0).count(), 2)
+        self.assertEqual(Debate.objects.get(pk=self.debate.pk).revision, 2)
+
+
+def create_board(test):
+    today = datetime.date.today()
+    test.debate = Debate.objects.create(title='Changes test',
+        start_date=today, end_date=today + datetime.timedelta(days=1))
+    test.row = Row.objects.create(debate=test.debate, criteria='r')
+    test.column = Column.objects.create(debate=test.debate, criteria='c')
+
+
+class TestDebateChanges(TestCase):
+
+    def setUp(self):
+        create_board(self)
+
+    def testRecordBumpsRevision(self):
+        note = Note.objects.create(debate=self.debate, title='note',
+                                   row=self.row, column=self.column)
+        NoteChange.objects.record(note, NoteChange.CREATED)
+        NoteChange.objects.record(note, NoteChange.EDITED)
+        self.assertEqual(Debate.objects.get(pk=self.debate.pk).revision, 2)
+        self.assertEqual([c.action for c in
+                          NoteChange.objects.since(self.debate, 1)],
+                         [NoteChange.EDITED])
+
+
+
+class TestDebateChangesView(ECDTestCase):
+
+    def setUp(self):
+        create_board(self)
+        self.url = self.getUrl('debate-changes', ['test', self.debate.id])
+
+    def testChangesSince(self):
+        note = Note.objects.create(debate=self.debate, title='note',
+                                   row=self.row, column=self.column)
+        NoteChange.objects.record(note, NoteChange.CREATED)
+        NoteChange.objects.record(note, NoteChange.DELETED)
+
+        response = self.get(self.url, {'since': 1})
+        self.assertResponseOK(response)
+        feed = json.loads(response.content)
+        self.assertEqual(feed['revision'], 2)
+        self.assertEqual(feed['changes'],
+                         [[2, 'd', note.id, self.column.id, self.row.id, 'note']])
+
+        feed = json.loads(self.get(self.url, {'since': 2}).content)
+        self.assertEqual(feed, {'revision': 2, 'changes': []})
+        self.assertResponseNotFound(self.get(self.getUrl('debate-changes',
+            ['test', 0]), expect_errors=True))
+
+
+class TestDebateCreation(TestCase):
+
+    def formset(self, form, prefix, size):
+        data = {'%s-TOTAL_FORMS' % prefix: str(size),
+                '%s-INITIAL_FORMS' % prefix: '0'}
+        for i in range(size):
+            data['%s-%s-criteria' % (prefix, i)] = '%s %s' % (prefix, i)
+        formset = formset_factory(form, max_num=size)(data, prefix=prefix)
+        self.assertTrue(formset.is_valid())
+        return formset
+
+    def testConstantQueries(self):
+        debate_form = DebateForm({'title': 'Creation test',
+                                  'start_date': '01/01/2012',
+                                  'end_date': '01/02/2012'})
+        self.assertTrue(debate_form.is_valid())
+        rows = self.formset(RowForm, 'rowform', 10)
+        columns = self.formset(ColumnForm, 'colform', 10)
+
+        # One insert for the debate, the rows and the columns.
+        self.assertNumQueries(3, save_debate, debate_form, rows, columns,
+                              None, None)
+        debate = Debate.objects.get(title='Creation test')
+        self.assertEqual(Row.objects.filter(debate=debate).count(), 10)
+        self.assertEqual(Column.objects.filter(debate=debate).count(), 10)
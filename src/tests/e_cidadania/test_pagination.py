@@ -0,0 +1,58 @@
+import datetime
+
+from django.test import TestCase
+
+from tests.utils import ECDTestCase
+from e_cidadania.pagination import KeysetPaginator, InvalidCursor
+from e_cidadania.apps.spaces.models import Space, Event
+
+
+def create_events(test):
+    test.space = Space.objects.create(name='Pages test', url='pagestest')
+    today = datetime.date.today()
+    # Several events share the same date, the id breaks the ties
+    test.events = [Event.objects.create(title='Event %s' % i,
+                       space=test.space,
+                       event_date=today + datetime.timedelta(days=i // 3))
+                   for i in range(10)]
+
+
+class TestKeysetPaginator(TestCase):
+
+    def setUp(self):
+        create_events(self)
+
+    def testWalkForwardAndBack(self):
+        paginator = KeysetPaginator(Event.objects.filter(space=self.space), 4,
+                                    '-event_date', count_timeout=60)
+        expected = [e.pk for e in sorted(self.events,
+                    key=lambda e: (e.event_date, e.pk), reverse=True)]
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        self.assertEqual([[e.pk for e in p] for p in pages],
+                         [expected[0:4], expected[4:8], expected[8:10]])
+        self.assertEqual([p.number for p in pages], [1, 2, 3])
+        self.assertEqual(paginator.num_pages, 3)
+
+        back = paginator.page(before=pages[2].previous_cursor)
+        self.assertEqual([e.pk for e in back], expected[4:8])
+        self.assertEqual(back.number, 2)
+        self.assertTrue(back.has_previous() and back.has_next())
+        self.assertRaises(InvalidCursor, paginator.page, after='garbage')
+
+
+
+class TestPaginatedViews(ECDTestCase):
+
+    def setUp(self):
+        create_events(self)
+
+    def testListView(self):
+        url = self.getUrl('list-events', ['pagestest'])
+        self.assertResponseNotFound(self.get(url, {'after': 'garbage'},
+                                             expect_errors=True))
+        response = self.get(url)
+        self.assertResponseOK(response)
+        self.assertEqual(len(response.context['event_list']), 10)
+        self.assertFalse(response.context['is_paginated'])
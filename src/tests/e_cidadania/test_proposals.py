@@ -0,0 +1,231 @@
+import os
+import json
+import tempfile
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from tests.utils import ECDTestCase
+from e_cidadania.apps.proposals import geo, views
+from e_cidadania.apps.proposals.duplicates import find_similar
+from e_cidadania.apps.proposals.models import Proposal, ProposalCluster
+from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.proposals.votes import VoteBuffer, JournalVoteBuffer, \
+    write_votes
+from e_cidadania.apps.proposals.ranking import SORTS
+
+
+class TestSupportCount(TestCase):
+
+    def setUp(self):
+        self.proposal = Proposal.objects.create(title='Counter test',
+                                                description='Test')
+        self.users = [User.objects.create(username='voter%s' % i)
+                      for i in range(3)]
+
+    def count(self):
+        return Proposal.objects.get(pk=self.proposal.pk).support_count
+
+    def testAddAndRemove(self):
+        self.proposal.support_votes.add(self.users[0], self.users[1])
+        self.assertEqual(self.count(), 2)
+        # Voting twice doesn't count twice
+        self.proposal.support_votes.add(self.users[0])
+        self.assertEqual(self.count(), 2)
+        self.users[2].proposal_set.add(self.proposal)
+        self.assertEqual(self.count(), 3)
+        self.proposal.support_votes.remove(self.users[1])
+        self.assertEqual(self.count(), 2)
+        self.users[2].proposal_set.clear()
+        self.assertEqual(self.count(), 1)
+        self.proposal.support_votes.clear()
+        self.assertEqual(self.count(), 0)
+
+    def testRebuild(self):
+        self.proposal.support_votes.add(*self.users)
+        Proposal.objects.filter(pk=self.proposal.pk).update(support_count=0)
+        Proposal.objects.rebuild_support_counts()
+        self.assertEqual(self.count(), 3)
+
+
+class TestVoteBuffer(TestCase):
+
+    def setUp(self):
+        self.proposal = Proposal.objects.create(title='Buffer test',
+                                                description='Test')
+        self.user = User.objects.create(username='buffered')
+        self.buffer = VoteBuffer(batch_size=10, flush_interval=3600)
+
+    def testBufferedVote(self):
+        self.assertTrue(self.buffer.add(self.user.pk, self.proposal.pk))
+        self.assertFalse(self.buffer.add(self.user.pk, self.proposal.pk))
+        self.assertTrue(self.buffer.has_voted(self.user.pk, self.proposal.pk))
+        self.assertEqual(self.buffer.pending_count(self.proposal.pk), 1)
+        self.assertEqual(self.proposal.support_votes.count(), 0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertFalse(self.buffer.has_voted(self.user.pk, self.proposal.pk))
+        self.assertEqual(Proposal.objects.get(pk=self.proposal.pk).support_count, 1)
+
+    def testVoteAlreadyWritten(self):
+        self.proposal.support_votes.add(self.user)
+        self.assertFalse(self.buffer.add(self.user.pk, self.proposal.pk))
+        self.assertEqual(self.buffer.pending_count(self.proposal.pk), 0)
+
+    def testJournalSharedBetweenBuffers(self):
+        path = tempfile.mktemp()
+        try:
+            first = JournalVoteBuffer(path=path, batch_size=10,
+                                      flush_interval=3600)
+            second = JournalVoteBuffer(path=path, batch_size=10,
+                                       flush_interval=3600)
+            first.add(self.user.pk, self.proposal.pk)
+            self.assertTrue(second.has_voted(self.user.pk, self.proposal.pk))
+            self.assertEqual(second.flush(), 1)
+            self.assertFalse(first.has_voted(self.user.pk, self.proposal.pk))
+            first.flush()
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testWriteVotesIsIdempotent(self):
+        self.proposal.support_votes.add(self.user)
+        self.assertEqual(write_votes([(self.user.pk, self.proposal.pk),
+                                      (self.user.pk, 0)]), 0)
+        self.assertEqual(self.proposal.support_votes.count(), 1)
+
+
+class TestRanking(TestCase):
+
+    def setUp(self):
+        self.proposals = [Proposal.objects.create(title='Ranking %s' % i,
+                                                  description='Test')
+                          for i in range(5)]
+        self.users = [User.objects.create(username='ranker%s' % i)
+                      for i in range(3)]
+
+    def ranked(self, sort, limit):
+        return list(Proposal.objects.order_by('-' + SORTS[sort])
+                    .values_list('pk', flat=True)[:limit])
+
+    def testVotesUpdateScores(self):
+        self.proposals[0].support_votes.add(*self.users)
+        self.proposals[3].support_votes.add(self.users[0])
+        self.assertEqual(self.ranked('support', 2),
+                         [self.proposals[0].pk, self.proposals[3].pk])
+        self.assertEqual(self.ranked('trending', 2),
+                         [self.proposals[0].pk, self.proposals[3].pk])
+        self.assertEqual(self.ranked('hot', 1), [self.proposals[0].pk])
+
+
+def create_located(test):
+    test.space = Space.objects.create(name='Map test', url='maptest')
+    test.proposals = [Proposal.objects.create(title='Map %s' % i,
+        description='Test', space=test.space, latitude='40.4%s' % i,
+        longitude='-3.7%s' % i) for i in range(3)]
+
+
+class TestProposalClusters(TestCase):
+
+    def setUp(self):
+        create_located(self)
+
+    def clusters(self, level):
+        return dict((c.cell, c.count) for c in
+                    ProposalCluster.objects.filter(space=self.space, level=level))
+
+    def testEncode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.proposals[0].geohash, geo.encode(40.40, -3.70))
+
+    def testClustersFollowProposals(self):
+        self.assertEqual(self.clusters(1), {'e': 3})
+        proposal = Proposal.objects.get(pk=self.proposals[0].pk)
+        proposal.latitude, proposal.longitude = '10.0', '10.0'
+        proposal.save()
+        self.assertEqual(self.clusters(1), {'e': 2, 's': 1})
+        proposal.delete()
+        self.assertEqual(self.clusters(1), {'e': 2})
+
+        ProposalCluster.objects.all().delete()
+        geo.rebuild()
+        self.assertEqual(self.clusters(1), {'e': 2})
+        self.assertEqual(sum(self.clusters(8).values()), 2)
+
+
+
+class TestProposalMap(ECDTestCase):
+
+    def setUp(self):
+        create_located(self)
+        self.url = self.getUrl('proposal-map', ['maptest'])
+
+    def map_data(self, params):
+        response = self.get(self.url, params)
+        self.assertResponseOK(response)
+        return json.loads(response.content)
+
+    def testMapData(self):
+        bbox = {'bbox': '-3.715,40.38,-3.69,40.43', 'zoom': 14}
+        data = self.map_data(bbox)
+        self.assertEqual(sorted(p[0] for p in data['proposals']),
+                         [self.proposals[0].pk, self.proposals[1].pk])
+
+        views.PROPOSAL_MAP_MAX_POINTS = 1
+        try:
+            bbox['zoom'] = 2
+            data = self.map_data(bbox)
+        finally:
+            views.PROPOSAL_MAP_MAX_POINTS = 200
+        self.assertEqual(data['proposals'], [])
+        self.assertEqual([c[:2] for c in data['clusters']], [['ez', 3]])
+
+    def testMapLevelCappedByArea(self):
+        views.PROPOSAL_MAP_MAX_POINTS = 1
+        try:
+            data = self.map_data({'bbox': '-180,-90,180,90', 'zoom': 20})
+        finally:
+            views.PROPOSAL_MAP_MAX_POINTS = 200
+        self.assertEqual(data['level'], 1)
+        self.assertEqual([c[:2] for c in data['clusters']], [['e', 3]])
+        self.assertResponseBadRequest(self.get(self.url,
+            {'bbox': '-3.7,nan,-3.6,40.5'}, expect_errors=True))
+
+
+class TestDuplicates(TestCase):
+
+    description = ('The bus line 12 should stop next to the new health '
+                   'centre so the elderly people of the neighbourhood can '
+                   'get there without walking for half an hour.')
+
+    def setUp(self):
+        self.space = Space.objects.create(name='Duplicates', url='duplicates')
+        self.proposal = Proposal.objects.create(title='Bus stop at the centre',
+            description=self.description, space=self.space)
+        Proposal.objects.create(title='More trees in the park',
+            description='Plant trees along the main path of the park.',
+            space=self.space)
+
+    def testFindSimilar(self):
+        similar = find_similar(self.space, 'A bus stop at the health centre',
+            self.description.replace('half an hour', 'thirty minutes'))
+        self.assertEqual([p.pk for score, p in similar], [self.proposal.pk])
+        self.assertEqual(find_similar(self.space, 'Bus stop', self.description,
+                                      exclude=self.proposal.pk), [])
+
+    def testOtherSpacesHidden(self):
+        other = Space.objects.create(name='Private', url='private', public=False)
+        self.assertEqual(find_similar(other, 'Bus stop at the centre',
+                                      self.description), [])
+        Proposal.objects.create(title='Orphan bus stop',
+                                description=self.description)
+        self.assertEqual(len(find_similar(self.space, 'Bus stop at the centre',
+                                          self.description)), 1)
+
+    def testEditUpdatesIndex(self):
+        self.proposal.description = 'Open the library on sundays.'
+        self.proposal.save()
+        self.assertEqual(find_similar(self.space, 'Bus stop at the centre',
+                                      self.description), [])
+        self.assertEqual(len(find_similar(self.space, 'Bus stop at the centre',
+                                          'Open the library on sundays')), 1)
@@ -0,0 +1,509 @@
+from StringIO import StringIO
+
+from PIL import Image
+
+from django.test import TestCase
+from django.http import Http404
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User, AnonymousUser
+
+from tests.utils import ECDTestCase
+from e_cidadania.apps.accounts.models import UserProfile, prefetch_profiles
+from e_cidadania.apps.spaces.models import Space
+from e_cidadania.apps.spaces.resolver import get_space, get_space_or_404, \
+    is_public
+from e_cidadania.apps.spaces.membership import is_member, space_ids
+from e_cidadania.apps.spaces.models import Activity, ImageJob, SpaceStats
+from e_cidadania.apps.spaces.stats import FIELDS, get_stats, rebuild, \
+    increment
+from e_cidadania.apps.spaces import activity
+from e_cidadania.apps.spaces.timeline import merge_activity, user_timeline
+from e_cidadania.apps.spaces.members import add_members, read_identifiers
+from e_cidadania.apps.spaces.archive import export_space, SpaceImporter
+from e_cidadania.apps.spaces.images import process_jobs
+from e_cidadania.apps.tagging.models import Tag
+from e_cidadania.apps.news.models import Post
+from e_cidadania.apps.proposals.models import Proposal
+from e_cidadania.apps.debate.models import Debate, Note, Row, Column
+
+
+class TestSpaceResolver(TestCase):
+
+    def setUp(self):
+        self.space = Space.objects.create(name='Resolver test', url='resolver',
+                                          public=True)
+
+    def testCachedLookup(self):
+        self.assertEqual(get_space('resolver').pk, self.space.pk)
+        with self.assertNumQueries(0):
+            space = get_space('resolver')
+        # Changing the copy doesn't change the cached space
+        space.name = 'Changed'
+        self.assertEqual(get_space('resolver').name, 'Resolver test')
+        self.assertRaises(Http404, get_space_or_404, 'missing')
+
+    def testInvalidation(self):
+        get_space('resolver')
+        self.space.url = 'renamed'
+        self.space.save()
+        self.assertEqual(get_space('resolver'), None)
+        self.assertEqual(get_space('renamed').pk, self.space.pk)
+        self.space.delete()
+        self.assertEqual(get_space('renamed'), None)
+
+    def testPublicNotCached(self):
+        space = get_space('resolver')
+        # Made private by another process, which can't clear our cache
+        Space.objects.filter(pk=self.space.pk).update(public=False)
+        self.assertTrue(get_space('resolver').public)
+        self.assertFalse(is_public(space))
+
+
+class TestMembership(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', 'member@example.com',
+                                             'secret')
+        self.profile = self.user.profile
+        self.spaces = [Space.objects.create(name='Member %s' % i,
+                                            url='member%s' % i)
+                       for i in range(3)]
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def testIsMemberReadOncePerRequest(self):
+        self.profile.spaces.add(self.spaces[0])
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(is_member(user, self.spaces[0]))
+            self.assertFalse(is_member(user, self.spaces[1].pk))
+        self.assertFalse(is_member(AnonymousUser(), self.spaces[0]))
+
+    def testMembershipChanges(self):
+        self.assertFalse(is_member(self.fresh_user(), self.spaces[1]))
+        self.profile.spaces.add(self.spaces[1])
+        self.assertTrue(is_member(self.fresh_user(), self.spaces[1]))
+        self.spaces[1].userprofile_set.clear()
+        self.assertFalse(is_member(self.fresh_user(), self.spaces[1]))
+        self.spaces[2].userprofile_set.add(self.profile)
+        self.assertEqual(space_ids(self.fresh_user()),
+                         frozenset([self.spaces[2].pk]))
+        self.spaces[2].delete()
+        self.assertEqual(space_ids(self.fresh_user()), frozenset())
+
+
+class TestUserProfile(TestCase):
+
+    def testProfileCreatedWithUser(self):
+        user = User.objects.create_user('profiled', 'p@example.com', 'secret')
+        self.assertEqual(UserProfile.objects.filter(user=user).count(), 1)
+
+    def testMemoizedProfile(self):
+        User.objects.create_user('memo', 'm@example.com', 'secret')
+        user = User.objects.get(username='memo')
+        with self.assertNumQueries(1):
+            user.profile
+            user.profile
+            user.get_profile()
+
+    def testPrefetch(self):
+        for i in range(5):
+            User.objects.create_user('pre%s' % i, 'p@example.com', 'secret')
+        users = prefetch_profiles(User.objects.filter(username__startswith='pre'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len([u.profile.user_id for u in users]), 5)
+
+
+class TestSpaceTabs(ECDTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(name='Tabs test', url='tabs',
+                                          public=True, mod_news=True)
+        for i in range(12):
+            Post.objects.create(post_title='post %s' % i, post_message='m',
+                                space=self.space)
+
+    def tab_url(self, tab):
+        return self.getUrl('space-tab', ['tabs', tab])
+
+    def testDisabledModules(self):
+        self.assertResponseNotFound(self.get(self.tab_url('debates'),
+                                             expect_errors=True))
+        self.assertResponseNotFound(self.get(self.tab_url('missing'),
+                                             expect_errors=True))
+        Debate.objects.create(title='hidden debate', space=self.space)
+        response = self.get(self.getUrl('space-index', ['tabs']))
+        self.assertResponseOK(response)
+        self.assertEqual(set(e.module for e in response.context['activity']),
+                         set(['news']))
+        self.assertNotContains(response, 'hidden debate')
+
+    def testPagesAreCached(self):
+        response = self.get(self.tab_url('news'))
+        self.assertResponseOK(response)
+        self.assertContains(response, 'class="posttitle"', count=10)
+        self.assertContains(response, 'post 11')
+        self.assertContains(response, '?after=')
+        # Only the access check and the tab version read the database
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get(self.tab_url('news')).content,
+                             response.content)
+
+        post = Post.objects.create(post_title='newest', post_message='m',
+                                   space=self.space)
+        self.assertContains(self.get(self.tab_url('news')), 'newest')
+        post.delete()
+        self.assertNotContains(self.get(self.tab_url('news')), 'newest')
+
+
+class TestSpaceStats(TestCase):
+
+    def setUp(self):
+        self.space = Space.objects.create(name='Stats test', url='stats')
+        self.users = [User.objects.create_user('stats%s' % i, '', 'x')
+                      for i in range(3)]
+
+    def counts(self):
+        stats = get_stats(self.space)
+        return dict((f, getattr(stats, f)) for f in FIELDS)
+
+    def rebuilt_counts(self):
+        rebuild([self.space.pk])
+        return self.counts()
+
+    def testIncrementalCounters(self):
+        self.assertEqual(self.counts()['members'], 0)
+        for user in self.users:
+            user.profile.spaces.add(self.space)
+        proposals = [Proposal.objects.create(title='p%s' % i, description='d',
+                                             space=self.space)
+                     for i in range(2)]
+        proposals[0].support_votes.add(*self.users)
+        self.users[0].proposal_set.add(proposals[1])
+        debate = Debate.objects.create(title='d', space=self.space)
+        Note.objects.create(debate=debate, title='n')
+        Post.objects.create(post_title='p', post_message='m', space=self.space)
+        self.assertEqual(self.counts(), {'members': 3, 'proposals': 2,
+            'votes': 4, 'debates': 1, 'notes': 1, 'documents': 0, 'posts': 1})
+
+        self.users[1].profile.spaces.clear()
+        proposals[0].delete()
+        debate.delete()
+        expected = {'members': 2, 'proposals': 1, 'votes': 1, 'debates': 0,
+                    'notes': 0, 'documents': 0, 'posts': 1}
+        self.assertEqual(self.counts(), expected)
+        self.assertEqual(self.rebuilt_counts(), expected)
+
+    def testSingleRowRead(self):
+        get_stats(self.space)
+        with self.assertNumQueries(1):
+            get_stats(self.space)
+
+    def testMissingRowsCreated(self):
+        self.users[0].profile.spaces.add(self.space)
+        SpaceStats.objects.all().delete()
+        # A row created by a concurrent request is updated, not inserted
+        increment([self.space.pk], members=1)
+        self.assertEqual(rebuild(), Space.objects.count())
+        self.assertEqual(self.counts()['members'], 1)
+
+
+class TestActivity(TestCase):
+
+    def setUp(self):
+        self.space = Space.objects.create(name='Activity test', url='activity',
+                                          public=True, mod_news=True,
+                                          mod_proposals=True)
+
+    def testContentIsLogged(self):
+        post = Post.objects.create(post_title='post', post_message='<p>m</p>',
+                                   space=self.space)
+        proposal = Proposal.objects.create(title='proposal', description='d',
+                                           space=self.space)
+        post.post_title = 'edited post'
+        post.save()
+        self.assertEqual([(e.module, e.action, e.title) for e in
+                          activity.space_activity(self.space, 10)],
+                         [('news', Activity.UPDATED, 'edited post'),
+                          ('proposals', Activity.CREATED, 'proposal'),
+                          ('news', Activity.CREATED, 'post'),
+                          ('space', Activity.CREATED, 'Activity test')])
+        proposal.delete()
+        self.assertEqual(Activity.objects.filter(module='proposals').count(), 0)
+
+        self.assertEqual(activity.rebuild(), 2)
+        self.assertEqual(Activity.objects.get(module='news').summary, 'm')
+
+
+class TestFeeds(ECDTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.space = Space.objects.create(name='Feed test', url='feed',
+                                          public=True, mod_news=True,
+                                          mod_proposals=True)
+        Post.objects.create(post_title='first', post_message='m',
+                            space=self.space)
+        self.url = self.getUrl('space-feed', ['feed'])
+
+    def testConditionalGet(self):
+        response = self.get(self.url)
+        response.mustcontain('first')
+        etag = response.headers['ETag']
+        # Only the validators are read
+        with self.assertNumQueries(1):
+            response = self.get(self.url, headers={'If-None-Match': etag})
+        self.assertResponseCode(response, 304)
+        response = self.get(self.url, headers={
+            'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertResponseCode(response, 304)
+
+        Post.objects.create(post_title='second', post_message='m',
+                            space=self.space)
+        response = self.get(self.url, headers={'If-None-Match': etag})
+        response.mustcontain('second')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+        # Deleting an item which isn't the newest changes the feed too
+        etag = response.headers['ETag']
+        Post.objects.filter(post_title='first').delete()
+        response = self.get(self.url, headers={'If-None-Match': etag})
+        self.assertResponseOK(response)
+        response.mustcontain(no='first')
+
+    def testRenderedOnce(self):
+        content = self.get(self.url).content
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get(self.url).content, content)
+        self.get(self.getUrl('site-feed')).mustcontain('first')
+
+    def testFeedIsOneQuery(self):
+        for i in range(5):
+            Post.objects.create(post_title='post %s' % i, post_message='m',
+                                space=self.space)
+            Proposal.objects.create(title='proposal %s' % i, description='d',
+                                    space=self.space)
+        self.get(self.url)
+        cache.clear()
+        # The time of the last change and the items
+        with self.assertNumQueries(2):
+            response = self.get(self.url)
+        # The space, the first post and the new content
+        self.assertEqual(response.content.count('<item>'), 12)
+
+
+class TestTimeline(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='timeline')
+        self.spaces = [Space.objects.create(name='Timeline %s' % i,
+                                            url='timeline%s' % i,
+                                            mod_news=i != 1)
+                       for i in range(3)]
+        self.user.get_profile().spaces.add(*self.spaces[:2])
+        for space in self.spaces:
+            Post.objects.create(post_title='post %s' % space.url,
+                                post_message='m', space=space)
+
+    def testMergedPages(self):
+        ids = space_ids(self.user)
+        titles = []
+        entries, cursor = merge_activity(ids, count=2, chunk_size=1)
+        while cursor:
+            titles.extend([e.title for e in entries])
+            entries, cursor = merge_activity(ids, cursor, count=2,
+                                             chunk_size=1)
+        titles.extend([e.title for e in entries])
+        # The news of the second space are disabled, the third isn't ours
+        self.assertEqual(titles, ['post timeline0', 'Timeline 1',
+                                  'Timeline 0'])
+        self.assertEqual(merge_activity(ids, count=3, chunk_size=50)[0],
+                         merge_activity(ids, count=3, chunk_size=1)[0])
+
+    def testCachedPage(self):
+        user_timeline(self.user)
+        with self.assertNumQueries(0):
+            entries, cursor = user_timeline(self.user)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(cursor, None)
+
+
+class TestMemberImport(TestCase):
+
+    def setUp(self):
+        self.space = Space.objects.create(name='Import test', url='import')
+        self.users = [User.objects.create(username='user%s' % i,
+                                          email='user%s@example.com' % i)
+                      for i in range(5)]
+        self.users[0].get_profile().spaces.add(self.space)
+        UserProfile.objects.filter(user=self.users[1]).delete()
+
+    def testAddMembers(self):
+        self.assertFalse(is_member(self.users[2], self.space))
+        rows = ['# members', 'user0', 'user1', 'user2@example.com,Name',
+                'user3', '', 'user3@example.com', 'nobody']
+        result = add_members(self.space, read_identifiers(rows),
+                             chunk_size=2)
+        self.assertEqual((result.read, result.added, result.existing),
+                         (6, 3, 1))
+        self.assertEqual(result.unknown, ['nobody'])
+        self.assertEqual(get_stats(self.space).members, 4)
+        self.assertTrue(is_member(User.objects.get(pk=self.users[2].pk),
+                                  self.space))
+        self.assertEqual(list(UserProfile.objects.get(user=self.users[1])
+                              .spaces.all()), [self.space])
+        self.assertEqual(add_members(self.space, ['user1']).added, 0)
+
+
+class TestSpaceArchive(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='archive')
+        self.space = Space.objects.create(name='Archive test', url='archive',
+                                          mod_news=True, mod_proposals=True)
+        self.user.get_profile().spaces.add(self.space)
+        post = Post.objects.create(post_title='post', post_message='m',
+                                   space=self.space, author=self.user)
+        Tag.objects.update_tags(post, 'first second')
+        self.pub_date = Post.objects.get(pk=post.pk).pub_date
+        proposal = Proposal.objects.create(title='proposal', description='d',
+                                           space=self.space)
+        proposal.support_votes.add(self.user)
+        debate = Debate.objects.create(title='debate', space=self.space)
+        row = Row.objects.create(debate=debate, criteria='row')
+        column = Column.objects.create(debate=debate, criteria='column')
+        for i in range(5):
+            Note.objects.create(debate=debate, row=row, column=column,
+                                title='note %s' % i, author=self.user)
+
+    def testRoundTrip(self):
+        archive = StringIO()
+        counts = export_space(self.space, archive, chunk_size=2)
+        self.assertEqual(counts['debate.note'], 5)
+        self.assertEqual(counts['tagging.taggeditem'], 2)
+        # Proposal and debate titles are unique
+        self.space.delete()
+
+        archive.seek(0)
+        importer = SpaceImporter(url='restored', chunk_size=2)
+        space = importer.read(archive)
+        self.assertEqual((space.url, space.name), ('restored', 'Archive test'))
+        notes = Note.objects.filter(debate__space=space)
+        self.assertEqual(notes.count(), 5)
+        self.assertEqual(set(n.row.criteria for n in notes), set(['row']))
+        self.assertEqual(notes[0].author, self.user)
+        proposal = Proposal.objects.get(space=space)
+        self.assertEqual(list(proposal.support_votes.all()), [self.user])
+        post = Post.objects.get(space=space)
+        self.assertEqual(post.pub_date, self.pub_date)
+        self.assertEqual(sorted(t.name for t in
+                                Tag.objects.get_for_object(post)),
+                         ['first', 'second'])
+        self.assertTrue(is_member(User.objects.get(pk=self.user.pk), space))
+        self.assertEqual(get_stats(space).notes, 5)
+        self.assertEqual(Activity.objects.filter(space=space).count(), 4)
+
+
+class TestImageJobs(TestCase):
+
+    def upload(self, name, size, color='red'):
+        data = StringIO()
+        Image.new('RGB', size, color).save(data, 'JPEG')
+        return SimpleUploadedFile(name, data.getvalue(), 'image/jpeg')
+
+    def tearDown(self):
+        storage = Space._meta.get_field('banner').storage
+        for job in ImageJob.objects.all():
+            for name in (job.source, job.result):
+                if name:
+                    storage.delete(name)
+            if job.result:
+                field = Space._meta.get_field(job.field_name)
+                for rendition in field.rendition_names(job.result):
+                    storage.delete(rendition[0])
+
+    def testResizedOutsideTheSave(self):
+        space = Space.objects.create(name='Images test', url='images')
+        stale = Space.objects.get(pk=space.pk)
+        space.logo = self.upload('logo.jpg', (1600, 1200))
+        space.save()
+        source = space.logo.name
+        self.assertTrue(space.logo.pending)
+        self.assertTrue(space.logo.display_url.endswith(
+                        'assets/logos/index.png'))
+        self.assertEqual(ImageJob.objects.filter(source=source).count(), 1)
+
+        self.assertEqual(process_jobs(), 1)
+        logo = Space.objects.get(pk=space.pk).logo
+        self.assertFalse(logo.pending)
+        self.assertTrue(logo.name.startswith('spaces/logos/logo_%s.' %
+                                             space.pk))
+        self.assertEqual(Image.open(logo.path).size, (100, 75))
+        self.assertFalse(logo.storage.exists(source))
+
+        # An instance loaded before the resize keeps the resized image
+        stale.logo = space.logo
+        stale.save()
+        self.assertEqual(Space.objects.get(pk=space.pk).logo.name,
+                         logo.name)
+        self.assertEqual(process_jobs(), 0)
+
+    def testRenditions(self):
+        space = Space.objects.create(name='Renditions test', url='renditions')
+        space.banner = self.upload('banner.jpg', (1000, 150))
+        space.save()
+        process_jobs()
+        banner = Space.objects.get(pk=space.pk).banner
+        names = [name for name, size, format, width in
+                 banner.field.rendition_names(banner.name)]
+        for name in names:
+            self.assertTrue(banner.storage.exists(name))
+        self.assertEqual(Image.open(banner.storage.path(names[1])).size,
+                         (160, 24))
+        self.assertEqual(banner.srcset.count('w, '), 2)
+
+        # Another image gets other names, and the old files are removed
+        space.banner = self.upload('banner.jpg', (1000, 150), 'blue')
+        space.save()
+        process_jobs()
+        new = Space.objects.get(pk=space.pk).banner
+        self.assertNotEqual(new.name, banner.name)
+        for name in names:
+            self.assertFalse(banner.storage.exists(name))
+
+    def testReusedUploadName(self):
+        space = Space.objects.create(name='Reupload test', url='reupload')
+        space.logo = self.upload('logo.jpg', (400, 300))
+        space.save()
+        source = space.logo.name
+        process_jobs()
+        # The deleted upload name is given to the next upload
+        space = Space.objects.get(pk=space.pk)
+        space.logo = self.upload('logo.jpg', (400, 300))
+        space.save()
+        self.assertEqual(space.logo.name, source)
+        self.assertEqual(process_jobs(), 1)
+
+    def testStaleInstanceKeepsItsImage(self):
+        first = Space.objects.create(name='First logo', url='firstlogo')
+        first.logo = self.upload('logo.jpg', (400, 300))
+        first.save()
+        stale = Space.objects.get(pk=first.pk)
+        process_jobs()
+        logo = Space.objects.get(pk=first.pk).logo.name
+
+        # Another space gets the same upload name once it is deleted
+        second = Space.objects.create(name='Second logo', url='secondlogo')
+        second.logo = self.upload('logo.jpg', (400, 300), 'blue')
+        second.save()
+        self.assertEqual(second.logo.name, stale.logo.name)
+        process_jobs()
+
+        stale.save()
+        self.assertEqual(Space.objects.get(pk=first.pk).logo.name, logo)
+        self.assertNotEqual(Space.objects.get(pk=second.pk).logo.name, logo)
@@ -0,0 +1,197 @@
+import os
+import json
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from PIL import Image
+from django.test import TestCase
+from django.template import Template, Context
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+
+from tests.utils import ECDTestCase
+
+from e_cidadania.apps.userprofile.models import Avatar, AVATAR_SIZES
+from e_cidadania.apps.userprofile.thumbnails import make_sizes, size_name, \
+    default_url
+from e_cidadania.apps.userprofile import pipeline
+from e_cidadania.apps.userprofile.pipeline import process_avatars
+from e_cidadania.apps.userprofile.utils import TuxieMagick
+
+
+class TestAvatars(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create(username='avatar%s' % i)
+                      for i in range(5)]
+        data = StringIO()
+        Image.new('RGB', (200, 200), 'green').save(data, 'JPEG')
+        self.avatar = Avatar(user=self.users[0], valid=True)
+        self.avatar.image.save('avatar0.jpg', ContentFile(data.getvalue()))
+        make_sizes(self.avatar.image.path)
+
+    def tearDown(self):
+        storage = self.avatar.image.storage
+        for size in AVATAR_SIZES:
+            storage.delete(size_name(self.avatar.image.name, size))
+        storage.delete(self.avatar.image.name)
+
+    def testAllSizes(self):
+        for size in AVATAR_SIZES:
+            path = size_name(self.avatar.image.path, size)
+            self.assertEqual(max(Image.open(path).size), size)
+
+    def testPrefetchedPage(self):
+        template = Template('{% load avatars %}{% prefetch_avatars users %}'
+                            '{% for u in users %}{% avatar 32 u %} '
+                            '{% endfor %}')
+        context = Context({'users': self.users})
+        with self.assertNumQueries(1):
+            urls = template.render(context).split()
+        self.assertEqual(urls[0], '%s?%s' % (
+            self.avatar.image.storage.url(size_name(self.avatar.image.name,
+                                                    32)), self.avatar.pk))
+        self.assertEqual(urls[1:], [default_url(32)] * 4)
+
+        # The versions are cached until the avatar changes
+        with self.assertNumQueries(0):
+            template.render(context)
+        self.avatar.delete()
+        self.assertEqual(Template('{% load avatars %}{% avatar 32 u %}')
+                         .render(Context({'u': self.users[0]})),
+                         default_url(32))
+
+
+class TestAvatarPipeline(ECDTestCase):
+
+    # Every request is made by the 'pipeline' user
+    extra_environ = {'WEBTEST_USER': 'pipeline'}
+    csrf_checks = False
+
+    def setUp(self):
+        self.user = User.objects.create(username='pipeline')
+        self.old = Avatar(user=self.user, valid=True)
+        self.old.image.save('pipeline.jpg', ContentFile(self.jpeg(200)))
+        make_sizes(self.old.image.path)
+
+    def jpeg(self, size):
+        data = StringIO()
+        Image.new('RGB', (size, size), 'blue').save(data, 'JPEG')
+        return data.getvalue()
+
+    def tearDown(self):
+        for avatar in [self.old] + list(Avatar.objects.all()):
+            for name in avatar.files():
+                avatar.image.storage.delete(name)
+
+    def status(self):
+        response = self.get(self.getUrl('profile_avatar_status'))
+        self.assertResponseOK(response)
+        return json.loads(response.content)
+
+    def testUploadAndCrop(self):
+        response = self.app.post(self.getUrl('profile_edit_avatar'),
+            upload_files=[('photo', 'big.jpg', self.jpeg(1200))])
+        self.assertResponseRedirect(response)
+        self.assertEqual(self.status()['status'], 'normalizing')
+
+        self.assertEqual(process_avatars(), 1)
+        data = self.status()
+        self.assertEqual(data['status'], 'uploaded')
+        avatar = Avatar.objects.get(user=self.user, valid=False)
+        self.assertEqual(Image.open(avatar.image.path).size, (480, 480))
+
+        response = self.app.post(self.getUrl('profile_avatar_crop'),
+            {'left': 0, 'top': 0, 'right': 240, 'bottom': 240})
+        self.assertResponseRedirect(response)
+        self.assertEqual(self.status()['status'], 'cropping')
+
+        self.assertEqual(process_avatars(), 1)
+        self.assertEqual(self.status()['status'], 'ready')
+        avatar = Avatar.objects.get(user=self.user)
+        self.assertTrue(avatar.valid)
+        self.assertEqual(Image.open(size_name(avatar.image.path, 96)).size,
+                         (96, 96))
+        for name in self.old.files():
+            self.assertFalse(avatar.image.storage.exists(name))
+
+    def testUploadDuringCrop(self):
+        avatar = pipeline.upload(self.user, SimpleUploadedFile('big.jpg',
+            self.jpeg(600), 'image/jpeg'))
+        process_avatars()
+        self.assertTrue(pipeline.crop(avatar, (0, 0, 240, 240)))
+
+        run = pipeline.run
+        def upload_again(task):
+            pipeline.upload(self.user, SimpleUploadedFile('again.jpg',
+                self.jpeg(300), 'image/jpeg'))
+            run(task)
+        pipeline.run = upload_again
+        try:
+            self.assertEqual(process_avatars(), 1)
+        finally:
+            pipeline.run = run
+        # The crop was discarded and the user keeps the old avatar
+        self.assertEqual(Avatar.objects.get(user=self.user, valid=True).pk,
+                         self.old.pk)
+        self.assertEqual(self.status()['status'], 'normalizing')
+        for name in self.old.files():
+            self.assertTrue(self.old.image.storage.exists(name))
+
+    def testCropSubmittedAgain(self):
+        avatar = pipeline.upload(self.user, SimpleUploadedFile('big.jpg',
+            self.jpeg(480), 'image/jpeg'))
+        process_avatars()
+        self.assertTrue(pipeline.crop(avatar, (0, 0, 300, 300)))
+
+        run = pipeline.run
+        def crop_again(task):
+            self.assertTrue(pipeline.crop(avatar, (100, 100, 400, 400)))
+            run(task)
+        pipeline.run = crop_again
+        try:
+            self.assertEqual(process_avatars(), 1)
+        finally:
+            pipeline.run = run
+        # The first crop was discarded and the second one starts again
+        # from the uploaded image
+        self.assertEqual(self.status()['status'], 'cropping')
+        self.assertEqual(process_avatars(), 1)
+        avatar = Avatar.objects.get(user=self.user, valid=True)
+        image = Image.open(avatar.image.path)
+        self.assertEqual(image.size, (300, 300))
+        self.assertNotEqual(image.getpixel((290, 290)), (0, 0, 0))
+        self.assertFalse(avatar.image.storage.exists(
+                         pipeline.NORMALIZED_NAME % avatar.pk))
+
+
+class TestImageOperations(TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.workdir, 'source.jpg')
+        Image.new('RGB', (1600, 1200), 'red').save(self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def testSinglePass(self):
+        image = TuxieMagick.Image(self.source)
+        self.assertEqual(str(image.size()), '1600x1200')
+        image.scale(800)
+        image.crop('400x300')
+        image.comment('e-cidadania')
+        # Nothing is done until the image is written
+        self.assertEqual(os.listdir(self.workdir), ['source.jpg'])
+
+        target = os.path.join(self.workdir, 'target.jpg')
+        self.assertTrue(image.write(target))
+        self.assertEqual(sorted(os.listdir(self.workdir)),
+                         ['source.jpg', 'target.jpg'])
+        result = Image.open(target)
+        self.assertEqual(result.size, (400, 300))
+        self.assertEqual(result.app['COM'], 'e-cidadania')
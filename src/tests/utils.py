@@ -15,7 +15,7 @@ class ECDTestCase(WebTest):
 	    Returns the URL for the url name.
 	    """
 	    from django.core.urlresolvers import reverse
-	    return reverse(url_name, args)
+	    return reverse(url_name, args=args)
 
     def get(self, url, params=None, headers=None, 
 	    extra_environ=None, status=None, expect_errors=False):